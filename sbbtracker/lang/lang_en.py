@@ -83,6 +83,7 @@ lang = {
     "Backup Stats": "",
     "Reimport Stats": "",
     "Reimporting is temporarily disabled": "",
+    "Import new record files automatically": "",
     "Upload matches to sbbtracker.com": "",
     "Match uploads include your steam name, sbb id, board comps, placement, and change in mmr.": "",
     "Enable overlay": "",
@@ -107,6 +108,10 @@ lang = {
     "Enable export last comp button": "",
     "Hide art and show template ids": "",
     "Enable ID window": "",
+    "Time the log parser": "",
+    "Log parser timings": "",
+    "Track games from record files (restart to take effect)": "",
+    "Show": "",
     "Reset": "",
     "Show capturable score window": "",
     "Number of scores per line": "",
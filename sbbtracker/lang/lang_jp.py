@@ -83,6 +83,7 @@ lang = {
     "Backup Stats": "統計データをバックアップ",
     "Reimport Stats": "統計データをインポート",
     "Reimporting is temporarily disabled": "「統計データをインポート」は一時的に無効にしています",
+    "Import new record files automatically": "新しいレコードファイルを自動でインポート",
     "Upload matches to sbbtracker.com": "ゲーム結果を sbbtracker.com にアップロード",
     "Match uploads include your steam name, sbb id, board comps, placement, and change in mmr.": "アップロード内容にはSteamネーム,SBBID,盤面情報,順位,増減MMRなどが含まれます。",
     "Enable overlay": "オーバーレイを有効化",
@@ -107,6 +108,10 @@ lang = {
     "Enable export last comp button": "最終盤面出力ボタンを有効化",
     "Hide art and show template ids": "テンプレートIDとアートを隠す",
     "Enable ID window": "IDウィンドウを有効化",
+    "Time the log parser": "ログ解析の処理時間を計測",
+    "Log parser timings": "ログ解析の処理時間",
+    "Track games from record files (restart to take effect)": "レコードファイルからゲームを追跡(再起動してください)",
+    "Show": "表示",
     "Reset": "リセット",
     "Show capturable score window": "順位結果ウィンドウを有効化",
     "Number of scores per line": "改行するまでの結果数",
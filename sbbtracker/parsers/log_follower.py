@@ -0,0 +1,295 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2 ** 16
+POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.25
+IDLE_TIMEOUT = 0.5
+
+# inotify(7) flags
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+
+def open_shared(filename):
+    """
+    Open the file for binary reading. On Windows the file is shared for deletion as well, so holding
+    it open doesn't stop the game from rotating its log when it restarts.
+    """
+    if os.name == "nt":
+        try:
+            import msvcrt
+            import pywintypes
+            import win32file
+        except ImportError:
+            return open(filename, "rb")
+        try:
+            handle = win32file.CreateFile(
+                str(filename), win32file.GENERIC_READ,
+                win32file.FILE_SHARE_READ | win32file.FILE_SHARE_WRITE | win32file.FILE_SHARE_DELETE,
+                None, win32file.OPEN_EXISTING, 0, None)
+        except pywintypes.error as e:
+            raise OSError(e.winerror, e.strerror, str(filename))
+        fd = msvcrt.open_osfhandle(handle.Detach(), os.O_RDONLY | os.O_BINARY)
+        return os.fdopen(fd, "rb")
+    return open(filename, "rb")
+
+
+class StatWatcher:
+    """
+    Wait for a file to change by polling its size, modification time and inode. A change is anything since the end of
+    the previous wait (or since the watcher was made), so a write that lands after a read hits the end of the file, but
+    before the next wait starts, still ends that wait straight away.
+
+    Polling starts every poll_interval and backs off, doubling while nothing changes, up to max_poll_interval, so an
+    idle log costs a few stats a second. A change goes back to the fast rate.
+    """
+    def __init__(self, filename, poll_interval=POLL_INTERVAL, max_poll_interval=MAX_POLL_INTERVAL):
+        self.filename = filename
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.interval = poll_interval
+        self.signature = self._signature()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.filename)
+            return st.st_ino, st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def watch(self, filename):
+        """ Watch another file from now on """
+        self.filename = filename
+        self.signature = self._signature()
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            signature = self._signature()
+            if signature != self.signature:
+                self.signature = signature
+                self.interval = self.poll_interval
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+            self.interval = min(self.interval * 2, self.max_poll_interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Wait for a file to change using inotify. The directory is watched rather than the file so that
+    the file being replaced or created is also noticed.
+    """
+    def __init__(self, filename):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.fsencode(str(Path(filename).parent))
+        if libc.inotify_add_watch(self.fd, directory, IN_MODIFY | IN_CREATE | IN_MOVED_TO | IN_DELETE) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def watch(self, filename):
+        """ Nothing to do for another file in the same directory, the directory is what's watched """
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(filename):
+    """ Use inotify where the platform has it, otherwise fall back to stat polling """
+    if hasattr(select, "select") and os.name == "posix" and ctypes.util.find_library("c"):
+        try:
+            return InotifyWatcher(filename)
+        except (OSError, AttributeError):
+            logger.info("inotify unavailable, falling back to polling")
+    return StatWatcher(filename)
+
+
+class LogFollower:
+    """
+    Follows a growing logfile. The file is kept open between reads and read in large chunks. The reader marks
+    checkpoints, places it is safe to pick up from, and the latest one is remembered in an offset file (in the same
+    "inode\\noffset" format pygtail used, followed by a line of JSON holding the reader's state there) so a restart
+    picks up where it left off. If the file is truncated or replaced, or the offset file is deleted, reading starts
+    over from the beginning of the file.
+    """
+    def __init__(self, filename, offset_file, chunk_size=CHUNK_SIZE):
+        self.filename = str(filename)
+        self.offset_file = offset_file
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.start = None
+        self.inode = None
+        self._fh = None
+        self._buffer = b""
+        self._read_pos = 0
+        self._checkpoint = None
+        self._resumed = False
+        self._saved, self._saved_state = self._load_offset()
+        self._offset_file_exists = os.path.exists(self.offset_file)
+        self._watcher = make_watcher(self.filename)
+
+    def _load_offset(self):
+        try:
+            with open(self.offset_file, "r") as offset_fh:
+                lines = [line.strip() for line in offset_fh if line.strip()]
+            inode, offset = int(lines[0]), int(lines[1])
+            state = json.loads(lines[2]) if len(lines) > 2 else None
+            return (inode, offset), state
+        except (OSError, ValueError, IndexError):
+            return None, None
+
+    def _save_offset(self):
+        if self._checkpoint is None:
+            return
+        inode, offset, state = self._checkpoint
+        if (inode, offset) != self._saved:
+            try:
+                with open(self.offset_file, "w") as offset_fh:
+                    offset_fh.write(f"{inode}\n{offset}\n")
+                    if state is not None:
+                        offset_fh.write(json.dumps(state) + "\n")
+                self._saved = (inode, offset)
+                self._saved_state = state
+                self._offset_file_exists = True
+            except (OSError, TypeError, ValueError):
+                logger.exception("Couldn't save the log offset")
+
+    def _open(self, st):
+        self.close()
+        self._fh = open_shared(self.filename)
+        self.inode = st.st_ino
+        self._buffer = b""
+        self._checkpoint = None
+        self.offset = 0
+        self._resumed = bool(self._saved and self._saved[0] == st.st_ino and self._saved[1] <= st.st_size)
+        if self._resumed:
+            self.offset = self._saved[1]
+        self._fh.seek(self.offset)
+        self._read_pos = self.offset
+
+    def _rewind(self):
+        self._buffer = b""
+        self._checkpoint = None
+        self._resumed = False
+        self.offset = 0
+        self._read_pos = 0
+        self._fh.seek(0)
+
+    def _check_file(self):
+        """ Make sure we're reading the right file from a sensible position, returns False if there's no file """
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            self.close()
+            return False
+
+        offset_file_exists = os.path.exists(self.offset_file)
+        offset_file_deleted = self._offset_file_exists and not offset_file_exists
+        self._offset_file_exists = offset_file_exists
+        if offset_file_deleted:
+            self._saved = self._saved_state = None
+
+        if self._fh is None or st.st_ino != self.inode:
+            # first read, or the game replaced the log
+            try:
+                self._open(st)
+            except OSError:
+                logger.exception("Couldn't open the log")
+                self.close()
+                return False
+        elif st.st_size < self._read_pos:
+            # the log was truncated
+            self._rewind()
+        elif offset_file_deleted:
+            # the offset file was deleted (reattach), read the whole file again
+            self._rewind()
+        return True
+
+    def resume(self):
+        """
+        Open the log, returning the state saved with the last checkpoint if reading picks up from there, None if it
+        starts over
+        """
+        if self._check_file() and self._resumed:
+            return self._saved_state
+        return None
+
+    def checkpoint(self, state=None):
+        """
+        Mark the offset just past the most recently yielded line as a place to pick up from after a restart. state is
+        saved along with it and must be JSON serializable
+        """
+        self._checkpoint = (self.inode, self.offset, state)
+
+    def lines(self):
+        """
+        Yield the complete lines appended to the file since the last call. self.start is the offset the read started
+        from, and self.offset is the offset just past the most recently yielded line.
+        """
+        if not self._check_file():
+            return
+        self.start = self.offset
+        finished = False
+        try:
+            while True:
+                chunk = self._fh.read(self.chunk_size)
+                if not chunk:
+                    break
+                self._read_pos += len(chunk)
+                pieces = (self._buffer + chunk).split(b"\n")
+                self._buffer = pieces.pop()
+                for piece in pieces:
+                    self.offset += len(piece) + 1
+                    if piece.endswith(b"\r"):
+                        piece = piece[:-1]
+                    yield piece.decode("utf-8", errors="replace") + "\n"
+            finished = True
+        finally:
+            if not finished and self._fh is not None:
+                # stopped early, make sure the lines we didn't hand out are read again next time
+                self._buffer = b""
+                self._read_pos = self.offset
+                self._fh.seek(self.offset)
+            self._save_offset()
+
+    def wait(self, timeout=IDLE_TIMEOUT):
+        """ Block until the log changes or the timeout passes """
+        return self._watcher.wait(timeout)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
@@ -1,15 +1,13 @@
 import sys
-import gzip
-import json
-import os
 import re
 import time
-from collections import defaultdict
-from enum import Enum
-from os.path import exists
+from dataclasses import dataclass
+from typing import List, Optional, Union
 from queue import Queue
 
-from pygtail import Pygtail
+from sbbtracker.parsers import tracing
+from sbbtracker.parsers.log_follower import LogFollower
+from sbbtracker.parsers.tracing import tracer
 from sbbtracker.paths import logfile, offsetfile
 
 import logging
@@ -74,156 +72,293 @@ JOB_HEALTHUPDATE = "HealthUpdate"
 JOB_MATCHMAKING = "StateMatchmaking"
 JOB_CARDUPDATE = "CardUpdate"
 JOB_HERODISCOVER = "HeroDiscover"
+JOB_CATCHUP = "CatchUp"
+JOB_TRACE = "Trace"
+
+
+#  The typed records the tokenizer produces, one per kind of task. Slotted so that the hundreds of card records
+#  in a brawl stay small and cheap to copy.
+
+@dataclass
+class EventRecord:
+    """ An event that only matters because it happened """
+    __slots__ = ('task', 'action_type')
+    task: Optional[str]
+    action_type: Optional[str]
+
+
+@dataclass
+class MatchmakingRecord:
+    __slots__ = ('task', 'game_mode')
+    task: str
+    game_mode: Optional[str]
+
+
+@dataclass
+class ConnectionRecord:
+    __slots__ = ('task', 'action_type', 'session_id', 'build_id')
+    task: str
+    action_type: str
+    session_id: str
+    build_id: str
+
+
+@dataclass
+class PlayerRecord:
+    __slots__ = ('task', 'action_type', 'playerid', 'displayname', 'heroid', 'health', 'place', 'experience', 'level',
+                 'current_player', 'mmr')
+    task: str
+    action_type: str
+    playerid: str
+    displayname: str
+    heroid: str
+    health: int
+    place: str
+    experience: str
+    level: str
+    current_player: bool
+    mmr: Optional[str]  # only set at the end of the game
+
+
+@dataclass
+class BrawlRecord:
+    __slots__ = ('task', 'action_type', 'player1', 'player2')
+    task: str
+    action_type: str
+    player1: str
+    player2: str
+
+
+@dataclass
+class RoundRecord:
+    __slots__ = ('task', 'action_type', 'round_num')
+    task: str
+    action_type: str
+    round_num: int
+
+
+@dataclass
+class CardRecord:
+    __slots__ = ('task', 'action_type', 'playerid', 'content_id', 'zone', 'slot', 'cardattack', 'cardhealth',
+                 'is_golden', 'cost', 'subtypes', 'counter', 'level')
+    task: str
+    action_type: str
+    playerid: str
+    content_id: str
+    zone: str
+    slot: str
+    cardattack: Optional[int]
+    cardhealth: Optional[int]
+    is_golden: bool
+    cost: Optional[str]
+    subtypes: Optional[List[str]]
+    counter: Union[str, int]
+    level: Optional[str]  # the GUI fills this in for the hero
+
+
+BOARD_CHARACTERS = 7
+BOARD_TREASURES = 3
+
+
+class PlayerBoard:
+    """
+    A player's board as seen in a brawl, with a place for each card keyed by zone and slot. Iterating over it gives
+    the cards in board order: characters, treasures, spell, hero, then anything in another zone.
+    """
+    __slots__ = ('characters', 'treasures', 'spell', 'hero', 'others')
+
+    def __init__(self):
+        self.characters = [None] * BOARD_CHARACTERS
+        self.treasures = [None] * BOARD_TREASURES
+        self.spell = None
+        self.hero = None
+        self.others = {}
+
+    def add(self, card: CardRecord):
+        """ Add a card from CreateCard, the first card seen in a character slot is the one kept """
+        self._place(card, replace=False)
+
+    def update(self, card: CardRecord):
+        """ Apply an UpdateCard, replacing whatever was in the card's slot """
+        self._place(card, replace=True)
+
+    def _place(self, card, replace):
+        zone = card.zone
+        slots = self.characters if zone == 'Char' else self.treasures if zone == 'Treasure' else None
+        if slots is not None and card.slot.isdigit() and int(card.slot) < len(slots):
+            slot = int(card.slot)
+            if replace or zone == 'Treasure' or slots[slot] is None:
+                slots[slot] = card
+        elif zone == 'Spell':
+            self.spell = card
+        elif zone == 'Hero':
+            self.hero = card
+        else:
+            self.others[(zone, card.slot)] = card
+
+    def __iter__(self):
+        for card in self.characters:
+            if card is not None:
+                yield card
+        for card in self.treasures:
+            if card is not None:
+                yield card
+        if self.spell is not None:
+            yield self.spell
+        if self.hero is not None:
+            yield self.hero
+        yield from self.others.values()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+@dataclass
+class HeroDiscoverRecord:
+    __slots__ = ('task', 'action_type', 'choices')
+    task: str
+    action_type: str
+    choices: List[str]
 
 
-def process_line_wrapper(line, ifs):
+SHORTNAME_LENGTH = 10
+CURRENT_PLAYER_MARKER = '<U>'
+FULLNAME_DELIMITER = "'=="
+BRAWL_ARROW = '--> '
+
+hero_choice_regex = re.compile(r'^.+<.+>$')
+
+
+def process_line_wrapper(line, pos=0):
     try:
-        return process_line(line, ifs)
+        return process_line(line, pos)
     except:
         logger.error(f'ERROR processing line: {line}')
         raise
 
 
-def readuntil(string, substr, clean=True):
-    """Find substr, chop off all before and including, and return everything afterwards"""
-    find = string.find(substr)
-    if find == -1:
-        return string, ''
-
-    cut = find + len(substr)
-    car, cdr = string[:cut], string[cut:]
-    if clean:
-        car = car[:-1 * len(substr)]
-    return car, cdr
+def read_token(line, pos):
+    """ Read up to the next space, returning the token and the offset just past the space """
+    end = line.find(' ', pos)
+    if end == -1:
+        return line[pos:], len(line)
+    return line[pos:end], end + 1
 
 
-def get_shortname(string):
+def read_shortname(line, pos):
     """ The logfile uses a truncated name system """
-    shortname = string[:10]
-    currentplayer = string[10:13] == '<U>'
-    cdr = string[13:]
-    logger.info(f'From line ||{string[:-1]}|| extracted shortname {shortname} currentplayer {currentplayer}')
-    return shortname, currentplayer, cdr
+    end = pos + SHORTNAME_LENGTH
+    return line[pos:end], line.startswith(CURRENT_PLAYER_MARKER, end), end + len(CURRENT_PLAYER_MARKER)
 
 
-def process_fullname(string):
+def read_fullname(line, pos):
     """ Process data of the format =='fullname'==0123456789012345 ' """
     # TODO what happens if a user has an apostrophe in their name
-    displayname = ''
-    _line = string[3:]
-    annoyingstr = '\'=='
+    pos += 3
+    end = line.find(FULLNAME_DELIMITER, pos)
+    if end == -1:
+        return line[pos:], '', len(line)
+
+    parts = []
     while True:
-        _displayname, _line = readuntil(_line, annoyingstr)
-        displayname += _displayname
-        linefind = _line.find(annoyingstr)
-        if annoyingstr in _line and linefind < _line.find('Health:') and linefind < _line.find(
-                'Gold:') and linefind < _line.find('NextLevelXP'):
-            displayname += annoyingstr
+        parts.append(line[pos:end])
+        pos = end + len(FULLNAME_DELIMITER)
+        end = line.find(FULLNAME_DELIMITER, pos)
+        if end != -1 and end < line.find('Health:', pos) and end < line.find('Gold:', pos) and \
+                end < line.find('NextLevelXP', pos):
+            # the delimiter is part of the display name
+            parts.append(FULLNAME_DELIMITER)
         else:
-            glg_id, _line = readuntil(_line, ' ')
             break
 
-    logger.info(f'From line ||{string.strip()}|| extracted displayname {displayname} glg_id {glg_id}')
-    return displayname, glg_id, _line
-
-
-def process_line(line, ifs):
-    dt = {}
+    glg_id, pos = read_token(line, pos)
+    return ''.join(parts), glg_id, pos
 
-    event, _line = readuntil(line, ' ')
-    event = event.strip('[]')
-    dt['event'] = event
-    if event == EVENT_CONNINFO:
-        line_data = line.split(' ')
-        session_id = line_data[1].split(':')[1]
-        build_id = line_data[2].split(':')[1]
-        return {**dt, **{'build_id': build_id, 'session_id': session_id}}
-    elif event in [EVENT_ADDPLAYER, EVENT_ENTERRESULTSPHASE]:
-        playerid, current_player, _line = get_shortname(_line)
-        displayname, glg_id, _line = process_fullname(_line)
-        heroid = None
-        while True:
-            data, _line = readuntil(_line, ' ')
-            if not data:
-                break
-            if heroid is None and '<' in data and '>' in data:
-                heroid = data.split('<')[0]
-            if not ':' in data:
-                continue
-
-            k, v = data.split(':')
-            v = v.strip()
-            if k == 'Health':
-                health = v
-            elif k == 'XP':
-                experience = v
-            elif k == 'Place':
-                place = v
-            elif k == 'Level':
-                level = v
-            elif k == 'Rank':  # This will only happen with ENTERRESULTSPHASE
-                mmr = v
-
-        dt = {**dt,
-              **{'displayname': displayname, 'displayname': displayname, 'playerid': playerid, 'experience': experience,
-                 'health': health,
-                 'place': place, 'level': level, 'heroid': heroid, 'current_player': current_player, 'glg_id': glg_id}}
-        if event == EVENT_ENTERRESULTSPHASE:
-            dt = {**dt, **{'mmr': mmr}}
-
-        return dt
-    elif event == EVENT_ENTERBRAWLPHASE:
-        player1id, _, _line = get_shortname(_line)
-        _, _, _line = process_fullname(_line)
-        junk, _line = readuntil(_line, '--> ')
-        player2id, _, _line = get_shortname(_line)
-        dt = {**dt, **{'player1id': player1id, 'player2id': player2id}}
-        return dt
-    elif event == EVENT_ENTERSHOPPHASE:
-        _, _, _line = get_shortname(_line)
-        _, _, _line = process_fullname(_line)
-        _, _line = readuntil(_line, '--> ')
-        _, _, _line = get_shortname(_line)
-        while True:
-            _line = _line.lstrip(' ')
-            data, _line = readuntil(_line, ' ')
-            if not data:
-                break
-            if not ':' in data:
-                continue
-
-            k, v = data.split(':')
-            v = v.strip()
-            if k == 'Round':
-                r = v
-                break  # this is the only thing we care about
-
-        return {**dt, 'round': r}
-
-    elif event in [EVENT_CREATECARD, EVENT_UPDATECARD]:
 
-        is_golden = False
-        counter = -1
-        cardattack = None
-        cardhealth = None
-        subtypes = None
+def skip_to_opponent(line, pos):
+    """ Skip the first player of a phase line, returning the offset of the opponent's shortname """
+    _, _, pos = read_shortname(line, pos)
+    _, _, pos = read_fullname(line, pos)
+    arrow = line.find(BRAWL_ARROW, pos)
+    return len(line) if arrow == -1 else arrow + len(BRAWL_ARROW)
 
-        content_data, _line = readuntil(_line, ' ')
-        content_id = content_data.split('<')[0]
 
-        playerid, currentplayer, _line = get_shortname(_line)
+def parse_connection_info(task, event, line, pos):
+    line_data = line[pos:].split(' ', 2)
+    return ConnectionRecord(task, event, line_data[0].split(':')[1], line_data[1].split(':')[1])
 
-        _line = _line[1:]  # remove the leading :
-        zoneinfo, _line = readuntil(_line, ' ', clean=False)
-        zone, slotinfo = zoneinfo.split('[')
-        slot = slotinfo[:-2]
 
-        while True:
-            _line = _line.lstrip(' ')
-            data, _line = readuntil(_line, ' ')
-            if not data:
-                break
-            if '/' in data and not ':' in data:
+def parse_player(task, event, line, pos):
+    playerid, current_player, pos = read_shortname(line, pos)
+    displayname, _, pos = read_fullname(line, pos)
+    heroid = health = experience = place = level = mmr = None
+    for data in line[pos:].split(' '):
+        if not data:
+            break
+        if heroid is None and '<' in data and '>' in data:
+            heroid = data[:data.find('<')]
+        if ':' not in data:
+            continue
+
+        k, v = data.split(':')
+        if k == 'Health':
+            health = v.strip()
+        elif k == 'XP':
+            experience = v.strip()
+        elif k == 'Place':
+            place = v.strip()
+        elif k == 'Level':
+            level = v.strip()
+        elif k == 'Rank':  # This will only happen with ENTERRESULTSPHASE
+            mmr = v.strip()
+
+    return PlayerRecord(task, event, playerid, displayname.strip(), heroid, int(health), place, experience, level,
+                        current_player, mmr)
+
+
+def parse_brawl_phase(task, event, line, pos):
+    player1id, _, _ = read_shortname(line, pos)
+    player2id, _, _ = read_shortname(line, skip_to_opponent(line, pos))
+    return BrawlRecord(task, event, player1id, player2id)
+
+
+def parse_shop_phase(task, event, line, pos):
+    _, _, pos = read_shortname(line, skip_to_opponent(line, pos))
+    r = None
+    for data in line[pos:].split(' '):
+        if ':' not in data:
+            continue
+
+        k, v = data.split(':')
+        if k == 'Round':
+            r = v.strip()
+            break  # this is the only thing we care about
+
+    return RoundRecord(task, event, int(r))
+
+
+def parse_card(task, event, line, pos):
+    is_golden = False
+    counter = -1
+    cardattack = None
+    cardhealth = None
+    subtypes = None
+    cost = None
+
+    content_data, pos = read_token(line, pos)
+    content_id = content_data.split('<')[0]
+
+    playerid, _, pos = read_shortname(line, pos)
+
+    pos += 1  # skip the leading :
+    end = line.find(' ', pos)
+    end = len(line) if end == -1 else end + 1
+    zone, slotinfo = line[pos:end].split('[')
+    slot = slotinfo[:-2]
+
+    for data in line[end:].split(' '):
+        if ':' not in data:
+            if '/' in data:
                 try:
                     _cardattack, _cardhealth = map(str.strip, data.split('/'))
                     _cardattack = int(_cardattack)
@@ -232,164 +367,167 @@ def process_line(line, ifs):
                     cardhealth = _cardhealth
                 except ValueError:
                     pass
-            if not ':' in data:
-                continue
+            continue
+
+        k, v = data.split(':')
+        if k == 'Subtypes':
+            subtypes = list(map(str.lower, v.strip().split(',')))
+        elif k == 'Cost':
+            cost = v.strip()
+        elif k == 'Flags':
+            is_golden = 'G' in v
+        elif k == 'Counter':
+            counter = v.strip()
+
+    return CardRecord(task, event, playerid, content_id, zone, slot, cardattack, cardhealth, is_golden, cost,
+                      subtypes, counter, None)
+
+
+def parse_hero_discover(task, event, line, pos):
+    choices = []
+    for datum in line[pos:].replace(', ', '  ').split(' '):
+        if hero_choice_regex.match(datum):
+            choices.append(datum.split('<')[0])
+
+    return HeroDiscoverRecord(task, event, choices)
 
-            k, v = data.split(':')
-            v = v.strip()
-            if k == 'Subtypes':
-                subtypes = list(map(str.lower, v.split(',')))
-            elif k == 'Cost':
-                cost = v
-            elif k == 'Flags':
-                is_golden = 'G' in v
-            elif k == 'Counter':
-                counter = v
 
-        dt = {**dt, **{'is_golden': is_golden, 'counter': counter, 'content_id': content_id, 'playerid': playerid,
-                       'zone': zone, 'slot': slot, 'cardattack': cardattack, 'cardhealth': cardhealth,
-                       'subtypes': subtypes, 'cost': cost}}
-        return dt
+class Subscription:
+    """
+    The set of events a consumer wants parsed. Event lines outside of the subscription are rejected by
+    a prefix check before any tokenizing. With boundaries set, each rejected event still yields the shared
+    BOUNDARY record, for consumers that need to know *something* happened (like the end of a brawl).
+    """
+    def __init__(self, events, boundaries=False):
+        self.events = frozenset(events)
+        self.boundaries = boundaries
+        self.prefixes = tuple(f'[{event}] ' for event in sorted(self.events))
+
+    def __contains__(self, event):
+        return event in self.events
+
+    def accepts(self, line, pos):
+        return line.startswith(self.prefixes, pos)
 
-    elif event == EVENT_PRESENTHERODISCOVER:
-        line_data = line.replace(', ', '  ').split(' ')
-        choices = []
-        for datum in line_data:
-            if re.match('^.+<.+>$', datum):
-                choices.append(datum.split('<')[0])
 
-        dt = {**dt, **{ 'choices': choices }}
+class EventRegistry:
+    """
+    Maps each EVENT_* name to its task and the function that tokenizes its line into a record. Events without
+    a line parser all share a single EventRecord.
+    """
+    def __init__(self):
+        self.parsers = {}
+        self.tasks = {}
+        self.markers = {}
+
+    def register(self, event, task=None, line_parser=None):
+        self.tasks[event] = task
+        if line_parser is not None:
+            self.parsers[event] = line_parser
+        else:
+            self.markers[event] = EventRecord(task, event)
+
+    def subscribe(self, *event_sets, boundaries=False):
+        """ Combine the events wanted by each consumer into a single subscription """
+        events = set().union(*event_sets)
+        unknown = events - self.tasks.keys()
+        if unknown:
+            raise ValueError(f'Unknown events {unknown}')
+        return Subscription(events, boundaries)
+
+
+registry = EventRegistry()
+registry.register(EVENT_CONNINFO, TASK_NEWGAME, parse_connection_info)
+registry.register(EVENT_ADDPLAYER, TASK_ADDPLAYER, parse_player)
+registry.register(EVENT_ENTERRESULTSPHASE, TASK_ENDGAME, parse_player)
+registry.register(EVENT_ENTERBRAWLPHASE, TASK_GATHERIDS, parse_brawl_phase)
+registry.register(EVENT_ENTERSHOPPHASE, TASK_GETROUND, parse_shop_phase)
+registry.register(EVENT_CREATECARD, TASK_GETROUNDGATHER, parse_card)
+registry.register(EVENT_UPDATECARD, TASK_UPDATECARD, parse_card)
+registry.register(EVENT_PRESENTHERODISCOVER, TASK_HERODISCOVER, parse_hero_discover)
+registry.register(EVENT_UPDATETURNTIMER, TASK_ENDCOMBAT)
+registry.register(EVENT_MODIFYGOLD, TASK_ENDPLAYERUPDATES)
+for _event in [EVENT_BRAWLCOMPLETE, EVENT_SUMMONCHARACTER, EVENT_ATTACK, EVENT_DEALDAMAGE]:
+    registry.register(_event, TASK_ENDROUNDGATHER)
+for _event in [EVENT_CASTSPELL, EVENT_DEATH, EVENT_DEATHTRIGGER, EVENT_ENTERINTROPHASE, EVENT_MODIFYLEVEL,
+               EVENT_MODIFYNEXTLEVELXP, EVENT_MODIFYXP, EVENT_MOVECARD, EVENT_PLAYFX, EVENT_PRESENTDISCOVER,
+               EVENT_REMOVECARD, EVENT_ROLL, EVENT_SLAYTRIGGER, EVENT_UPDATEEMOTES]:
+    registry.register(_event)
+
+#  The events the run state machine needs to follow a game. UpdateCard is among them because cards are updated in the
+#  middle of a brawl, and the boards must not depend on whether a consumer subscribed to it
+STATE_MACHINE_EVENTS = frozenset([EVENT_CONNINFO, EVENT_ADDPLAYER, EVENT_ENTERRESULTSPHASE, EVENT_ENTERBRAWLPHASE,
+                                  EVENT_ENTERSHOPPHASE, EVENT_CREATECARD, EVENT_UPDATECARD, EVENT_UPDATETURNTIMER,
+                                  EVENT_MODIFYGOLD])
+
+
+def process_line(line, pos=0):
+    """
+    Tokenize a single event line in one pass. Each field is read by offset into the line
+    rather than by repeatedly chopping copies off of it.
 
-    return dt
+    Parameters
+    ----------
+    line : str
+        The log line
+    pos : int
+        The offset of the event name (e.g. [ActionAddPlayer]) in the line
+
+    Returns
+    -------
+    record :
+        The typed record for the event
+    """
+    event, rest = read_token(line, pos)
+    event = event.strip('[]')
+    line_parser = registry.parsers.get(event)
+    if line_parser is not None:
+        return line_parser(registry.tasks[event], event, line, rest)
+    marker = registry.markers.get(event)
+    return marker if marker is not None else EventRecord(None, event)
 
 
-def parse(ifs):
+def parse(ifs, subscription=None):
     """
-    Parse the log file into workable dictionaries. A nice function to
+    Parse the log file into typed records. A nice function to
     separate the business logic from the parsing logic
 
     Parameters
     ----------
     ifs : Input file stream
         The tail of the logfile being read in
+    subscription : Subscription
+        The events to parse, everything if None
 
     Yields
     ------
-    info : Dictionary
-        A log line, dynamically transformed into a dict object for
-        further processing
+    record :
+        A log line, transformed into a typed record for further processing
 
     """
     for line in ifs:
         if 'REQUEST MATCHMAKER FOR' in line:
             game_mode = "SBB99" if "100P" in line else "Normal"
-            yield Action(info=game_mode, game_state=GameState.MATCHMAKING)
+            yield MatchmakingRecord(TASK_MATCHMAKING, game_mode)
         elif line.startswith('[RECV]'):
-            _, line = readuntil(line, ' ')
-            _, line = readuntil(line, ' ')
-            info = process_line_wrapper(line, ifs)
-            if info:
-                yield Action(info)
-
-
-class GameState(Enum):
-    START = 1
-    END = 2
-    REAL_SHOP_PHASE = 3
-    MATCHMAKING = 4
-    UNKNOWN = 5
-
-
-class Action:
-    def __init__(self, info, game_state=GameState.UNKNOWN):
-        if game_state == GameState.MATCHMAKING:
-            self.task = TASK_MATCHMAKING
-            self.game_mode = info
-            self.attrs = ['task', 'game_mode']
-            return
-
-        if info is not None:
-
-            self.action_type = info['event']
-            if self.action_type == EVENT_ADDPLAYER or self.action_type == EVENT_ENTERRESULTSPHASE:
-                self.task = TASK_ADDPLAYER
-                self.displayname = info['displayname'].strip()
-                self.heroid = info['heroid']
-                self.health = int(info['health'])
-                self.playerid = info.get("playerid", "")
-                self.place = info['place']
-                self.experience = info['experience']
-                self.level = info['level']
-                self.current_player = info["current_player"]
-                self.attrs = ['displayname', 'playerid', 'health', 'heroid', 'place', 'level', 'experience']
-
-                if self.action_type == EVENT_ENTERRESULTSPHASE:
-                    self.task = TASK_ENDGAME
-                    self.mmr = info['mmr']
-                    self.attrs.append('mmr')
-
-            elif self.action_type == EVENT_PRESENTHERODISCOVER:
-                # TODO broken on glg side
-                self.attrs = []
-                self.task = TASK_HERODISCOVER
-                self.choices = info['choices']
-                self.attrs = ['choices']
-
-            elif self.action_type == EVENT_ENTERBRAWLPHASE:
-                self.task = TASK_GATHERIDS
-                self.player1 = info['player1id']
-                self.player2 = info['player2id']
-                self.attrs = ['player1', 'player2']
-
-            elif self.action_type in [EVENT_CREATECARD, EVENT_UPDATECARD]:
-                self.task = TASK_GETROUNDGATHER if self.action_type == EVENT_CREATECARD else TASK_UPDATECARD
-                cardinfo = info
-
-                self.playerid = cardinfo['playerid']
-                self.cardattack = cardinfo['cardattack']
-                self.cardhealth = cardinfo['cardhealth']
-                self.is_golden = cardinfo['is_golden']
-                self.slot = cardinfo['slot']
-                self.zone = cardinfo['zone']
-                self.cost = cardinfo['cost']
-                self.subtypes = cardinfo['subtypes']
-                self.counter = cardinfo['counter']
-
-                self.content_id = info['content_id']
-                self.attrs = ['cardattack', 'cardhealth', 'is_golden', 'slot', 'zone', 'cost', 'subtypes', 'counter',
-                              'content_id']
-
-            elif self.action_type in [EVENT_BRAWLCOMPLETE, EVENT_SUMMONCHARACTER, EVENT_ATTACK, EVENT_DEALDAMAGE]:
-                self.task = TASK_ENDROUNDGATHER
-                self.attrs = []
-
-            elif self.action_type == EVENT_ENTERSHOPPHASE:
-                self.task = TASK_GETROUND
-                self.round_num = int(info['round'])
-                self.attrs = ['round_num']
-
-            elif self.action_type == EVENT_UPDATETURNTIMER:
-                self.task = TASK_ENDCOMBAT
-                self.attrs = []
-
-            elif self.action_type == EVENT_CONNINFO:
-                self.task = TASK_NEWGAME
-                self.session_id = info['session_id']
-                self.build_id = info['build_id']
-                self.attrs = ['session_id', 'build_id']
-
-            elif self.action_type == EVENT_MODIFYGOLD:
-                self.task = TASK_ENDPLAYERUPDATES
-                self.attrs = []
+            #  skip the [RECV] tag and the timestamp
+            pos = line.find(' ')
+            pos = line.find(' ', pos + 1) if pos != -1 else -1
+            pos = len(line) if pos == -1 else pos + 1
+            if subscription is not None and not subscription.accepts(line, pos):
+                if subscription.boundaries:
+                    yield BOUNDARY
+                continue
+            yield process_line_wrapper(line, pos)
 
-            else:
-                self.task = None
-                self.attrs = []
 
-            self.attrs.append("action_type")
+#  Stands in for any event outside of a subscription
+BOUNDARY = EventRecord(None, None)
 
-    def __repr__(self):
-        return json.dumps({k: getattr(self, k) for k in ['task', *self.attrs]}, sort_keys=True, indent=4)
+#  Events after which a game is over, so it is safe to pick up from there after a restart. Picking up in the middle
+#  of a game would lose what the GUI knows about it (the session, the players, the combats), so a restart re-reads
+#  the current game from its start
+CHECKPOINT_EVENTS = frozenset([EVENT_ENTERRESULTSPHASE])
 
 
 class Update:
@@ -398,90 +536,165 @@ class Update:
         self.state = state
 
 
-class SBBPygtail(Pygtail):
-    def _check_rotated_filename_candidates(self):
-        return self.filename
-
-    def _filehandle(self):
+class LogStateMachine:
+    """
+    Follows a game through the stream of records, turning them into updates for the GUI
+    """
+    def __init__(self):
+        self.inbrawl = False
+        self.current_round = None
+        self.lastupdated = dict()
+        self.updating_players = True
+        self.brawldt = None
+
+    def feed(self, actions, checkpoint=None):
         """
-        Return a filehandle to the file being tailed, with the position set
-        to the current offset.
+        Process the records, returning the updates they caused. checkpoint is called with the state of the
+        state machine after each of the CHECKPOINT_EVENTS
         """
-        if not self._fh or self._is_closed():
-            filename = self._rotated_logfile or self.filename
-            if filename.endswith('.gz'):
-                self._fh = gzip.open(filename, 'r', encoding="utf-8")
-            else:
-                self._fh = open(filename, "r", 1, encoding="utf-8")
-            if self.read_from_end and not exists(self._offset_file):
-                self._fh.seek(0, os.SEEK_END)
-            else:
-                self._fh.seek(self._offset)
+        updates = []
+        for action in actions:
+            self.process(action, updates)
+            if checkpoint is not None and getattr(action, "action_type", None) in CHECKPOINT_EVENTS:
+                checkpoint(self.save_state())
+        return updates
+
+    def save_state(self):
+        """ The state to carry over a restart, only valid between games """
+        return {"current_round": self.current_round, "lastupdated": self.lastupdated,
+                "updating_players": self.updating_players}
+
+    def load_state(self, state):
+        self.current_round = state.get("current_round")
+        self.lastupdated = dict(state.get("lastupdated", {}))
+        self.updating_players = state.get("updating_players", True)
+
+    def process(self, action, updates):
+        if action.task == TASK_NEWGAME:
+            self.inbrawl = False
+            self.current_round = None
+            self.lastupdated = dict()
+            updates.append(Update(JOB_NEWGAME, action))
+        elif action.task == TASK_ENDGAME:
+            updates.append(Update(JOB_ENDGAME, action))
+        else:
+            if action.task == TASK_HERODISCOVER:
+                updates.append(Update(JOB_HERODISCOVER, action))
+            elif action.task == TASK_ENDPLAYERUPDATES:
+                self.updating_players = False
+            elif action.task == TASK_ADDPLAYER and not self.updating_players:
+                updates.append(Update(JOB_HEALTHUPDATE, action))
+            elif not self.inbrawl and action.task == TASK_ADDPLAYER and self.updating_players:
+                updates.append(Update(JOB_PLAYERINFO, action))
+            elif not self.inbrawl and action.task == TASK_GATHERIDS:
+                self.inbrawl = True
+                self.brawldt = dict()
+                self.brawldt[action.player1] = PlayerBoard()
+                self.brawldt[action.player2] = PlayerBoard()
+                self.lastupdated[action.player1] = self.current_round
+                self.lastupdated[action.player2] = self.current_round
+            elif self.inbrawl and action.task == TASK_GETROUNDGATHER:
+                playerid = action.playerid
+                try:
+                    self.brawldt[playerid].add(action)
+                except KeyError:
+                    print(self.brawldt.keys(), playerid, action)
+            elif self.inbrawl and action.task == TASK_UPDATECARD and action.playerid in self.brawldt:
+                self.brawldt[action.playerid].update(action)
+            elif self.inbrawl and action.task != TASK_GETROUNDGATHER:
+                updates.append(Update(JOB_BOARDINFO, self.brawldt))
+                self.inbrawl = False
+            elif action.task == TASK_GETROUND:
+                updates.append(Update(JOB_ROUNDINFO, action))
+            elif action.task == TASK_ENDCOMBAT:
+                updates.append(Update(JOB_ENDCOMBAT, action))
+                self.updating_players = True
+            elif action.task == TASK_MATCHMAKING:
+                updates.append(Update(JOB_MATCHMAKING, action))
+            elif not self.inbrawl and action.task == TASK_UPDATECARD:
+                updates.append(Update(JOB_CARDUPDATE, action))
+
+
+#  Jobs whose updates replace an earlier update for the same key, and how to key them
+coalesced_jobs = {
+    JOB_PLAYERINFO: lambda state: state.playerid,
+    JOB_HEALTHUPDATE: lambda state: state.playerid,
+    JOB_CARDUPDATE: lambda state: (state.playerid, state.zone, state.slot),
+}
+
+
+def coalesce(updates):
+    """
+    Merge each run of consecutive updates for one of the coalesced jobs into a single update, whose state is the list
+    of the latest state for each key (e.g. the latest health of each player). Other updates are passed through as is,
+    so the batch keeps its order.
+    """
+    batch = []
+    merged = None
+    for update in updates:
+        key_func = coalesced_jobs.get(update.job)
+        if key_func is None:
+            merged = None
+            batch.append(update)
+            continue
+        if merged is None or batch[-1].job != update.job:
+            merged = dict()
+            batch.append(Update(update.job, merged))
+        key = key_func(update.state)
+        merged.pop(key, None)
+        merged[key] = update.state
+    for update in batch:
+        if update.job in coalesced_jobs:
+            update.state = list(update.state.values())
+    return batch
+
+
+def run(queue: Queue, log=logfile, events=()):
+    """
+    Follow the log and put the updates for the GUI on the queue, one coalesced batch (a list of updates) per read.
+    events are the events that consumers of the queue want parsed on top of the ones the state machine needs.
 
-        return self._fh
+    When the log is read from the top (the first start, or after a reattach) the backlog is sent as a single
+    JOB_CATCHUP update holding all of its updates, so the GUI can catch up without redrawing every past game.
 
+    The offset is only saved at CHECKPOINT_EVENTS, together with the state of the state machine, so a restart picks up
+    at the end of the last finished game. The first read after a restart re-reads the game in progress and is sent as
+    a JOB_CATCHUP too.
 
-def run(queue: Queue, log=logfile):
-    inbrawl = False
-    current_round = None
-    lastupdated = dict()
-    prev_action = None
-    updating_players = True
+    When tracing is on, sampled reads are timed stage by stage and their batch starts with a JOB_TRACE update holding
+    the time it was put on the queue.
+    """
+    subscription = registry.subscribe(STATE_MACHINE_EVENTS, events, boundaries=True)
+    machine = LogStateMachine()
+    follower = LogFollower(log, offsetfile)
+    state = follower.resume()
+    if state is not None:
+        machine.load_state(state)
+    first_read = True
     while True:
-        ifs = SBBPygtail(filename=str(log), offset_file=offsetfile, every_n=100, full_lines=True)
-        for action in parse(ifs):
-            if action.task == TASK_NEWGAME:
-                inbrawl = False
-                current_round = None
-                lastupdated = dict()
-                queue.put(Update(JOB_NEWGAME, action))
-            elif action.task == TASK_ENDGAME:
-                queue.put(Update(JOB_ENDGAME, action))
+        traced = tracer.sample()
+        if traced:
+            lines = tracing.TimedIterator(follower.lines())
+            records = tracing.TimedIterator(parse(lines, subscription))
+            start = time.perf_counter()
+            updates = machine.feed(records, follower.checkpoint)
+            elapsed = time.perf_counter() - start
+            if lines.items:
+                tracer.record(tracing.STAGE_READ, lines.elapsed)
+                tracer.record(tracing.STAGE_TOKENIZE, records.elapsed - lines.elapsed)
+                tracer.record(tracing.STAGE_STATE_MACHINE, elapsed - records.elapsed)
+        else:
+            updates = machine.feed(parse(follower.lines(), subscription), follower.checkpoint)
+        if updates:
+            if first_read or follower.start == 0:
+                batch = [Update(JOB_CATCHUP, coalesce(updates))]
             else:
-                if action.task == TASK_HERODISCOVER:
-                    queue.put(Update(JOB_HERODISCOVER, action))
-                elif action.task == TASK_ENDPLAYERUPDATES:
-                    updating_players = False
-                elif action.task == TASK_ADDPLAYER and not updating_players:
-                    queue.put(Update(JOB_HEALTHUPDATE, action))
-                elif not inbrawl and action.task == TASK_ADDPLAYER and updating_players:
-                    queue.put(Update(JOB_PLAYERINFO, action))
-                elif not inbrawl and action.task == TASK_GATHERIDS:
-                    inbrawl = True
-                    brawldt = dict()
-                    character_slots = defaultdict(set)
-                    brawldt[action.player1] = list()
-                    brawldt[action.player2] = list()
-                    lastupdated[action.player1] = current_round
-                    lastupdated[action.player2] = current_round
-                elif inbrawl and action.task == TASK_GETROUNDGATHER:
-                    if action.zone == 'Char':
-                        if action.slot not in character_slots[action.playerid]:
-                            character_slots[action.playerid].add(action.slot)
-                            brawldt[action.playerid].append(action)
-                    else:
-                        playerid = action.playerid
-                        try:
-                            brawldt[playerid].append(action)
-                        except KeyError:
-                            print(brawldt.keys(), playerid, action)
-                elif inbrawl and action.task != TASK_GETROUNDGATHER:
-                    queue.put(Update(JOB_BOARDINFO, brawldt))
-                    inbrawl = False
-                elif action.task == TASK_GETROUND:
-                    queue.put(Update(JOB_ROUNDINFO, action))
-                elif action.task == TASK_ENDCOMBAT:
-                    queue.put(Update(JOB_ENDCOMBAT, action))
-                    updating_players = True
-                elif action.task == TASK_MATCHMAKING:
-                    queue.put(Update(JOB_MATCHMAKING, action))
-                elif not inbrawl and action.task == TASK_UPDATECARD:
-                    queue.put(Update(JOB_CARDUPDATE, action))
-                else:
-                    pass
-
-            prev_action = action
-        time.sleep(0.01)
+                batch = coalesce(updates)
+            if traced:
+                batch.insert(0, Update(JOB_TRACE, time.perf_counter()))
+            queue.put(batch)
+        first_read = False
+        follower.wait()
 
 
 queue = Queue()
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Export a folder of record files to a columnar archive, one table per action type, for analysis across many matches.
+
+Every table has the match (an index into the archive's list of files), the position of the action in its file, the
+timestamp and the opcode, followed by the action's own fields, with the fields of a nested card flattened in. Lists are
+kept as their length. Strings, enums and GUIDs are stored as indexes into one string table shared by the whole archive,
+so a player id or a card art id has the same index in every match.
+
+The archive is a single .npz file, or a folder of Parquet files (one per table, plus the file list and the string
+table) when pyarrow is installed. load_archive reads either back as {action name: DataFrame}, with the same dtypes.
+
+Usage: python -m sbbtracker.parsers.record_archive [RECORD_DIR] -o archive.npz [--format npz|parquet]
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from construct import EnumInteger
+
+from sbbtracker.parsers.record_parser import RecordReader, id_to_action_name
+from sbbtracker.paths import sbb_root
+
+#  Columns every table starts with
+MATCH = "match"
+INDEX = "index"
+OPCODE = "opcode"
+FILES = "files"
+STRINGS = "strings"
+STRING_COLUMNS = "string_columns"
+
+DTYPES = {int: np.int64, bool: np.bool_, float: np.float64, str: np.int32}
+MISSING = {int: 0, bool: False, float: np.nan, str: -1}
+
+
+def have_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class Table:
+    """ The columns of one action type, as lists until the archive is finished """
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+        self.kinds = {}
+
+    def add(self, column, kind, value):
+        values = self.columns.get(column)
+        if values is None:
+            values = self.columns[column] = [None] * self.rows
+            self.kinds[column] = kind
+        values.append(value)
+
+    def end_row(self):
+        self.rows += 1
+        for values in self.columns.values():
+            if len(values) < self.rows:
+                values.append(None)
+
+    def arrays(self):
+        arrays = {}
+        for column, values in self.columns.items():
+            kind = self.kinds[column]
+            missing = MISSING[kind]
+            arrays[column] = np.array([missing if value is None else value for value in values], dtype=DTYPES[kind])
+        return arrays
+
+
+class ArchiveBuilder:
+    """ Decodes record files into the tables of an archive """
+
+    def __init__(self):
+        self.files = []
+        self.strings = {}
+        self.tables = defaultdict(Table)
+
+    def code(self, text):
+        try:
+            return self.strings[text]
+        except KeyError:
+            code = self.strings[text] = len(self.strings)
+            return code
+
+    def add_file(self, filename):
+        """ Add the actions of a record file, returns the number added """
+        match = len(self.files)
+        self.files.append(str(filename))
+        count = 0
+        for count, action in enumerate(RecordReader(filename), 1):
+            table = self.tables[id_to_action_name[action.action_id]]
+            table.add(MATCH, int, match)
+            table.add(INDEX, int, count - 1)
+            table.add(OPCODE, int, int.from_bytes(action.action_id, "little"))
+            self._add_fields(table, action)
+            table.end_row()
+        return count
+
+    def _add_fields(self, table, container, prefix=""):
+        for key, value in container.items():
+            if key.startswith("_") or key == "action_id" or "_length" in key:
+                #  the lengths are those of the strings, which are kept whole
+                continue
+            column = prefix + key
+            if isinstance(value, dict):
+                #  a card keeps its own field names, the action has none of them
+                self._add_fields(table, value, prefix if key == "card" else f"{column}_")
+            elif isinstance(value, list) or value is None:
+                table.add(f"{column}_count", int, len(value) if value else 0)
+            elif isinstance(value, bool):
+                table.add(column, bool, value)
+            elif isinstance(value, int) and not isinstance(value, EnumInteger):
+                table.add(column, int, value)
+            elif isinstance(value, float):
+                table.add(column, float, value)
+            else:
+                table.add(column, str, self.code(str(value)))
+
+    def string_columns(self):
+        return [f"{name}/{column}" for name, table in self.tables.items()
+                for column, kind in table.kinds.items() if kind is str]
+
+    def string_table(self):
+        return np.array(list(self.strings), dtype=str)
+
+
+def write_npz(builder, output):
+    arrays = {FILES: np.array(builder.files, dtype=str), STRINGS: builder.string_table(),
+              STRING_COLUMNS: np.array(builder.string_columns(), dtype=str)}
+    for name, table in builder.tables.items():
+        for column, array in table.arrays().items():
+            arrays[f"{name}/{column}"] = array
+    np.savez_compressed(output, **arrays)
+
+
+def write_parquet(builder, output):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    strings = pa.array(builder.string_table(), type=pa.string())
+    for name, table in builder.tables.items():
+        columns = {}
+        for column, array in table.arrays().items():
+            if table.kinds[column] is str:
+                columns[column] = strings.take(pa.array(array, mask=array < 0)).dictionary_encode()
+            else:
+                columns[column] = pa.array(array)
+        pq.write_table(pa.table(columns), output.joinpath(f"{name}.parquet"))
+    pq.write_table(pa.table({"file": pa.array(builder.files, type=pa.string())}), output.joinpath(f"{FILES}.parquet"))
+    pq.write_table(pa.table({"string": strings}), output.joinpath(f"{STRINGS}.parquet"))
+
+
+def export_archive(filenames, output, archive_format=None):
+    """
+    Write the record files to an archive at output, as npz or parquet (the default when pyarrow is installed).
+    Returns the ArchiveBuilder, which has the files and tables that were written.
+    """
+    if archive_format is None:
+        archive_format = "parquet" if have_pyarrow() else "npz"
+    builder = ArchiveBuilder()
+    for filename in filenames:
+        builder.add_file(filename)
+    if archive_format == "parquet":
+        write_parquet(builder, output)
+    elif archive_format == "npz":
+        write_npz(builder, output)
+    else:
+        raise ValueError(f"Unknown archive format {archive_format}")
+    return builder
+
+
+def load_archive(path):
+    """ The tables of an archive as {action name: DataFrame}, with the strings as categoricals, and the file list """
+    path = Path(path)
+    if path.is_dir():
+        tables = {file.stem: pd.read_parquet(file) for file in path.glob("*.parquet")}
+        files = tables.pop(FILES)["file"].tolist()
+        #  each Parquet file has its own dictionaries, put every string column on the archive's string table as well
+        strings = pd.CategoricalDtype(tables.pop(STRINGS)["string"].values)
+        for table in tables.values():
+            for column in table.columns:
+                if isinstance(table[column].dtype, pd.CategoricalDtype):
+                    table[column] = table[column].astype(strings)
+        return tables, files
+    with np.load(path) as archive:
+        #  one dtype for every string column, so they share the categories
+        strings = pd.CategoricalDtype(archive[STRINGS])
+        string_columns = set(archive[STRING_COLUMNS].tolist())
+        columns = defaultdict(dict)
+        for key in archive.files:
+            if "/" not in key:
+                continue
+            name, column = key.split("/", 1)
+            values = archive[key]
+            if key in string_columns:
+                values = pd.Categorical.from_codes(values, dtype=strings)
+            columns[name][column] = values
+        tables = {name: pd.DataFrame(table) for name, table in columns.items()}
+        return tables, archive[FILES].tolist()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export record files to a columnar archive")
+    ap.add_argument("folder", nargs="?", default=str(sbb_root), help="The folder with the record_*.txt files")
+    ap.add_argument("-o", "--output", required=True, help="The .npz file or Parquet folder to write")
+    ap.add_argument("--format", choices=["npz", "parquet"], help="Defaults to parquet when pyarrow is installed")
+    args = ap.parse_args(argv)
+
+    filenames = sorted(Path(args.folder).glob("record_*.txt"))
+    start = time.perf_counter()
+    builder = export_archive(filenames, args.output, args.format)
+    elapsed = time.perf_counter() - start
+    num_actions = sum(table.rows for table in builder.tables.values())
+    print(f"exported {len(filenames)} files, {num_actions} actions in {elapsed:.2f}s "
+          f"({num_actions / max(elapsed, 1e-9):,.0f} actions/s)")
+    for name, table in sorted(builder.tables.items(), key=lambda t: -t[1].rows):
+        print(f"{name:32} {table.rows:10} rows {len(table.columns):4} columns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Live tracking from the game's binary record files instead of Player.log.
+
+The game writes each match to its own record_*.txt as it's played. RecordFollower tails the newest one and decodes the
+actions appended to it, RecordTranslator turns them into the same typed records the log tokenizer gives for the same
+events, and run() feeds those through the log's state machine, so the GUI gets the same Update stream either way.
+
+Record files don't say which queue a match came from, so every match is reported with an unknown (None) game mode. The
+tracker only uploads matches it knows were matchmade, and leaves them out of the stats when it's set to keep only
+those, as it does for log matches it missed the matchmaking line of.
+"""
+import logging
+import os
+from pathlib import Path
+from queue import Queue
+
+from sbbtracker.parsers.log_follower import IDLE_TIMEOUT, make_watcher, open_shared
+from sbbtracker.parsers.log_parser import BOUNDARY, EVENT_ADDPLAYER, EVENT_CONNINFO, EVENT_CREATECARD, \
+    EVENT_ENTERBRAWLPHASE, EVENT_ENTERRESULTSPHASE, EVENT_ENTERSHOPPHASE, EVENT_PRESENTHERODISCOVER, \
+    EVENT_UPDATECARD, JOB_CATCHUP, SHORTNAME_LENGTH, TASK_MATCHMAKING, BrawlRecord, CardRecord, ConnectionRecord, \
+    HeroDiscoverRecord, LogStateMachine, MatchmakingRecord, PlayerRecord, RoundRecord, Update, coalesce, registry
+from sbbtracker.parsers.record_parser import get_format, id_to_action_name, read_preamble
+from sbbtracker.paths import sbb_root
+
+logger = logging.getLogger(__name__)
+
+#  bytes past an action that fails to decode beyond which it's taken to be corrupt rather than still being written,
+#  far more than the largest action the game writes
+MAX_ACTION_SIZE = 1 << 16
+
+#  the names the log gives the record zones
+ZONE_NAMES = {"none": "None", "character": "Char", "spell": "Spell", "treasure": "Treasure", "hero": "Hero",
+              "hand": "Hand", "shop": "Shop"}
+GOLDEN_PREFIX = "GOLDEN_"
+
+
+class RecordFollower:
+    """
+    Follows the newest record file in a folder, switching to a newer one when the next match starts. Each read decodes
+    the complete actions appended since the last one; an action the game is still writing fails to decode, and is
+    read again, with the rest of it, next time. An action that still fails with more than MAX_ACTION_SIZE bytes
+    after it is corrupt, or of a kind the format doesn't know, and the rest of that file is given up on. The versions
+    in the file's preamble pick the format it's decoded with.
+    """
+    def __init__(self, folder=sbb_root):
+        self.folder = Path(folder)
+        self.filename = None
+        self.offset = 0
+        self.start = None
+        self.record_format = None
+        #  set once an action of the file won't decode
+        self.failed = False
+        #  inotify watches the folder, the stat poller watches the file being followed
+        self._watcher = make_watcher(self.folder.joinpath("record_"))
+
+    def newest(self):
+        try:
+            return max(self.folder.glob("record_*.txt"), key=os.path.getctime, default=None)
+        except OSError:
+            return None
+
+    def actions(self):
+        """
+        Yield the actions appended to the newest record file since the last call. self.start is the offset the read
+        started from, and self.offset is the offset just past the most recently yielded action.
+        """
+        newest = self.newest()
+        if newest is None:
+            return
+        if newest != self.filename:
+            self.filename = newest
+            self.offset = 0
+            self.record_format = None
+            self.failed = False
+            self._watcher.watch(newest)
+        if self.failed:
+            return
+        try:
+            with open_shared(self.filename) as record_file:
+                record_file.seek(self.offset)
+                data = record_file.read()
+        except OSError:
+            logger.exception("Couldn't read the record file")
+            return
+        self.start = self.offset
+        buffer = memoryview(data)
+        position = 0
+        if self.record_format is None:
+            versions, position = read_preamble(buffer)
+            if position is None:
+                return
+            self.record_format = get_format(versions[1] if versions else None)
+            self.offset = position
+        while position < len(buffer):
+            try:
+                action, end = self.record_format.decode(buffer, position)
+            except Exception:
+                if len(buffer) - position > MAX_ACTION_SIZE:
+                    logger.warning(f"Couldn't decode the action at {self.offset} in {self.filename}, "
+                                   f"no longer following it", exc_info=True)
+                    self.failed = True
+                else:
+                    #  most likely the game hasn't finished writing it
+                    logger.debug(f"Waiting for the rest of the action at {self.offset} in {self.filename}")
+                break
+            position = end
+            self.offset = self.start + position
+            yield action
+
+    def wait(self, timeout=IDLE_TIMEOUT):
+        """ Block until the file being followed changes, a newer one appears, or the timeout passes """
+        if self._watcher.wait(timeout):
+            return True
+        return self.newest() != self.filename
+
+
+class RecordTranslator:
+    """ Turns record file actions into the records the log tokenizer gives for the same events """
+    def __init__(self):
+        from sbbtracker.utils import asset_utils
+        self.names = {card["Id"]: name for name, card in asset_utils.content_id_lookup.items()}
+        self.current_player = None
+        #  hero card id -> content id, the players' heroes are only referred to by card id
+        self.heroes = {}
+
+    def content_id(self, art_id):
+        """ The card name the log uses for the card art id """
+        if art_id.startswith(GOLDEN_PREFIX):
+            art_id = art_id[len(GOLDEN_PREFIX):]
+        return self.names.get(art_id, art_id)
+
+    def card(self, event, unit):
+        content_id = self.content_id(unit.art_id)
+        if unit.zone == "hero":
+            self.heroes[unit.card_id] = content_id
+        subtypes = [str(subtype).lower() for subtype in unit.subtypes]
+        return CardRecord(registry.tasks[event], event, unit.player_id[:SHORTNAME_LENGTH], content_id,
+                          ZONE_NAMES.get(str(unit.zone), str(unit.zone)), str(unit.slot), unit.attack, unit.health,
+                          unit.is_golden, str(unit.cost), subtypes or None, str(unit.counter), None)
+
+    def player(self, event, player_id, player_name, card_id, template_id, health, place, experience, level, mmr=None):
+        if self.current_player is None:
+            #  the first player added is the one playing
+            self.current_player = player_id
+        heroid = self.heroes.get(card_id, str(template_id))
+        return PlayerRecord(registry.tasks[event], event, player_id[:SHORTNAME_LENGTH], player_name, heroid, health,
+                            str(place), str(experience), str(level), player_id == self.current_player, mmr)
+
+    def translate(self, actions):
+        for action in actions:
+            event = id_to_action_name.get(action.action_id)
+            if event == EVENT_CONNINFO:
+                self.current_player = None
+                self.heroes.clear()
+                yield MatchmakingRecord(TASK_MATCHMAKING, None)
+                yield ConnectionRecord(registry.tasks[event], event, action.session_id, action.build_id)
+            elif event == EVENT_ADDPLAYER:
+                yield self.player(event, action.player_id, action.player_name, action.card_id, action.template_id,
+                                  action.health, action.place, action.experience, action.level)
+            elif event == EVENT_ENTERRESULTSPHASE:
+                yield self.player(event, action.player_id, action.player_name, action.player_hero_id,
+                                  action.player_card_template_id, action.health, action.place, action.experience,
+                                  action.level, str(action.rank_reward))
+            elif event == EVENT_ENTERBRAWLPHASE:
+                yield BrawlRecord(registry.tasks[event], event, action.player_1_id[:SHORTNAME_LENGTH],
+                                  action.player_2_id[:SHORTNAME_LENGTH])
+            elif event == EVENT_ENTERSHOPPHASE:
+                self.current_player = action.player_id
+                yield RoundRecord(registry.tasks[event], event, action.round)
+            elif event in (EVENT_CREATECARD, EVENT_UPDATECARD):
+                yield self.card(event, action.card)
+            elif event == EVENT_PRESENTHERODISCOVER:
+                choices = []
+                for hero in action.heroes:
+                    choices.append(self.content_id(hero.card.art_id))
+                    self.heroes[hero.card.card_id] = choices[-1]
+                yield HeroDiscoverRecord(registry.tasks[event], event, choices)
+            else:
+                yield registry.markers.get(event, BOUNDARY)
+
+
+def run(queue: Queue, folder=sbb_root, events=()):
+    """
+    Follow the newest record file and put the updates for the GUI on the queue, one coalesced batch per read, like
+    log_parser.run does for the log. Every event is in the record files, so there are no extra events to ask for.
+    Reading a file from the top sends the backlog as a single JOB_CATCHUP update.
+    """
+    machine = LogStateMachine()
+    translator = RecordTranslator()
+    follower = RecordFollower(folder)
+    while True:
+        updates = machine.feed(translator.translate(follower.actions()))
+        if updates:
+            if follower.start == 0:
+                batch = [Update(JOB_CATCHUP, coalesce(updates))]
+            else:
+                batch = coalesce(updates)
+            queue.put(batch)
+        follower.wait()
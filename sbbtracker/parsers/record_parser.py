@@ -1,11 +1,18 @@
 from typing import BinaryIO
 import re
 
-import binascii
+import io
+import logging
+import mmap
+import os
 import struct
 from construct import Struct, Const, Padding, PascalString, Int32ub, Int8ub, Int16ul, Int32ul, Int32sl, Int16ub, \
     Int64ul, PrefixedArray, Select, GreedyRange, Flag, Float32b, Float32l, Float32n, Sequence, Adapter, PaddedString, \
-    Array, Byte, Probe, Enum, this
+    Array, Byte, Probe, Enum, this, Construct, ConstructError, Container, EnumInteger, ExplicitError, FixedSized, \
+    FocusedSeq, FormatField, ListContainer, Rebuild, Renamed, SelectError, SizeofError, StreamError, Subconstruct, \
+    stream_read, stream_seek
+
+logger = logging.getLogger(__name__)
 
 STRUCT_GUID = Struct(
     "field_1" / Int32ul,
@@ -26,20 +33,72 @@ def parse_preamble(f: BinaryIO):
     return client_version, transport_version, card_database_version
 
 
+PREAMBLE_START = b"ClientVersion:"
+
+
+def read_preamble(buffer):
+    """
+    The (client, transport, card database) versions from the preamble line at the start of a record file, and the
+    offset of the first action after it. Files without one give (None, 0), and a preamble the game hasn't finished
+    writing gives (None, None).
+    """
+    if bytes(buffer[:len(PREAMBLE_START)]) != PREAMBLE_START[:len(buffer)]:
+        return None, 0
+    end = bytes(buffer[:1024]).find(b"\n")
+    if end < 0:
+        return None, None
+    answer = preamble_regex.match(bytes(buffer[:end]).decode("utf-8", "replace"))
+    versions = (answer[1], answer[2], answer[3]) if answer else None
+    return versions, end + 1
+
+
+GUID_FIELDS = struct.Struct("<LHHQ")
+#  Guids are interned so the same card gives the same object across actions, the table is cleared when it gets this big
+GUID_TABLE_SIZE = 1 << 16
+
+
+class Guid(bytes):
+    """
+    The 16 raw bytes of a GUID, as stored in the record file. Hashes and compares as bytes, the hex string (in the
+    usual GUID byte order) is only made by str() when it's needed for display or serialization.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return (self[3::-1] + self[5:3:-1] + self[7:5:-1] + self[8:]).hex()
+
+    def __repr__(self):
+        return f"Guid('{self}')"
+
+    @classmethod
+    def from_hex(cls, text):
+        raw = bytes.fromhex(text)
+        return cls(raw[3::-1] + raw[5:3:-1] + raw[7:5:-1] + raw[8:])
+
+
+_guids = {}
+
+
+def guid(raw):
+    """ The interned Guid for 16 raw bytes """
+    try:
+        return _guids[raw]
+    except KeyError:
+        if len(_guids) >= GUID_TABLE_SIZE:
+            _guids.clear()
+        value = _guids[raw] = Guid(raw)
+        return value
+
+
 class GuidAdapter(Adapter):
 
     def _decode(self, obj, context, path):
-        bytes = [struct.pack(">L", obj.field_1), struct.pack(">H", obj.field_2), struct.pack(">H", obj.field_3),
-                 struct.pack("<Q", obj.field_4)]
-        hexlified = [binascii.hexlify(x).decode("ascii") for x in bytes]
-        return "".join(hexlified)
+        return guid(GUID_FIELDS.pack(obj.field_1, obj.field_2, obj.field_3, obj.field_4))
 
     def _encode(self, obj, context, path):
-        field_1 = struct.unpack(">L", binascii.unhexlify(obj[:4]))
-        field_2 = struct.unpack(">H", binascii.unhexlify(obj[4:6]))
-        field_3 = struct.unpack(">H", binascii.unhexlify(obj[6:8]))
-        field_4 = struct.unpack("<Q", binascii.unhexlify(obj[8:]))
-        return STRUCT_GUID.build(dict(field_1=field_1, field_2=field_2, field_3=field_3, field_4=field_4))
+        raw = Guid.from_hex(obj) if isinstance(obj, str) else obj
+        field_1, field_2, field_3, field_4 = GUID_FIELDS.unpack(raw)
+        return dict(field_1=field_1, field_2=field_2, field_3=field_3, field_4=field_4)
 
 
 ZONE = Enum(Byte, none=0, character=1, spell=2, treasure=3, hero=4, hand=5, shop=6)  # TODO: Incomplete
@@ -383,34 +442,557 @@ STRUCT_ACTION_UPDATE_TURN_TIMER = Struct(
 
 )
 
-STRUCT_ACTION = Select(
-    STRUCT_ACTION_ATTACK,
-    STRUCT_ACTION_ADD_PLAYER,
-    STRUCT_ACTION_BRAWL_COMPLETE,
-    STRUCT_ACTION_CAST_SPELL,
-    STRUCT_ACTION_CONNECTION_INFO,
-    STRUCT_ACTION_CREATE_CARD,
-    STRUCT_ACTION_DEAL_DAMAGE,
-    STRUCT_ACTION_DEATH,
-    STRUCT_ACTION_EMOTE,
-    STRUCT_ACTION_ENTER_BRAWL_PHASE,
-    STRUCT_ACTION_ENTER_INTRO_PHASE,
-    STRUCT_ACTION_ENTER_RESULTS_PHASE,
-    STRUCT_ACTION_ENTER_SHOP_PHASE,
-    STRUCT_ACTION_MODIFY_GOLD,
-    STRUCT_ACTION_MODIFY_LEVEL,
-    STRUCT_ACTION_MODIFY_NEXT_LEVEL_XP,
-    STRUCT_ACTION_MODIFY_XP,
-    STRUCT_ACTION_MOVE_CARD,
-    STRUCT_ACTION_PLAY_FX,
-    STRUCT_ACTION_PRESENT_DISCOVER,
-    STRUCT_ACTION_PRESENT_HERO_DISCOVER,
-    STRUCT_ACTION_REMOVE_CARD,
-    STRUCT_ACTION_ROLL,
-    STRUCT_ACTION_UPDATE_CARD,
-    STRUCT_ACTION_UPDATE_EMOTES,
-    STRUCT_ACTION_UPDATE_TURN_TIMER
-)
+#  Hand written decoders for the most common actions. They give the same containers as the structs above, which stay
+#  the reference implementation (scripts/verify_record_fastpath.py checks the two agree), but unpack fixed layouts
+#  straight from the buffer instead of interpreting the structs field by field.
+HEADER = struct.Struct("<2sQ")
+GUID = struct.Struct("<16s")
+UINT32 = struct.Struct("<I")
+UNIT_FIXED = struct.Struct("<16sIx??????BiIIIii")
+ADD_PLAYER_FIXED = struct.Struct("<IIIIII")
+ATTACK = struct.Struct("<16s16sx")
+DEAL_DAMAGE = struct.Struct("<16s16sI")
+
+
+def _check(buffer, end):
+    if end > len(buffer):
+        raise StreamError(f"stream read less than specified amount, expected {end}, found {len(buffer)}")
+
+
+class LazyString:
+    """ A UTF-16 string field left in the buffer until it's read """
+    __slots__ = ("buffer", "start", "end")
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    def decode(self):
+        return str(self.buffer[self.start:self.end], "utf_16_le").rstrip("\x00")
+
+
+class LazyContainer(Container):
+    """ A Container that decodes its LazyString fields the first time they are read """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if type(value) is LazyString:
+            value = value.decode()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+
+def _string(buffer, offset, lazy=False):
+    """ A UInt32 length prefixed UTF-16 string, returns (length, string, offset after it) """
+    length, = UINT32.unpack_from(buffer, offset)
+    start = offset + 4
+    end = start + length * 2
+    _check(buffer, end)
+    if lazy:
+        return length, LazyString(buffer, start, end), end
+    return length, str(buffer[start:end], "utf_16_le").rstrip("\x00"), end
+
+
+def _enum_array(buffer, offset, enum):
+    count, = UINT32.unpack_from(buffer, offset)
+    offset += 4
+    end = offset + count * 2
+    _check(buffer, end)
+    values = struct.unpack_from(f"<{count}H", buffer, offset)
+    decode = enum.decmapping.get
+    return ListContainer([decode(value) or EnumInteger(value) for value in values]), end
+
+
+def _guid_list(buffer, offset):
+    count, = UINT32.unpack_from(buffer, offset)
+    offset += 4
+    guids = ListContainer()
+    for _ in range(count):
+        guids.append(guid(GUID.unpack_from(buffer, offset)[0]))
+        offset += 16
+    return guids, offset
+
+
+def decode_unit(buffer, offset, lazy=False):
+    """
+    STRUCT_UNIT from buffer at offset, returns (unit, offset after it). With lazy the strings are decoded when they're
+    read, which needs the buffer to stay valid for as long as the unit is around.
+    """
+    (card_id, template_id, is_locked, is_targeted, is_golden, is_movable, makes_pair, makes_triple, zone, slot, cost,
+     attack, health, counter, damage) = UNIT_FIXED.unpack_from(buffer, offset)
+    offset += UNIT_FIXED.size + 1
+    subtypes, offset = _enum_array(buffer, offset, SUBTYPE)
+    offset += 1
+    keywords, offset = _enum_array(buffer, offset, KEYWORD)
+    _check(buffer, offset + 1)
+    marker = buffer[offset]
+    if marker == 1:
+        valid_targets = None
+        offset += 1
+    elif marker == 0:
+        valid_targets, offset = _guid_list(buffer, offset + 1)
+    else:
+        raise SelectError("no subconstruct matched")
+    card_id_again, = GUID.unpack_from(buffer, offset)
+    art_id_length, art_id, offset = _string(buffer, offset + 16, lazy)
+    player_id_length, player_id, offset = _string(buffer, offset, lazy)
+    frame_override_length, frame_override, offset = _string(buffer, offset, lazy)
+    unit = (LazyContainer if lazy else Container)(
+        card_id=guid(card_id), template_id=template_id, is_locked=is_locked, is_targeted=is_targeted,
+        is_golden=is_golden, is_movable=is_movable, makes_pair=makes_pair, makes_triple=makes_triple,
+        zone=ZONE.decmapping.get(zone) or EnumInteger(zone), slot=slot, cost=cost, attack=attack, health=health,
+        counter=counter, damage=damage, subtypes=subtypes, keywords=keywords, valid_targets=valid_targets,
+        card_id_again=guid(card_id_again), art_id_length=art_id_length, art_id=art_id,
+        player_id_length=player_id_length, player_id=player_id, frame_override_length=frame_override_length,
+        frame_override=frame_override)
+    return unit, offset
+
+
+def decode_card_action(buffer, offset, lazy=False):
+    """ ActionCreateCard and ActionUpdateCard """
+    action_id, timestamp = HEADER.unpack_from(buffer, offset)
+    card, offset = decode_unit(buffer, offset + HEADER.size, lazy)
+    return Container(action_id=action_id, timestamp=timestamp, card=card), offset
+
+
+def decode_add_player(buffer, offset, lazy=False):
+    action_id, timestamp = HEADER.unpack_from(buffer, offset)
+    health, gold, experience, next_level_xp, level, place = ADD_PLAYER_FIXED.unpack_from(buffer, offset + HEADER.size)
+    offset += HEADER.size + ADD_PLAYER_FIXED.size
+    player_id_length, player_id, offset = _string(buffer, offset, lazy)
+    player_name_length, player_name, offset = _string(buffer, offset, lazy)
+    card_id, template_id = struct.unpack_from("<16sI", buffer, offset + 1)
+    return (LazyContainer if lazy else Container)(
+        action_id=action_id, timestamp=timestamp, health=health, gold=gold, experience=experience,
+        next_level_xp=next_level_xp, level=level, place=place, player_id_length=player_id_length,
+        player_id=player_id, player_name_length=player_name_length, player_name=player_name,
+        card_id=guid(card_id), template_id=template_id), offset + 21
+
+
+def decode_attack(buffer, offset, lazy=False):
+    action_id, timestamp = HEADER.unpack_from(buffer, offset)
+    attacker, defender = ATTACK.unpack_from(buffer, offset + HEADER.size)
+    return Container(action_id=action_id, timestamp=timestamp, attacker=guid(attacker),
+                     defender=guid(defender)), offset + HEADER.size + ATTACK.size
+
+
+def decode_deal_damage(buffer, offset, lazy=False):
+    action_id, timestamp = HEADER.unpack_from(buffer, offset)
+    target, source, damage = DEAL_DAMAGE.unpack_from(buffer, offset + HEADER.size)
+    return Container(action_id=action_id, timestamp=timestamp, target=guid(target), source=guid(source),
+                     damage=damage), offset + HEADER.size + DEAL_DAMAGE.size
+
+
+def decode_death(buffer, offset, lazy=False):
+    action_id, timestamp = HEADER.unpack_from(buffer, offset)
+    target, = GUID.unpack_from(buffer, offset + HEADER.size)
+    return Container(action_id=action_id, timestamp=timestamp, target=guid(target)), \
+        offset + HEADER.size + GUID.size
+
+
+fast_decoders = {
+    b'\x02\x00': decode_add_player,
+    b'\x0B\x00': decode_card_action,
+    b'\x15\x00': decode_card_action,
+    b'\x1B\x00': decode_death,
+    b'\x1C\x00': decode_attack,
+    b'\x1D\x00': decode_deal_damage,
+}
+
+
+#  Every action starts with its 2 byte action id, which picks the struct to parse it with
+action_structs = {
+    b'\x01\x00': STRUCT_ACTION_CONNECTION_INFO,
+    b'\x02\x00': STRUCT_ACTION_ADD_PLAYER,
+    b'\x03\x00': STRUCT_ACTION_PRESENT_DISCOVER,
+    b'\x04\x00': STRUCT_ACTION_PRESENT_HERO_DISCOVER,
+    b'\x05\x00': STRUCT_ACTION_MODIFY_GOLD,
+    b'\x06\x00': STRUCT_ACTION_MODIFY_XP,
+    b'\x07\x00': STRUCT_ACTION_MODIFY_NEXT_LEVEL_XP,
+    b'\x08\x00': STRUCT_ACTION_MODIFY_LEVEL,
+    b'\x09\x00': STRUCT_ACTION_UPDATE_EMOTES,
+    b'\x0A\x00': STRUCT_ACTION_ROLL,
+    b'\x0B\x00': STRUCT_ACTION_CREATE_CARD,
+    b'\x0C\x00': STRUCT_ACTION_REMOVE_CARD,
+    b'\x0D\x00': STRUCT_ACTION_MOVE_CARD,
+    b'\x0E\x00': STRUCT_ACTION_CAST_SPELL,
+    b'\x11\x00': STRUCT_ACTION_ENTER_INTRO_PHASE,
+    b'\x12\x00': STRUCT_ACTION_ENTER_SHOP_PHASE,
+    b'\x13\x00': STRUCT_ACTION_ENTER_RESULTS_PHASE,
+    b'\x15\x00': STRUCT_ACTION_UPDATE_CARD,
+    b'\x17\x00': STRUCT_ACTION_PLAY_FX,
+    b'\x18\x00': STRUCT_ACTION_UPDATE_TURN_TIMER,
+    b'\x19\x00': STRUCT_ACTION_EMOTE,
+    b'\x1A\x00': STRUCT_ACTION_ENTER_BRAWL_PHASE,
+    b'\x1B\x00': STRUCT_ACTION_DEATH,
+    b'\x1C\x00': STRUCT_ACTION_ATTACK,
+    b'\x1D\x00': STRUCT_ACTION_DEAL_DAMAGE,
+    b'\x21\x00': STRUCT_ACTION_BRAWL_COMPLETE,
+}
+
+
+#  Skipping an action only needs its length and count fields. These compile each struct into a function
+#  skip(buffer, offset, context) giving the offset after it, where context holds the fields of the enclosing struct
+#  that later lengths refer to. Nothing else is decoded, so a skipped action is only checked for being long enough.
+def _fixed_skip(size):
+    def skip(buffer, offset, context):
+        end = offset + size
+        _check(buffer, end)
+        return end
+    return skip
+
+
+def _sizeof(subcon):
+    """ The size of subcon, or None if it depends on the data """
+    try:
+        return subcon.sizeof()
+    except (SizeofError, KeyError):
+        return None
+
+
+def _field_skip(name, fmt):
+    def skip(buffer, offset, context):
+        context[name], = fmt.unpack_from(buffer, offset)
+        return offset + fmt.size
+    return skip
+
+
+def _references(subcon):
+    """ The names of the sibling fields subcon's length or count refers to """
+    while isinstance(subcon, Subconstruct) and not isinstance(subcon, (FixedSized, Array)):
+        subcon = subcon.subcon
+    expression = subcon.length if isinstance(subcon, FixedSized) else getattr(subcon, "count", None)
+    if not callable(expression):
+        return set()
+    names = set()
+
+    class Recorder(dict):
+        def __missing__(self, key):
+            names.add(key)
+            return 1
+
+    expression(Recorder())
+    return names
+
+
+def _leading_const(subcon):
+    while not isinstance(subcon, Const):
+        if isinstance(subcon, (Struct, Sequence)):
+            subcon = subcon.subcons[0]
+        elif isinstance(subcon, Subconstruct):
+            subcon = subcon.subcon
+        else:
+            raise TypeError(f"Select alternative {subcon} doesn't start with a Const")
+    return subcon.value
+
+
+def _compile_fields(subcons):
+    referenced = set().union(*(_references(subcon) for subcon in subcons))
+    steps = []
+    fixed = 0
+    for subcon in subcons:
+        field = subcon.subcon if isinstance(subcon, Renamed) else subcon
+        if isinstance(field, Rebuild):
+            field = field.subcon
+        if isinstance(subcon, Renamed) and subcon.name in referenced and isinstance(field, FormatField):
+            if fixed:
+                steps.append(_fixed_skip(fixed))
+                fixed = 0
+            steps.append(_field_skip(subcon.name, struct.Struct(field.fmtstr)))
+            continue
+        size = _sizeof(subcon)
+        if size is not None:
+            fixed += size
+            continue
+        if fixed:
+            steps.append(_fixed_skip(fixed))
+            fixed = 0
+        steps.append(compile_skip(subcon))
+    if fixed:
+        steps.append(_fixed_skip(fixed))
+
+    def skip(buffer, offset, context):
+        context = {}
+        for step in steps:
+            offset = step(buffer, offset, context)
+        return offset
+    return skip
+
+
+def _compile_array(subcon):
+    count = subcon.count
+    size = _sizeof(subcon.subcon)
+    if size is None:
+        item = compile_skip(subcon.subcon)
+
+        def skip(buffer, offset, context):
+            for _ in range(count(context) if callable(count) else count):
+                offset = item(buffer, offset, context)
+            return offset
+        return skip
+
+    def skip(buffer, offset, context):
+        end = offset + (count(context) if callable(count) else count) * size
+        _check(buffer, end)
+        return end
+    return skip
+
+
+def _compile_select(subcon):
+    alternatives = [(_leading_const(alternative), compile_skip(alternative)) for alternative in subcon.subcons]
+
+    def skip(buffer, offset, context):
+        for prefix, alternative in alternatives:
+            if buffer[offset:offset + len(prefix)] == prefix:
+                return alternative(buffer, offset, context)
+        raise SelectError("no subconstruct matched")
+    return skip
+
+
+def _compile_sized(subcon):
+    length = subcon.length
+
+    def skip(buffer, offset, context):
+        end = offset + (length(context) if callable(length) else length)
+        _check(buffer, end)
+        return end
+    return skip
+
+
+def compile_skip(subcon):
+    """ A skip function for subcon, see above """
+    size = _sizeof(subcon)
+    if size is not None:
+        return _fixed_skip(size)
+    if isinstance(subcon, (Struct, Sequence, FocusedSeq)):
+        return _compile_fields(subcon.subcons)
+    if isinstance(subcon, Array):
+        return _compile_array(subcon)
+    if isinstance(subcon, Select):
+        return _compile_select(subcon)
+    if isinstance(subcon, FixedSized):
+        return _compile_sized(subcon)
+    if isinstance(subcon, Subconstruct):
+        return compile_skip(subcon.subcon)
+    raise TypeError(f"Don't know how to skip {subcon}")
+
+
+class UnknownActionError(ConstructError):
+    pass
+
+
+class RecordFormat:
+    """
+    The structs, fast decoders and compiled skips for the actions of one version of the record format. Each format is
+    compiled once, when it's registered.
+    """
+
+    def __init__(self, structs, fast=None):
+        self.structs = structs
+        self.fast = fast or {}
+        self.skips = {action_id: compile_skip(action_struct) for action_id, action_struct in structs.items()}
+
+    def skip(self, buffer, offset):
+        """ The offset after the action at offset in buffer, without decoding it """
+        action_id = bytes(buffer[offset:offset + 2])
+        try:
+            skip = self.skips[action_id]
+        except KeyError:
+            raise UnknownActionError(f"unknown action id {action_id.hex()}")
+        try:
+            return skip(buffer, offset, None)
+        except struct.error as e:
+            raise StreamError(str(e))
+
+    def decode(self, buffer, offset, lazy=False):
+        """ The action at offset in buffer, returns (action, offset after it) """
+        action_id = bytes(buffer[offset:offset + 2])
+        decoder = self.fast.get(action_id)
+        if decoder is not None:
+            try:
+                return decoder(buffer, offset, lazy)
+            except struct.error as e:
+                raise StreamError(str(e))
+        try:
+            action_struct = self.structs[action_id]
+        except KeyError:
+            raise UnknownActionError(f"unknown action id {action_id.hex()}")
+        stream = BufferStream(buffer, offset)
+        action = action_struct.parse_stream(stream)
+        return action, stream.tell()
+
+
+CURRENT_FORMAT = RecordFormat(action_structs, fast_decoders)
+action_skips = CURRENT_FORMAT.skips
+#  TransportVersion -> the RecordFormat of files written with it, versions that aren't here use CURRENT_FORMAT
+record_formats = {}
+#  the unregistered versions already warned about
+unregistered_versions = set()
+
+
+def register_format(transport_versions, structs, fast=None):
+    """ Decode files with any of the transport versions with structs (and fast decoders, by action id) """
+    record_format = RecordFormat(structs, fast)
+    for transport_version in transport_versions:
+        record_formats[transport_version] = record_format
+    return record_format
+
+
+def get_format(transport_version):
+    """ The RecordFormat for the transport version, warning (once per version) when it falls back to CURRENT_FORMAT """
+    record_format = record_formats.get(transport_version)
+    if record_format is not None:
+        return record_format
+    if transport_version is not None and transport_version not in unregistered_versions:
+        unregistered_versions.add(transport_version)
+        logger.warning(f"No record format registered for TransportVersion {transport_version}, decoding with the "
+                       f"current format")
+    return CURRENT_FORMAT
+
+
+class ActionDispatch(Construct):
+    """
+    Reads the action id and parses the action with its struct, rather than trying every struct in turn until one
+    parses. An unknown action id raises UnknownActionError, which ends a GreedyRange like any other parse failure.
+    Actions with a fast decoder use it when the stream is in memory, and the struct otherwise.
+    """
+
+    def __init__(self, fast=True, record_format=CURRENT_FORMAT):
+        super().__init__()
+        self.fast = fast
+        self.record_format = record_format
+
+    def _parse(self, stream, context, path):
+        action_id = stream_read(stream, 2, path)
+        stream_seek(stream, -2, 1, path)
+        decoder = self.record_format.fast.get(action_id) if self.fast else None
+        if decoder is not None and isinstance(stream, io.BytesIO):
+            offset = stream.tell()
+            with stream.getbuffer() as buffer:
+                try:
+                    obj, offset = decoder(buffer, offset)
+                except struct.error as e:
+                    raise StreamError(str(e), path=path)
+            stream.seek(offset)
+            return obj
+        try:
+            action_struct = self.record_format.structs[action_id]
+        except KeyError:
+            raise UnknownActionError(f"unknown action id {action_id.hex()}", path=path)
+        return action_struct._parsereport(stream, context, path)
+
+    def _build(self, obj, stream, context, path):
+        return self.record_format.structs[obj.action_id]._build(obj, stream, context, path)
+
+
+STRUCT_ACTION = ActionDispatch()
+#  The same without the fast decoders, for checking them against the structs
+STRUCT_ACTION_REFERENCE = ActionDispatch(fast=False)
+
+
+class BufferStream:
+    """ The read, seek and tell construct needs over a buffer, copying only the bytes that are read """
+
+    def __init__(self, buffer, offset=0):
+        self.buffer = buffer
+        self.offset = offset
+
+    def read(self, size=-1):
+        end = len(self.buffer) if size is None or size < 0 else min(self.offset + size, len(self.buffer))
+        data = bytes(self.buffer[self.offset:end])
+        self.offset = end
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.offset
+        elif whence == io.SEEK_END:
+            offset += len(self.buffer)
+        self.offset = offset
+        return offset
+
+    def tell(self):
+        return self.offset
+
+
+def skip_action(buffer, offset, record_format=CURRENT_FORMAT):
+    """ The offset after the action at offset in buffer, without decoding it """
+    return record_format.skip(buffer, offset)
+
+
+def decode_action(buffer, offset, lazy=False, record_format=CURRENT_FORMAT):
+    """ The action at offset in buffer, returns (action, offset after it) """
+    return record_format.decode(buffer, offset, lazy)
+
+
+def map_record_file(filename):
+    """ A read only memoryview of the whole file, memory mapped rather than read """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        #  the map keeps its own handle on the file, and is unmapped once nothing references the view
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class RecordReader:
+    """
+    Decodes the actions of a record file straight from a memory map of it, one at a time. Strings in the common actions
+    are decoded when they're read, so the actions keep the map alive until they're dropped.
+
+    The versions in the file's preamble, when it has one, pick the RecordFormat its actions are decoded with.
+
+    Like GreedyRange, iterating stops at the first action that fails to decode, and remaining is the number of bytes
+    left after the last action that did.
+    """
+
+    def __init__(self, filename):
+        self.buffer = map_record_file(filename)
+        versions, offset = read_preamble(self.buffer)
+        self.client_version, self.transport_version, self.card_database_version = versions or (None, None, None)
+        self.record_format = get_format(self.transport_version)
+        #  a file with half a preamble doesn't decode at all, like one with half an action
+        self.offset = offset or 0
+
+    def __iter__(self):
+        return self.actions()
+
+    def actions(self, only=None, skip=()):
+        """
+        Yields the actions one at a time. Actions whose id isn't in only (when given) or is in skip are stepped over
+        without being decoded.
+        """
+        buffer = self.buffer
+        record_format = self.record_format
+        while self.offset < len(buffer):
+            action_id = bytes(buffer[self.offset:self.offset + 2])
+            try:
+                if (only is not None and action_id not in only) or action_id in skip:
+                    self.offset = record_format.skip(buffer, self.offset)
+                    continue
+                action, offset = record_format.decode(buffer, self.offset, lazy=True)
+            except ExplicitError:
+                raise
+            except Exception:
+                return
+            self.offset = offset
+            yield action
+
+    @property
+    def remaining(self):
+        return len(self.buffer) - self.offset
 
 id_to_action_name = {b'\x01\x00': 'ActionConnectionInfo',
                      b'\x02\x00': 'ActionAddPlayer',
@@ -0,0 +1,142 @@
+"""
+Replay a saved Player.log through the parser and state machine without the GUI.
+
+Writes the resulting Update stream as JSONL (one update per line) and reports lines per second, events per second and
+the time spent on each event type. Comparing the output against an earlier run makes a regression check for parser
+changes.
+
+Usage: python -m sbbtracker.parsers.replay Player.log [-o updates.jsonl] [--compare golden.jsonl] [--coalesce]
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from dataclasses import asdict, is_dataclass
+
+from sbbtracker.parsers import log_parser
+from sbbtracker.parsers.log_parser import LogStateMachine, PlayerBoard, coalesce, parse, registry, \
+    STATE_MACHINE_EVENTS
+
+
+def read_lines(filename):
+    with open(filename, "r", encoding="utf-8", errors="replace") as ifs:
+        return ifs.readlines()
+
+
+def replay(lines, events=()):
+    """ Run the lines through the parser and state machine, returning the updates the GUI would have received """
+    subscription = registry.subscribe(STATE_MACHINE_EVENTS, events, boundaries=True)
+    return LogStateMachine().feed(parse(lines, subscription))
+
+
+def event_name(record):
+    if record is log_parser.BOUNDARY:
+        return "(skipped)"
+    return getattr(record, "action_type", None) or record.task
+
+
+def profile(lines, events=()):
+    """
+    Replay the lines, timing each record from the parser and the state machine. The parser time of a record includes
+    the lines before it that produced nothing. Returns {event: [count, parse seconds, state machine seconds]}
+    """
+    subscription = registry.subscribe(STATE_MACHINE_EVENTS, events, boundaries=True)
+    machine = LogStateMachine()
+    timings = defaultdict(lambda: [0, 0.0, 0.0])
+    updates = []
+    records = parse(lines, subscription)
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        try:
+            record = next(records)
+        except StopIteration:
+            break
+        parsed = clock()
+        machine.process(record, updates)
+        processed = clock()
+        timing = timings[event_name(record)]
+        timing[0] += 1
+        timing[1] += parsed - start
+        timing[2] += processed - parsed
+    return timings
+
+
+def to_json(obj):
+    if is_dataclass(obj):
+        return asdict(obj)
+    if isinstance(obj, PlayerBoard):
+        return list(obj)
+    raise TypeError(f"Can't serialize {type(obj).__name__}")
+
+
+def dump_updates(updates):
+    """ One JSON string per update """
+    return [json.dumps({"job": update.job, "state": update.state}, default=to_json) for update in updates]
+
+
+def compare(lines, golden_file):
+    """ Compare the JSONL lines against a golden file, returning the number of differences """
+    with open(golden_file, "r", encoding="utf-8") as ifs:
+        golden = [line.rstrip("\n") for line in ifs]
+    differences = sum(a != b for a, b in zip(lines, golden)) + abs(len(lines) - len(golden))
+    for index, (actual, expected) in enumerate(zip(lines, golden)):
+        if actual != expected:
+            sys.stderr.write(f"First difference at update {index}:\n  expected: {expected}\n  actual:   {actual}\n")
+            break
+    else:
+        if len(lines) != len(golden):
+            sys.stderr.write(f"Expected {len(golden)} updates, got {len(lines)}\n")
+    return differences
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay a Player.log through the log parser without the GUI")
+    ap.add_argument("log", help="The Player.log to replay")
+    ap.add_argument("-o", "--output", help="Write the updates to this JSONL file")
+    ap.add_argument("--compare", help="A JSONL file from an earlier run to compare the updates against")
+    ap.add_argument("--coalesce", action="store_true", help="Coalesce the updates the way the live tracker does")
+    ap.add_argument("--events", nargs="*", default=[], help="Extra events to parse, as the shop display does")
+    ap.add_argument("--repeat", type=int, default=3, help="Number of timing runs, the best is reported")
+    args = ap.parse_args(argv)
+
+    start = time.perf_counter()
+    lines = read_lines(args.log)
+    read_time = time.perf_counter() - start
+
+    best = None
+    for _ in range(max(args.repeat, 1)):
+        start = time.perf_counter()
+        updates = replay(lines, args.events)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    if args.coalesce:
+        updates = coalesce(updates)
+
+    timings = profile(lines, args.events)
+    num_events = sum(count for event, (count, _, _) in timings.items() if event != "(skipped)")
+
+    print(f"read {len(lines)} lines in {read_time:.3f}s")
+    print(f"{len(lines) / best:12,.0f} lines/s")
+    print(f"{num_events / best:12,.0f} events/s")
+    print(f"{len(updates)} updates")
+    print(f"{'event':32} {'count':>8} {'parse ms':>10} {'state ms':>10} {'us/event':>10}")
+    for event, (count, parse_time, machine_time) in sorted(timings.items(), key=lambda t: -(t[1][1] + t[1][2])):
+        per_event = (parse_time + machine_time) / count * 1e6
+        print(f"{event:32} {count:8} {parse_time * 1e3:10.2f} {machine_time * 1e3:10.2f} {per_event:10.2f}")
+
+    dumped = dump_updates(updates)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as ofs:
+            for line in dumped:
+                ofs.write(line + "\n")
+    if args.compare:
+        differences = compare(dumped, args.compare)
+        print(f"{differences} differences from {args.compare}")
+        return 1 if differences else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
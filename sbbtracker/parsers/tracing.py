@@ -0,0 +1,116 @@
+"""
+Sampled timings of the stages of the log pipeline, to tell whether lag comes from parsing the log or from the GUI.
+
+Tracing is off by default, in which case the pipeline only checks tracer.sample() once per read of the log. When it is
+on, every sample_every-th read is timed stage by stage and the timings are counted into fixed-bucket histograms.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+
+STAGE_READ = "read"
+STAGE_TOKENIZE = "tokenize"
+STAGE_STATE_MACHINE = "state machine"
+STAGE_QUEUE_WAIT = "queue wait"
+STAGE_GUI_EMIT = "gui emit"
+STAGES = [STAGE_READ, STAGE_TOKENIZE, STAGE_STATE_MACHINE, STAGE_QUEUE_WAIT, STAGE_GUI_EMIT]
+
+#  upper bounds of the buckets in seconds, 1-2-5 steps from 10us to 5s, and everything slower
+BUCKETS = [scale * 10 ** exponent for exponent in range(-5, 1) for scale in (1, 2, 5)]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, percent):
+        """ The upper bound of the bucket the percentile falls in, or the slowest sample if that's lower """
+        target = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(BUCKETS[index], self.maximum) if index < len(BUCKETS) else self.maximum
+        return 0.0
+
+    def as_dict(self):
+        buckets = {f"<={bound * 1e3:g}ms": count for bound, count in zip(BUCKETS, self.counts) if count}
+        if self.counts[-1]:
+            buckets[f">{BUCKETS[-1] * 1e3:g}ms"] = self.counts[-1]
+        return {"count": self.count, "mean-ms": self.total / self.count * 1e3 if self.count else 0,
+                "p50-ms": self.percentile(50) * 1e3, "p99-ms": self.percentile(99) * 1e3,
+                "max-ms": self.maximum * 1e3, "buckets": buckets}
+
+
+class TimedIterator:
+    """ Wraps an iterator, adding up the time spent getting items from it """
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.elapsed = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        finally:
+            self.elapsed += time.perf_counter() - start
+        self.items += 1
+        return item
+
+
+class Tracer:
+    def __init__(self, sample_every=4):
+        self.enabled = False
+        self.sample_every = sample_every
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self._reads = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """ Whether to time this read of the log """
+        if not self.enabled:
+            return False
+        self._reads += 1
+        return self._reads % self.sample_every == 0
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].record(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {stage: Histogram() for stage in STAGES}
+
+    def as_dict(self):
+        with self._lock:
+            return {stage: histogram.as_dict() for stage, histogram in self.histograms.items()}
+
+    def summary(self):
+        lines = [f"{'stage':14} {'count':>7} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for stage, stats in self.as_dict().items():
+            lines.append(f"{stage:14} {stats['count']:7} {stats['mean-ms']:9.3f} {stats['p50-ms']:9.3f} "
+                         f"{stats['p99-ms']:9.3f} {stats['max-ms']:9.3f}")
+        return "\n".join(lines)
+
+    def dump(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.as_dict(), file, indent=2)
+
+
+tracer = Tracer()
@@ -14,6 +14,7 @@ else:
     sbbtracker_folder = old_sbbtracker_folder
 stats_format = ".csv"
 statsfile = sbbtracker_folder.joinpath("stats" + stats_format)
+stats_db = sbbtracker_folder.joinpath("stats.db")
 backup_dir = Path(sbbtracker_folder).joinpath("backups")
 if not sbbtracker_folder.exists():
     if old_sbbtracker_folder.exists() and os_name == "Windows":
@@ -29,6 +30,8 @@ offsetfile = sbbtracker_folder.joinpath("logfile.offset")
 if not offsetfile.exists():
     offsetfile.touch()
 
+import_manifest = sbbtracker_folder.joinpath("import_manifest.json")
+
 matches_dir = sbbtracker_folder.joinpath("matches")
 if not matches_dir.exists():
     matches_dir.mkdir()
@@ -44,6 +44,7 @@ track_sbb99 = Setting("track-sbb99", False)
 save_stats = Setting("save-stats", True)
 #data
 upload_data = Setting("upload-data", False)
+auto_import_records = Setting("auto-import-records", False)
 # overlay
 boardcomp_transparency = Setting("boardcomp-transparency", 0)
 simulator_transparency = Setting("simulator-transparency", 0)
@@ -78,6 +79,8 @@ streamable_scores = Setting("streamable-scores", [])
 export_comp_button = Setting("export-comp-button", False)
 show_ids = Setting("show-ids", False)
 show_id_window = Setting("show-id-window", False)
+trace_log_parser = Setting("trace-log-parser", False)
+track_from_records = Setting("track-from-records", False)
 # around the world
 atw_strict_mode = Setting("atw-strict-mode", False)
 atw_start_date = Setting("atw-start-date", "2020-12-31")
@@ -1,21 +1,26 @@
 import json
 import logging
 import math
+import numbers
 import os.path
 import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import date, datetime
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
 import numpy as np
 import pandas as pd
-from construct import GreedyRange
 
+from sbbtracker import settings
 from sbbtracker.utils import asset_utils
 from sbbtracker.parsers import log_parser
 import sbbtracker.paths as paths
-from sbbtracker.parsers.record_parser import STRUCT_ACTION, id_to_action_name
-from sbbtracker.paths import backup_dir, statsfile, stats_format
+from sbbtracker.parsers.record_parser import RecordReader, id_to_action_name
+from sbbtracker.paths import backup_dir, statsfile, stats_db, stats_format
 
 
 headings = ["Hero", "# Matches", "Avg Place", "Top 4", "Wins", "Net MMR"]
@@ -24,6 +29,7 @@ stats_per_page = 20
 pd.options.mode.chained_assignment = None
 
 stats_columns = ['StartingHero', 'EndingHero', 'Placement', 'Timestamp', '+/-MMR', 'SessionId']
+hero_columns = ['StartingHero', 'EndingHero']
 
 
 def sorting_key(sort_col: int):
@@ -39,6 +45,55 @@ def sorting_key(sort_col: int):
         return float
 
 
+def hero_stats(df: pd.DataFrame, hero_type: str):
+    """
+    The unsorted stats rows of the in-pool heroes, padded to the number of heroes, and the All Heroes row, from one
+    grouped aggregation over the hero_type column
+    """
+    placement = df["Placement"]
+    grouped = pd.DataFrame({"Hero": df[hero_type].values, "Placement": placement.values,
+                            "Top4": (placement <= 4).values, "Win": (placement == 1).values,
+                            "MMR": df["+/-MMR"].values}).groupby("Hero", sort=False)
+    aggregated = grouped.agg(matches=("Placement", "size"), avg=("Placement", "mean"), top4=("Top4", "sum"),
+                             wins=("Win", "sum"), mmr=("MMR", "sum"))
+    columns = {column: dict(zip(aggregated.index, aggregated[column].values)) for column in aggregated.columns}
+    #  the net mmr of a hero without matches, the zero of the column's type
+    no_mmr = df["+/-MMR"].iloc[:0].sum()
+    data = []
+    for value in asset_utils.hero_list:
+        hero = value['Name']
+        in_pool = value['InPool']
+        if in_pool:
+            avg = round(columns["avg"].get(hero, np.nan), 2)
+            if math.isnan(avg):
+                avg = 0
+            data.append([hero, str(columns["matches"].get(hero, 0)), str(avg), str(columns["top4"].get(hero, 0)),
+                         str(columns["wins"].get(hero, 0)), str(columns["mmr"].get(hero, no_mmr))])
+
+    padding = [["", "", "", "", "", ""] for _ in range(asset_utils.get_num_heroes() - len(data))]
+    data = data + padding
+    global_matches = len(df)
+    global_avg = round(placement.mean(), 2)
+    if math.isnan(global_avg):
+        global_avg = 0
+    global_top4 = len(df.loc[placement <= 4, 'Placement'])
+    global_wins = len(df.loc[placement == 1, 'Placement'])
+    global_net_mmr = df["+/-MMR"].sum()
+    return data, ["All Heroes", str(global_matches), str(global_avg), str(global_top4), str(global_wins),
+                  str(global_net_mmr)]
+
+
+def sort_stats(stats, sort_col: int, sort_asc: bool):
+    """ The hero_stats of StartingHero and EndingHero as the stats tables, sorted below their All Heroes rows """
+    sorter = sorting_key(sort_col)
+    tables = []
+    for data, all_heroes in stats:
+        data = sorted(data, key=lambda x: sorter(x[sort_col]), reverse=sort_asc)
+        data.insert(0, all_heroes)
+        tables.append(data)
+    return tables
+
+
 def adjust_legacy_df(df: pd.DataFrame):
     if 'SessionId' not in df.columns:
         df['SessionId'] = ' '
@@ -67,11 +122,17 @@ def adjust_legacy_df(df: pd.DataFrame):
 
 def backup_stats(force=False):
     daily_file = backup_dir.joinpath("backup_" + date.today().strftime("%Y-%m-%d") + stats_format)
-    if (not daily_file.exists() or force) and statsfile.exists():
+    if (not daily_file.exists() or force) and (stats_db.exists() or statsfile.exists()):
         # we haven't written the backup today lets do it (or we're forcing an overwrite)
         backups = list(backup_dir.glob("backup*.csv"))
         backups.sort(reverse=True)
-        shutil.copy(statsfile, daily_file)
+        if stats_db.exists():
+            #  backups stay csv files, which load the same way the stats file did
+            store = MatchStore()
+            store.export(daily_file)
+            store.close()
+        else:
+            shutil.copy(statsfile, daily_file)
         if len(backups) > 7:
             # we have reached the max number of backups, delete the oldest ones
             for old_backup in backups[-(len(backups) - 7):]:
@@ -88,47 +149,431 @@ def most_recent_backup_date():
         return "Never"
 
 
-class PlayerStats:
+class ImportManifest:
     """
-    A class for loading, storing, and manipulating a player's match history and its relevant stats
+    The record files that have already been imported, keyed by path, with the size and mtime they had then and the
+    SessionId of their match, or REJECTED if they didn't hold a match worth importing (bot games, unfinished files...)
+
+    Also the SessionIds of the matches deleted from the stats, which only a reimport of everything brings back.
     """
-    def __init__(self):
-        if os.path.exists(statsfile):
+    REJECTED = "rejected"
+
+    def __init__(self, filename=paths.import_manifest):
+        self.filename = filename
+        self.entries = {}
+        self.deleted = set()
+        if filename.exists():
             try:
-                self.df = pd.read_csv(str(statsfile))
-                self.df = adjust_legacy_df(self.df)
-                if not set(stats_columns).issubset(self.df.columns):
-                    self.df = pd.read_csv(os.listdir(backup_dir)[0])
-                    self.df = adjust_legacy_df(self.df)
+                with open(filename, "r") as json_file:
+                    manifest = json.load(json_file)
+                if "files" in manifest:
+                    self.entries = manifest["files"]
+                    self.deleted = set(manifest.get("deleted", []))
+                else:
+                    #  the manifest from before deletions were kept, just the files
+                    self.entries = manifest
+            except Exception:
+                logging.exception("Couldn't load the import manifest, every record file will be imported again")
+
+    def get(self, path, stat):
+        """ The SessionId or REJECTED recorded for the file, or None if it's new or has changed since """
+        entry = self.entries.get(str(path))
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return entry["result"]
+        return None
+
+    def set(self, path, stat, result):
+        """
+        @param stat: the file's stat from before it was read, so if the game wrote to it while it was being read, it's
+        seen to have changed and is read again
+        """
+        self.entries[str(path)] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "result": result}
+
+    def save(self):
+        with NamedTemporaryFile(delete=False, mode='w', newline='') as temp_file:
+            json.dump({"files": self.entries, "deleted": sorted(self.deleted)}, temp_file)
+            temp_name = temp_file.name
+        try:
+            with open(temp_name) as file:
+                json.load(file)
+            shutil.move(temp_name, self.filename)
+        except Exception:
+            logging.exception("Couldn't save the import manifest")
+
+
+def record_files():
+    return paths.sbb_root.glob("record_*.txt")
+
+
+def unsettled_record_files(settle_time):
+    """ The record files written to in the last settle_time seconds, which the game may still be writing """
+    now = time.time()
+    unsettled = []
+    for filename in record_files():
+        try:
+            if now - os.path.getmtime(filename) < settle_time:
+                unsettled.append(filename)
+        except OSError:
+            pass
+    return unsettled
+
+
+def load_csv_stats():
+    """ The match history from the stats csv (or its backup) the tracker kept before the database """
+    if os.path.exists(statsfile):
+        try:
+            df = pd.read_csv(str(statsfile))
+            df = adjust_legacy_df(df)
+            if not set(stats_columns).issubset(df.columns):
+                df = pd.read_csv(os.listdir(backup_dir)[0])
+                df = adjust_legacy_df(df)
+        except:
+            logging.exception("Error loading stats file. Attempting to load backup.")
+            try:
+                df = pd.read_csv(os.listdir(backup_dir)[0])
             except:
-                logging.exception("Error loading stats file. Attempting to load backup.")
-                try:
-                    self.df = pd.read_csv(os.listdir(backup_dir)[0])
-                except:
-                    logging.exception("Couldn't load backup. Starting a new stats file")
-                    self.df = pd.DataFrame(columns=stats_columns)
+                logging.exception("Couldn't load backup. Starting a new stats file")
+                df = pd.DataFrame(columns=stats_columns)
+    else:
+        df = pd.DataFrame(columns=stats_columns)
+    return df.dropna()  # cleanup any weird stats
+
+
+#  numpy scalars from dataframes are stored as the python values they hold
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.float64, float)
+
+
+class MatchStore:
+    """
+    The match history in an SQLite database, one row per match in the order they were added. Matches are inserted and
+    deleted a transaction at a time, so saving one doesn't take longer as the history grows.
+    """
+    indexed_columns = ['SessionId', 'Timestamp', 'StartingHero', 'EndingHero']
+    #  user_version of a database that has had the stats csv migrated into it
+    MIGRATED = 1
+
+    def __init__(self, filename=stats_db):
+        self.filename = filename
+        #  PlayerStats also uses it from the log and import threads, its lock keeps them from overlapping
+        self.connection = sqlite3.connect(str(filename), check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS matches (id INTEGER PRIMARY KEY, StartingHero TEXT, EndingHero TEXT, '
+                'Placement INTEGER, Timestamp TEXT, "+/-MMR" INTEGER, SessionId TEXT)')
+            for column in self.indexed_columns:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS matches_{column} ON matches ("{column}")')
+        self.columns = ", ".join(f'"{column}"' for column in stats_columns)
+
+    def migrated(self):
+        return self.connection.execute("PRAGMA user_version").fetchone()[0] >= self.MIGRATED
+
+    def migrate(self, df: pd.DataFrame):
+        """ Insert the matches from the csv stats, and mark the database as migrated, in one transaction """
+        with self.connection:
+            self._insert(df[stats_columns].values.tolist())
+            self.connection.execute(f"PRAGMA user_version = {self.MIGRATED}")
+
+    def load(self):
+        """ The matches as a dataframe of stats_columns, and the row id of each of its rows """
+        df = pd.read_sql_query(f'SELECT id, {self.columns} FROM matches ORDER BY id', self.connection)
+        return df[stats_columns], df['id'].tolist()
+
+    def insert(self, rows):
+        """
+        @param rows: lists of stats_columns values
+        @return: the row ids they were given
+        """
+        with self.connection:
+            return self._insert(rows)
+
+    def _insert(self, rows):
+        placeholders = ", ".join("?" * len(stats_columns))
+        return [self.connection.execute(f'INSERT INTO matches ({self.columns}) VALUES ({placeholders})', row).lastrowid
+                for row in rows]
+
+    def delete(self, row_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM matches WHERE id = ?', (row_id,))
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM matches')
+
+    def export(self, filepath):
+        self.load()[0].to_csv(filepath, index=False)
+
+    def close(self):
+        self.connection.close()
+
+
+#  the day of the matches from before there were timestamps, and of ones that can't be read
+NO_DAY = np.datetime64("1973-01-01", "D")
+
+#  the totals kept for a set of matches: matches, matches with a numeric placement (which the average is over), the sum
+#  of those placements, top 4s, wins and net mmr, then the placement counts in the bins np.histogram(placements,
+#  bins=range(1, 10)) gives
+MATCHES, PLACED, PLACEMENT_SUM, TOP4, WINS, MMR, HISTOGRAM = range(7)
+NUM_TOTALS = HISTOGRAM + 8
+
+
+def to_day(timestamp):
+    """ The day of a Timestamp value, which is a YYYY-MM-DD string or a date, as a datetime64[D] """
+    if isinstance(timestamp, str) and len(timestamp) == 10:
+        return np.datetime64(timestamp, "D")
+    return pd.Timestamp(timestamp).to_datetime64().astype("datetime64[D]")
+
+
+def to_days(timestamps: pd.Series):
+    """ The days of a Timestamp column, parsed all at once """
+    days = pd.to_datetime(timestamps, errors="coerce").values.astype("datetime64[D]")
+    days[np.isnat(days)] = NO_DAY
+    return days
+
+
+def to_number(value):
+    return float(value) if isinstance(value, numbers.Number) else np.nan
+
+
+def match_totals(placements: np.ndarray, mmrs: np.ndarray):
+    """ The totals of each match, one row per match, from its placement and mmr as floats that are nan if missing """
+    totals = np.zeros((len(placements), NUM_TOTALS))
+    placed = ~np.isnan(placements)
+    totals[:, MATCHES] = 1
+    totals[:, PLACED] = placed
+    totals[:, PLACEMENT_SUM] = np.where(placed, placements, 0)
+    totals[:, TOP4] = placements <= 4
+    totals[:, WINS] = placements == 1
+    totals[:, MMR] = np.where(np.isnan(mmrs), 0, mmrs)
+    binned = placed & (placements >= 1) & (placements <= 9)
+    bins = np.minimum(placements[binned], 8).astype(int) - 1
+    totals[np.flatnonzero(binned), HISTOGRAM + bins] = 1
+    return totals
+
+
+def around_the_world_stats(df, strict_mode, start_date):
+    """
+    The All Hero Challenge for the matches since start_date, in one pass over them. In strict mode only the matches
+    that ended on the starting hero count, except for Mask, which always changes.
+    @return: [hero, plays, wins, first win, attempts] for each in pool hero that has won, by name, and [hero, plays]
+    for the ones yet to win. The first win is one past its row's index in df, and the attempts count the plays up to
+    two rows past it.
+    """
+    df = df[df["Timestamp"] >= start_date]
+    hero = df["StartingHero"]
+    if strict_mode:
+        counted = (hero == df["EndingHero"]) | (hero == "Mask")
+        df = df[counted]
+        hero = hero[counted]
+        attempt = (hero != "Mask") | (df["EndingHero"] == "Mask")
+    else:
+        attempt = pd.Series(True, index=df.index)
+    frame = pd.DataFrame({"Hero": hero.values, "Row": df.index.values, "Win": (df["Placement"] == 1).values,
+                          "Attempt": attempt.values})
+    grouped = frame.groupby("Hero")
+    plays = grouped.size()
+    wins = grouped["Win"].sum()
+    first_win = frame[frame["Win"]].groupby("Hero")["Row"].first()
+    last_attempt = frame["Hero"].map(first_win) + 2
+    attempts = frame[frame["Attempt"] & (frame["Row"] <= last_attempt)].groupby("Hero").size()
+
+    winners = []
+    yet_to_win = []
+    for name in sorted(value["Name"] for value in asset_utils.hero_list if value["InPool"] == True):
+        if name in first_win.index:
+            winners.append([name, int(plays[name]), int(wins[name]), int(first_win[name]) + 1,
+                            int(attempts.get(name, 0))])
         else:
-            self.df = pd.DataFrame(columns=stats_columns)
-        self.df = self.df.dropna()  # cleanup any weird stats
+            yet_to_win.append([name, int(plays.get(name, 0))])
+    return winners, yet_to_win
+
+
+class HeroAggregate:
+    """ The totals of a set of matches """
+    __slots__ = ("matches", "placed", "placement_sum", "top4", "wins", "mmr", "histogram")
+
+    def __init__(self, totals=None):
+        if totals is None:
+            totals = np.zeros(NUM_TOTALS)
+        #  the sums are of whole numbers, except the mmr of stats that have a float in it
+        self.matches, self.placed, self.top4, self.wins = (int(totals[i]) for i in (MATCHES, PLACED, TOP4, WINS))
+        self.placement_sum = totals[PLACEMENT_SUM].item()
+        mmr = totals[MMR].item()
+        self.mmr = int(mmr) if mmr.is_integer() else mmr
+        self.histogram = totals[HISTOGRAM:].astype(np.int64)
+
+    def average_placement(self):
+        """ Rounded the way pandas' mean is, nan without placements """
+        return round(np.float64(self.placement_sum / self.placed), 2) if self.placed else np.nan
+
+    def stats_row(self, name, float_mmr):
+        avg = self.average_placement()
+        if math.isnan(avg):
+            avg = 0
+        mmr = float(self.mmr) if float_mmr else self.mmr
+        return [name, str(self.matches), str(avg), str(self.top4), str(self.wins), str(mmr)]
+
+
+class HeroAggregates:
+    """
+    The totals of the matches for each day, starting and ending hero, so adding or deleting a match only changes the
+    totals of its day. The days are kept in the order they were first seen, in arrays that grow by doubling, so a new
+    day or hero is rarely a copy. The totals of a date range come from running sums over the days in order, which are
+    worked out when they're asked for after a change, and the totals of a range are the difference of the sums at its
+    two ends, found by binary search.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        #  counts the changes to the totals, the running sums are those of the count they were worked out at
+        self.changes = 0
+        self.running_sums = None
+        self.rebuild(df)
+
+    def rebuild(self, df: pd.DataFrame):
+        placements = pd.to_numeric(df["Placement"], errors="coerce")
+        mmrs = pd.to_numeric(df["+/-MMR"], errors="coerce")
+        #  net mmr is shown as a float once there's a float in the column, as pandas' sum would
+        self.float_mmr = mmrs.dtype.kind == "f" and not mmrs.isna().all()
+        totals = match_totals(placements.to_numpy(dtype=np.float64), mmrs.to_numpy(dtype=np.float64))
+        days, day_codes = np.unique(to_days(df["Timestamp"]), return_inverse=True)
+        hero_codes, heroes = pd.factorize(np.concatenate([df[hero_type].values for hero_type in hero_columns]))
+        #  counts[i] is the totals of the matches on days[i], by hero column and hero
+        shape = (len(days), len(hero_columns), len(heroes), NUM_TOTALS)
+        cells = (np.tile(day_codes, len(hero_columns)) * len(hero_columns)
+                 + np.repeat(np.arange(len(hero_columns)), len(df))) * len(heroes) + hero_codes
+        tiled = np.tile(totals, (len(hero_columns), 1))
+        counts = np.stack([np.bincount(cells, weights=tiled[:, column], minlength=math.prod(shape[:3]))
+                           for column in range(NUM_TOTALS)], axis=-1)
+        #  only the thread adding a match (which holds the PlayerStats lock) uses the day of each slot
+        self.day_slots = {day: slot for slot, day in enumerate(days)}
+        #  (days, counts, hero -> its index in the counts, the same for both hero columns, the number of days used).
+        #  Matches are added from the log and import threads while the GUI reads, so growing the arrays replaces the
+        #  whole tuple at once, and readers take it once. Adding to the counts in place can only leave a reader a match
+        #  short, and the change that follows has the running sums worked out again.
+        self.index = (days, counts.reshape(shape), {hero: index for index, hero in enumerate(heroes)}, len(days))
+        self.changes += 1
+
+    def _day_slot(self, day):
+        slot = self.day_slots.get(day)
+        if slot is None:
+            days, counts, heroes, num_days = self.index
+            slot = num_days
+            if slot == len(days):
+                grow = max(len(days), 16)
+                days = np.concatenate([days, np.full(grow, NO_DAY)])
+                counts = np.concatenate([counts, np.zeros((grow,) + counts.shape[1:])])
+            days[slot] = day
+            self.day_slots[day] = slot
+            self.index = (days, counts, heroes, num_days + 1)
+        return slot
+
+    def _hero_index(self, hero):
+        days, counts, heroes, num_days = self.index
+        index = heroes.get(hero)
+        if index is None:
+            index = len(heroes)
+            if index == counts.shape[2]:
+                grow = max(counts.shape[2], 16)
+                counts = np.concatenate([counts, np.zeros(counts.shape[:2] + (grow, NUM_TOTALS))], axis=2)
+            #  a new dict rather than adding to the one readers may be going through
+            self.index = (days, counts, {**heroes, hero: index}, num_days)
+        return index
+
+    def add(self, starting_hero, ending_hero, placement, timestamp, mmr, count=1):
+        """ Add a match, or take it away with a count of -1 """
+        if isinstance(mmr, float):
+            self.float_mmr = True
+        totals = match_totals(np.array([to_number(placement)]), np.array([to_number(mmr)]))[0] * count
+        slot = self._day_slot(to_day(timestamp))
+        hero_indexes = [self._hero_index(hero) for hero in (starting_hero, ending_hero)]
+        counts = self.index[1]
+        for column, hero_index in enumerate(hero_indexes):
+            counts[slot, column, hero_index] += totals
+        self.changes += 1
+
+    def remove(self, starting_hero, ending_hero, placement, timestamp, mmr):
+        self.add(starting_hero, ending_hero, placement, timestamp, mmr, -1)
+
+    def sums(self):
+        """
+        (the days in order, sums, hero -> its index in the sums), where sums[i] is the totals of the matches on the
+        days before days[i]. Worked out again after a change.
+        """
+        #  read before the index, so a change made while the sums are worked out has them worked out again next time
+        changes = self.changes
+        running_sums = self.running_sums
+        if running_sums is None or running_sums[0] != changes:
+            days, counts, heroes, num_days = self.index
+            order = np.argsort(days[:num_days], kind="stable")
+            sums = np.zeros((num_days + 1,) + counts.shape[1:])
+            np.cumsum(counts[order], axis=0, out=sums[1:])
+            running_sums = self.running_sums = (changes, days[order], sums, heroes)
+        return running_sums[1:]
+
+    def range_totals(self, hero_type, start_date=None, end_date=None):
+        """
+        The totals of every hero of the hero_type over the days from start_date to end_date, both included
+        @return: (hero -> its row in the totals, totals)
+        """
+        days, sums, heroes = self.sums()
+        start = 0 if start_date is None else np.searchsorted(days, to_day(start_date), "left")
+        end = len(days) if end_date is None else np.searchsorted(days, to_day(end_date), "right")
+        sums = sums[:, hero_columns.index(hero_type)]
+        return heroes, sums[end] - sums[start]
+
+    def totals(self, hero_type, start_date=None, end_date=None):
+        """ {hero: HeroAggregate} of the hero_type over the days from start_date to end_date, both included """
+        heroes, totals = self.range_totals(hero_type, start_date, end_date)
+        return {hero: HeroAggregate(totals[index]) for hero, index in heroes.items() if totals[index, MATCHES]}
+
+    def hero_stats(self, hero_type, start_date=None, end_date=None):
+        """ The same rows as hero_stats() for the matches in the date range """
+        heroes, totals = self.range_totals(hero_type, start_date, end_date)
+        data = []
+        for value in asset_utils.hero_list:
+            hero = value['Name']
+            in_pool = value['InPool']
+            if in_pool:
+                index = heroes.get(hero)
+                aggregate = HeroAggregate() if index is None else HeroAggregate(totals[index])
+                data.append(aggregate.stats_row(hero, self.float_mmr))
+        padding = [["", "", "", "", "", ""] for _ in range(asset_utils.get_num_heroes() - len(data))]
+        return data + padding, HeroAggregate(totals.sum(axis=0)).stats_row("All Heroes", self.float_mmr)
+
+
+class PlayerStats:
+    """
+    A class for loading, storing, and manipulating a player's match history and its relevant stats
+    """
+    def __init__(self):
+        self.store = MatchStore()
+        if not self.store.migrated():
+            #  the first run with the database, the stats csv is left as it was
+            self.store.migrate(load_csv_stats())
+        self.df, self.row_ids = self.store.load()
+        self.aggregates = HeroAggregates(self.df)
+        #  matches can be added from the log thread and the importer at the same time
+        self.lock = threading.Lock()
+        #  counts the changes to the matches, for the caches of stats computed from them
+        self.version = 0
+        self.stats_cache = None
+        self.atw_cache = None
 
     def export(self, filepath: Path):
         self.df.to_csv(filepath, index=False)
 
     def save(self):
+        #  every change is already in the database
         backup_stats()
-        with NamedTemporaryFile(delete=False, mode='w', newline='') as temp_file:
-            self.df.to_csv(temp_file, index=False)
-            temp_name = temp_file.name
-        try:
-            with open(temp_name) as file:
-                df = pd.read_csv(file)
-            if set(stats_columns).issubset(df.columns):
-                shutil.move(temp_name, statsfile)
-        except:
-            logging.exception("Couldn't save settings correctly")
 
     def delete(self):
-        self.df = pd.DataFrame(columns=stats_columns)
+        with self.lock:
+            self.record_deletions(self.df['SessionId'].values)
+            self.store.clear()
+            self.df = pd.DataFrame(columns=stats_columns)
+            self.row_ids = []
+            self.aggregates.rebuild(self.df)
+            self.version += 1
 
     def get_num_pages(self):
         return math.ceil(len(self.df.index) / stats_per_page)
@@ -144,149 +589,167 @@ class PlayerStats:
 
     def update_stats(self, starting_hero: str, ending_hero: str, placement: str, mmr_change: str, session_id: str,
                      timestamp: date = None):
-        if session_id not in self.df['SessionId'].values and starting_hero and ending_hero and placement \
-                and mmr_change and session_id:
-            if timestamp is None:
-                timestamp = datetime.now()
-            if ending_hero == "Big Bad Wolf":
-                ending_hero = "Grandmother"
-            self.df = self.df.append(
-                {"StartingHero": starting_hero, "EndingHero": ending_hero, "Placement": placement,
-                 "Timestamp": timestamp.strftime("%Y-%m-%d"), "+/-MMR": str(mmr_change), "SessionId": session_id},
-                ignore_index=True)
-            self.save()
-        else:
-            logging.warning("Not adding existing match!")
+        self.add_matches([(starting_hero, ending_hero, placement, mmr_change, session_id, timestamp)])
+
+    def add_matches(self, matches):
+        """
+        Adds the complete matches that aren't in the stats yet, going by their SessionId, and saves once at the end
+        @param matches: (starting_hero, ending_hero, placement, mmr_change, session_id, timestamp) tuples
+        @return: the number of matches added
+        """
+        with self.lock:
+            return self._add_matches(matches)
+
+    def _add_matches(self, matches):
+        session_ids = set(self.df['SessionId'].values)
+        rows = []
+        for starting_hero, ending_hero, placement, mmr_change, session_id, timestamp in matches:
+            if session_id not in session_ids and starting_hero and ending_hero and placement \
+                    and mmr_change and session_id:
+                if timestamp is None:
+                    timestamp = datetime.now()
+                if ending_hero == "Big Bad Wolf":
+                    ending_hero = "Grandmother"
+                #  stored as the numbers the database gives back
+                row = [starting_hero, ending_hero, pd.to_numeric(placement, errors="ignore"),
+                       timestamp.strftime("%Y-%m-%d"), pd.to_numeric(str(mmr_change), errors="ignore"), session_id]
+                rows.append(row)
+                session_ids.add(session_id)
+            else:
+                logging.warning("Not adding existing match!")
+        if rows:
+            self.row_ids += self.store.insert(rows)
+            for row in rows:
+                self.aggregates.add(*row[:5])
+            self.df = pd.concat([self.df, pd.DataFrame(rows, columns=stats_columns)], ignore_index=True)
+            self.version += 1
+            backup_stats()
+        return len(rows)
 
     def generate_stats(self, sort_col: int, sort_asc: bool, df=None):
         if df is None:
             df = self.df
+        return sort_stats(self.unsorted_stats(df), sort_col, sort_asc)
+
+    def unsorted_stats(self, df):
         df["Placement"] = pd.to_numeric(df["Placement"])
         df["+/-MMR"] = pd.to_numeric(df["+/-MMR"])
-        stats = []
-        for hero_type in ["StartingHero", "EndingHero"]:
-            data = []
-            for value in asset_utils.hero_list:
-                hero = value['Name']
-                in_pool = value['InPool']
-                if in_pool:
-                    bool_df = df[hero_type] == hero
-                    total_matches = sum(bool_df)
-                    avg = round(df.loc[bool_df, 'Placement'].mean(), 2)
-                    if math.isnan(avg):
-                        avg = 0
-                    total_top4 = len(df.loc[bool_df & (df['Placement'] <= 4), 'Placement'])
-                    total_wins = len(df.loc[bool_df & (df['Placement'] == 1), 'Placement'])
-                    net_mmr = df.loc[bool_df, '+/-MMR'].sum()
-                    data.append([hero, str(total_matches), str(avg), str(total_top4), str(total_wins), str(net_mmr)])
-
-            padding = [["", "", "", "", "", ""] for _ in range(asset_utils.get_num_heroes() - len(data))]
-            data = data + padding
-            global_matches = len(df)
-            global_avg = round(df["Placement"].mean(), 2)
-            if math.isnan(global_avg):
-                global_avg = 0
-            global_top4 = len(df.loc[df['Placement'] <= 4, 'Placement'])
-            global_wins = len(df.loc[df['Placement'] == 1, 'Placement'])
-            global_net_mmr = df["+/-MMR"].sum()
-
-            sorter = sorting_key(sort_col)
-            data = sorted(data, key=lambda x: sorter(x[sort_col]), reverse=sort_asc)
-            data.insert(0, ["All Heroes", str(global_matches), str(global_avg), str(global_top4), str(global_wins),
-                            str(global_net_mmr)])
-            stats.append(data)
-        return stats
+        return [hero_stats(df, hero_type) for hero_type in ["StartingHero", "EndingHero"]]
 
     def generate_around_the_world_stats(self, df=None):
-        import settings
-        
-        if df is None:
-            df = self.df
-        
-        winners = list()
-        yet_to_win = list()
-
-        # Configuration
+        """
+        @return: the All Hero Challenge rows, [hero, plays, wins, first win, attempts] for the heroes that have won and
+        [hero, plays] for the ones yet to win, as new lists the caller can sort
+        """
+        if df is not None:
+            return around_the_world_stats(df, settings.get(settings.atw_strict_mode),
+                                          settings.get(settings.atw_start_date))
+        winners, yet_to_win = self.around_the_world_lookup()
+        return list(winners.values()), list(yet_to_win.values())
+
+    def around_the_world_lookup(self):
+        """
+        The All Hero Challenge rows as {hero: row} for the heroes that have won and the ones yet to win, worked out
+        again only when the matches or the challenge settings have changed since last time
+        """
         strict_mode = settings.get(settings.atw_strict_mode)
         start_date = settings.get(settings.atw_start_date)
-
-        heroes = list(filter(lambda x:x['InPool'] == True, asset_utils.hero_list))
-        heroes.sort(key = lambda x:x["Name"])
-
-        # Filter to relevant timeframe
-        filtered_df = df[df["Timestamp"] >= start_date]
-        filtered_df.reset_index()
-
-        for hero_dict in heroes:
-            hero = hero_dict['Name']
-            if strict_mode:
-                if hero != "Mask":
-                    hero_games_df = filtered_df[
-                    ((filtered_df["StartingHero"] == hero) & (filtered_df["EndingHero"] == hero))]
-                else:
-                    hero_games_df = filtered_df[(filtered_df["StartingHero"] == "Mask")]
-            else:
-                hero_games_df = filtered_df[
-                    (filtered_df["StartingHero"] == hero)]
-            
-            
-            hero_games_df.reset_index()
-            wins = hero_games_df[hero_games_df["Placement"] == 1]
-            if len(wins) > 0:
-                first_win = int(wins.index[0].astype(int))+1
-                pre_win = hero_games_df.loc[0:first_win+1]
-                if strict_mode:
-                    attempts = len(pre_win.loc[(pre_win["StartingHero"] == hero) & (pre_win["EndingHero"] == hero)])
-                else:
-                    attempts = len(pre_win.loc[(pre_win["StartingHero"] == hero)])
-                winners.append([hero, len(hero_games_df), len(wins), first_win, attempts])
-            else:
-                yet_to_win.append([hero, len(hero_games_df)])
-        
-        #winners_df = pd.DataFrame(winners, columns = ['Hero', 'Total Plays', 'Wins', 'First Win', 'Attempts'])
-        #yet_to_win_df = pd.DataFrame(yet_to_win, columns = ['Hero', 'Attempts'])
-
-        return winners, yet_to_win
+        key = (self.version, strict_mode, start_date)
+        if self.atw_cache is None or self.atw_cache[0] != key:
+            winners, yet_to_win = around_the_world_stats(self.df, strict_mode, start_date)
+            self.atw_cache = (key, {row[0]: row for row in winners}, {row[0]: row for row in yet_to_win})
+        return self.atw_cache[1], self.atw_cache[2]
 
     def filter(self, start_date, end_date, sort_col: int, sort_asc: bool):
-        df = self.df
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'], format="%Y-%m-%d")
-        if str(start_date) <= "1973-01-01":
-            return self.generate_stats(sort_col, sort_asc)
-        else:
-            filtered = df[(df['Timestamp'] >= start_date) & (df['Timestamp'] <= end_date)]
-            return self.generate_stats(sort_col, sort_asc, filtered)
+        #  sorting, or switching between starting and ending heroes, only re-sorts the rows from last time
+        key = (self.version, str(start_date), str(end_date))
+        if self.stats_cache is None or self.stats_cache[0] != key:
+            if str(start_date) <= "1973-01-01":
+                start_date = end_date = None
+            unsorted = [self.aggregates.hero_stats(hero_type, start_date, end_date) for hero_type in hero_columns]
+            self.stats_cache = (key, unsorted)
+        return sort_stats(self.stats_cache[1], sort_col, sort_asc)
 
 
     def get_stats_for_hero(self, start_date, end_date, hero_name):
-        df = self.df
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'], format="%Y-%m-%d")
-        df = df[(df['Timestamp'] >= start_date) & (df['Timestamp'] <= end_date)]
-        hero_df = df.loc[df['StartingHero'] == hero_name]
-        avg_place = round(pd.to_numeric(hero_df['Placement']).mean(), 2)
+        totals = self.aggregates.totals('StartingHero', start_date, end_date).get(hero_name, HeroAggregate())
+        avg_place = totals.average_placement()
         avg_place = 0.00 if np.isnan(avg_place) else avg_place
-        num_matches = len(hero_df)
-        histogram = np.histogram(pd.to_numeric(hero_df['Placement']), bins=range(1, 10))
+        num_matches = totals.matches
+        histogram = (totals.histogram, np.arange(1, 10))
         return avg_place, num_matches, histogram
 
 
     def delete_entry(self, row, reverse=False):
-        index = len(self.df.index) - row - 1 if reverse else row
-        self.df = self.df.drop(self.df.index[index])
-
-    def import_matches(self, progress_handler=None):
-        save_dir = paths.sbb_root
-        filenames = save_dir.glob("record_*.txt")
-        sorted_by_recent = sorted(filenames, key=os.path.getctime)
-        i = 0
+        with self.lock:
+            index = len(self.df.index) - row - 1 if reverse else row
+            self.record_deletions([self.df['SessionId'].iloc[index]])
+            self.store.delete(self.row_ids.pop(index))
+            self.aggregates.remove(*self.df.iloc[index][stats_columns[:5]].tolist())
+            self.df = self.df.drop(self.df.index[index])
+            self.version += 1
+
+    def record_deletions(self, session_ids):
+        """ Keep deleted matches from being imported again, called with the lock held """
+        manifest = ImportManifest()
+        manifest.deleted.update(str(session_id) for session_id in session_ids)
+        manifest.save()
+
+    def import_matches(self, progress_handler=None, max_workers=None, settle_time=0, reimport=False):
+        """
+        Extracts the matches from the record files in a pool of processes, then adds them all at once, oldest first.
+        Files the import manifest has seen before are skipped, and so are matches that have been deleted from the stats.
+        @param progress_handler: called with (files done, number of files - 1) as each file is extracted, returning
+        True cancels the import, the matches extracted by then are still added
+        @param max_workers: the number of processes, defaults to the number of CPUs
+        @param settle_time: files written to more recently than this many seconds ago are left for a later import
+        @param reimport: bring back the matches that are missing from the stats, deleted ones included
+        @return: the number of matches added
+        """
+        sorted_by_recent = sorted(record_files(), key=os.path.getctime)
+        unsettled = set(unsettled_record_files(settle_time)) if settle_time else set()
+        manifest = ImportManifest()
+        session_ids = set(self.df['SessionId'].values)
+        to_import = []
+        stats = []
         for game in sorted_by_recent:
-            match = extract_endgame_stats_from_record_file(game)
-            if match:
-                # print(match)
-                self.update_stats(*match)
-            if progress_handler:
-                progress_handler(i, len(sorted_by_recent) - 1)
-                i += 1
+            if game in unsettled:
+                continue
+            stat = os.stat(game)
+            result = manifest.get(game, stat)
+            if result is None or (reimport and result != ImportManifest.REJECTED and result not in session_ids):
+                to_import.append(game)
+                stats.append(stat)
+        matches = [None] * len(to_import)
+        if to_import:
+            #  not worth starting processes for the one new file after a match
+            executor = ProcessPoolExecutor(max_workers=max_workers) if len(to_import) > 1 else ThreadPoolExecutor(1)
+            with executor:
+                futures = {executor.submit(extract_endgame_stats_from_record_file, game): index
+                           for index, game in enumerate(to_import)}
+                for i, future in enumerate(as_completed(futures)):
+                    index = futures[future]
+                    try:
+                        matches[index] = future.result()
+                        manifest.set(to_import[index], stats[index], matches[index][4] if matches[index] else
+                                     ImportManifest.REJECTED)
+                    except Exception:
+                        #  left out of the manifest so it's tried again next time
+                        logging.exception(f"Couldn't import {to_import[index]}")
+                    if progress_handler and progress_handler(i, len(to_import) - 1):
+                        #  the files that weren't started are left out of the manifest too
+                        executor.shutdown(cancel_futures=True)
+                        break
+        elif progress_handler:
+            progress_handler(0, 0)
+        with self.lock:
+            #  matches deleted while the files were being extracted
+            manifest.deleted.update(ImportManifest().deleted)
+            matches = [match for match in matches if match and (reimport or match[4] not in manifest.deleted)]
+            added = self._add_matches(matches)
+            manifest.deleted.difference_update(match[4] for match in matches)
+            manifest.save()
+        return added
 
     def save_match_info(self, match_info, session_id):
         match_file = paths.matches_dir.joinpath(f"{session_id}.json")
@@ -294,12 +757,14 @@ class PlayerStats:
             json.dump(match_info, f)
 
 
+#  the only actions the endgame stats need, every other action is skipped over without being decoded
+ENDGAME_ACTIONS = {action_id for action_id, action_name in id_to_action_name.items()
+                   if action_name in (log_parser.EVENT_ADDPLAYER, log_parser.EVENT_CONNINFO,
+                                      log_parser.EVENT_ENTERRESULTSPHASE)}
+
+
 def extract_endgame_stats_from_record_file(filename):
-    with open(filename, 'rb') as f:
-        result = GreedyRange(STRUCT_ACTION).parse_stream(f)
-        remaining_binary_contents = f.read()
-    if len(remaining_binary_contents) != 0:
-        return
+    reader = RecordReader(filename)
     starting_hero = None
     ending_hero = None
     mmr_change = 0
@@ -312,7 +777,7 @@ def extract_endgame_stats_from_record_file(filename):
     hero_names = set()
     bot_game = False
 
-    for record in result:
+    for record in reader.actions(only=ENDGAME_ACTIONS):
         action_name = id_to_action_name[record.action_id]
         if action_name in log_parser.EVENT_ADDPLAYER:
             hero_names.add(asset_utils.get_card_name(str(record.template_id)))
@@ -329,6 +794,8 @@ def extract_endgame_stats_from_record_file(filename):
         if game_over and action_name in log_parser.EVENT_ADDPLAYER and player_id == record.player_id:
             ending_hero = asset_utils.get_card_name(str(record.template_id))
             placement = record.place
+    if reader.remaining != 0:
+        return
     results = (starting_hero, ending_hero, placement, mmr_change, session_id, timestamp)
     if all(result is not None and results != "" for result in results) and not bot_game:
         return results
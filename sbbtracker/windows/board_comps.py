@@ -185,20 +185,20 @@ class BoardComp(QWidget):
         painter.eraseRect(QRect(0, 0, 1350, 820))
         self.draw_hero(painter)
         if self.composition is not None:
-            for action in self.composition:
-                if action.zone != "Hero" and action.zone != 'NONE' and action.zone != "Hand":
-                    #  skip hero because we handle it elsewhere
-                    #  spells broke
-                    slot = action.slot
-                    zone = action.zone
-                    position = 10 if zone == 'Spell' else (7 + int(slot)) if zone == "Treasure" else slot
-                    subtypes = action.subtypes if action.subtypes is not None else asset_utils.get_subtypes(action.content_id)
-                    self.update_card(painter, position, action.content_id, action.cardhealth,
-                                     action.cardattack, action.is_golden, subtypes, action.counter)
-                elif action.zone == "Hero" and action.counter and int(action.counter) > 0:
-                    hero_loc = self.get_image_location(11)
-                    quest_loc = tuple(map(operator.add, hero_loc, hero_quest_loc))
-                    self.draw_quest(painter, action.counter, quest_loc, .30)
+            board = self.composition
+            positions = [(slot, card) for slot, card in enumerate(board.characters)]
+            positions += [(7 + slot, card) for slot, card in enumerate(board.treasures)]
+            positions.append((10, board.spell))
+            for position, card in positions:
+                if card is not None:
+                    subtypes = card.subtypes if card.subtypes is not None else asset_utils.get_subtypes(card.content_id)
+                    self.update_card(painter, position, card.content_id, card.cardhealth,
+                                     card.cardattack, card.is_golden, subtypes, card.counter)
+            hero = board.hero
+            if hero is not None and hero.counter and int(hero.counter) > 0:
+                hero_loc = self.get_image_location(11)
+                quest_loc = tuple(map(operator.add, hero_loc, hero_quest_loc))
+                self.draw_quest(painter, hero.counter, quest_loc, .30)
         last_seen_text = ""
         if self.last_seen is not None:
             if self.last_seen == 0:
@@ -26,7 +26,7 @@ from sbbtracker.utils.qt_utils import open_url
 from sbbtracker.utils.sbb_logic_utils import round_to_xp
 from sbbtracker.windows.constants import default_bg_color, primary_color
 from sbbtracker.windows.overlays import BoardComp, OverlayWindow, StreamableMatchDisplay, StreamerOverlayWindow
-from sbbtracker.windows.settings_window import SettingsWindow
+from sbbtracker.windows.settings_window import RecordWatcher, SettingsWindow
 from sbbtracker.windows.shop_display import ShopDisplay
 
 matplotlib.use('Qt5Agg')
@@ -51,7 +51,8 @@ from PySide6.QtWidgets import (
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 
 from sbbtracker.utils import asset_utils
-from sbbtracker.parsers import log_parser
+from sbbtracker.parsers import log_parser, record_follower, tracing
+from sbbtracker.parsers.tracing import tracer
 
 from sbbbattlesim import from_state, simulate
 from sbbbattlesim.exceptions import SBBBSCrocException
@@ -190,95 +191,193 @@ class SimulationThread(QThread):
 
 class LogThread(QThread):
     round_update = Signal(int)
-    player_update = Signal(object, int)
+    player_update = Signal(list, int)
     comp_update = Signal(object, int)
     stats_update = Signal(str, object, str, object)
+    backlog_stats = Signal(list)
     player_info_update = Signal(graphs.LivePlayerStates)
-    health_update = Signal(object)
+    health_update = Signal(list)
     new_game = Signal(str)
-    update_card = Signal(object)
+    update_card = Signal(list)
     end_combat = Signal(bool)
     hero_discover = Signal(list)
+    events = {log_parser.EVENT_PRESENTHERODISCOVER}
+
+    def __init__(self, *consumer_events):
+        super(LogThread, self).__init__()
+        self.consumer_events = consumer_events
+        self.round_number = 0
+        self.current_player = None
+        self.states = graphs.LivePlayerStates()
+        self.matchmaking = None
+        self.game_mode = None
+        self.after_first_combat = False
+        self.session_id = None
+        self.build_id = None
+        self.match_data = {}
+        self.combats = []
+        self.catching_up = False
+        #  the games that finished in the backlog, recorded together once it's been caught up on
+        self.backlog_games = []
+        #  what the current game looks like, for catching up
+        self.players = {}
+        self.boards = {}
+        self.cards = {}
+        self.hero_choices = None
+        self.game_over = False
 
     def run(self):
         queue = Queue()
-        threading.Thread(target=log_parser.run,
+        #  the record files give the same updates as the log
+        source = record_follower.run if settings.get(settings.track_from_records) else log_parser.run
+        threading.Thread(target=source,
                          args=(
                              queue,),
+                         kwargs={"events": self.events.union(*self.consumer_events)},
                          daemon=True).start()
-        round_number = 0
-        current_player = None
-        counter = 0
-        states = graphs.LivePlayerStates()
-        matchmaking = None
-        after_first_combat = False
-        session_id = None
-        build_id = None
-        match_data = {}
-        combats = []
         while True:
-            update = queue.get()
-            job = update.job
-            state = update.state
-            if job == log_parser.JOB_MATCHMAKING:
-                matchmaking = state.game_mode
-            elif job == log_parser.JOB_NEWGAME and state.session_id != session_id:
-                states.clear()
-                match_data.clear()
-                current_player = None
-                round_number = 0
-                self.new_game.emit(matchmaking)
-                self.round_update.emit(0)
-                matchmaking = None
-                after_first_combat = False
-                session_id = state.session_id
-                build_id = state.build_id
-                combats.clear()
-                match_data.clear()
-            elif job == log_parser.JOB_HERODISCOVER:
-                if round_number < 1:
-                    self.hero_discover.emit(state.choices)
-            elif job == log_parser.JOB_ROUNDINFO:
-                round_number = state.round_num
-                self.round_update.emit(round_number)
-            elif job == log_parser.JOB_PLAYERINFO:
-                self.player_update.emit(state, round_number)
-                xp = f"{state.level}.{state.experience}"
-                states.update_player(state.playerid, round_number, state.health, xp,
-                                     asset_utils.get_card_name(state.heroid), state.heroid)
-                if state.current_player:
-                    current_player = state
-                    settings.set_(settings.player_id, state.playerid)
-                self.player_info_update.emit(states)
-                if after_first_combat:
-                    self.end_combat.emit(False)
-                if not after_first_combat:
-                    after_first_combat = True
-            elif job == log_parser.JOB_BOARDINFO:
-                self.comp_update.emit(state, round_number)
-
-                combat = from_state(state)
-                combat["round"] = round_number
-                combats.append(combat)
-            elif job == log_parser.JOB_ENDCOMBAT:
-                counter = 0
-            elif job == log_parser.JOB_ENDGAME:
-                self.end_combat.emit(True)
-                if state and current_player and session_id and build_id:
-                    match_data["tracker-id"] = api_id
-                    match_data["tracker-version"] = version.__version__
-                    match_data["player-id"] = current_player.playerid
-                    match_data["display-name"] = current_player.displayname
-                    match_data["match-id"] = session_id
-                    match_data["build-id"] = build_id
-                    match_data["combat-info"] = combats
-                    match_data["placement"] = state.place
-                    match_data["players"] = states.json_friendly()
-                    self.stats_update.emit(states.ids_to_heroes[current_player.playerid][0], state, session_id, match_data)
-            elif job == log_parser.JOB_HEALTHUPDATE:
-                self.health_update.emit(state)
-            elif job == log_parser.JOB_CARDUPDATE:
-                self.update_card.emit(state)
+            # the parser sends a batch per read of the log, with runs of player, health and card updates merged
+            batch = queue.get()
+            if batch[0].job == log_parser.JOB_TRACE:
+                start = time.perf_counter()
+                tracer.record(tracing.STAGE_QUEUE_WAIT, start - batch[0].state)
+                self.process_batch(batch[1:])
+                tracer.record(tracing.STAGE_GUI_EMIT, time.perf_counter() - start)
+            else:
+                self.process_batch(batch)
+
+    def process_batch(self, batch):
+        for update in batch:
+            if update.job == log_parser.JOB_CATCHUP:
+                self.catch_up(update.state)
+            else:
+                self.process(update)
+
+    def process(self, update):
+        job = update.job
+        state = update.state
+        if job == log_parser.JOB_MATCHMAKING:
+            self.matchmaking = state.game_mode
+        elif job == log_parser.JOB_NEWGAME and state.session_id != self.session_id:
+            self.states.clear()
+            self.match_data.clear()
+            self.current_player = None
+            self.round_number = 0
+            self.new_game.emit(self.matchmaking)
+            self.round_update.emit(0)
+            self.game_mode = self.matchmaking
+            self.matchmaking = None
+            self.after_first_combat = False
+            self.session_id = state.session_id
+            self.build_id = state.build_id
+            self.combats.clear()
+            self.match_data.clear()
+            self.players.clear()
+            self.boards.clear()
+            self.cards.clear()
+            self.hero_choices = None
+            self.game_over = False
+        elif job == log_parser.JOB_HERODISCOVER:
+            if self.round_number < 1:
+                self.hero_choices = state.choices
+                self.hero_discover.emit(state.choices)
+        elif job == log_parser.JOB_ROUNDINFO:
+            self.round_number = state.round_num
+            self.hero_choices = None
+            self.round_update.emit(self.round_number)
+        elif job == log_parser.JOB_PLAYERINFO:
+            for player in state:
+                xp = f"{player.level}.{player.experience}"
+                self.states.update_player(player.playerid, self.round_number, player.health, xp,
+                                          asset_utils.get_card_name(player.heroid), player.heroid)
+                if player.current_player:
+                    self.current_player = player
+                    settings.set_(settings.player_id, player.playerid)
+                self.players[player.playerid] = player
+            self.player_update.emit(state, self.round_number)
+            self.player_info_update.emit(self.states)
+            if self.after_first_combat:
+                self.end_combat.emit(False)
+            self.after_first_combat = True
+        elif job == log_parser.JOB_BOARDINFO:
+            self.comp_update.emit(state, self.round_number)
+            for playerid in state:
+                self.boards.pop(playerid, None)
+                self.boards[playerid] = (state, self.round_number)
+
+            combat = from_state(state)
+            combat["round"] = self.round_number
+            self.combats.append(combat)
+        elif job == log_parser.JOB_ENDGAME:
+            self.game_over = True
+            self.end_combat.emit(True)
+            current_player = self.current_player
+            if state and current_player and self.session_id and self.build_id:
+                self.match_data["tracker-id"] = api_id
+                self.match_data["tracker-version"] = version.__version__
+                self.match_data["player-id"] = current_player.playerid
+                self.match_data["display-name"] = current_player.displayname
+                self.match_data["match-id"] = self.session_id
+                self.match_data["build-id"] = self.build_id
+                self.match_data["combat-info"] = self.combats
+                self.match_data["placement"] = state.place
+                self.match_data["players"] = self.states.json_friendly()
+                starting_hero = self.states.ids_to_heroes[current_player.playerid][0]
+                if self.catching_up:
+                    #  the match data is cleared for the next game, so the backlog keeps a copy
+                    self.backlog_games.append((starting_hero, state, self.session_id,
+                                               {**self.match_data, "combat-info": list(self.combats)}, self.game_mode))
+                else:
+                    self.stats_update.emit(starting_hero, state, self.session_id, self.match_data)
+        elif job == log_parser.JOB_HEALTHUPDATE:
+            for player in state:
+                self.players[player.playerid] = player
+            self.health_update.emit(state)
+        elif job == log_parser.JOB_CARDUPDATE:
+            for card in state:
+                self.cards[(card.playerid, card.zone, card.slot)] = card
+            self.update_card.emit(state)
+
+    def catch_up(self, updates):
+        """
+        Go through the backlog of the log keeping track of the games without redrawing anything, then show the GUI
+        where the current game is at
+        """
+        self.catching_up = True
+        self.backlog_games = []
+        self.blockSignals(True)
+        try:
+            for update in updates:
+                self.process(update)
+        finally:
+            self.blockSignals(False)
+            self.catching_up = False
+        if self.backlog_games:
+            #  games that finished in the backlog still need to be recorded
+            self.backlog_stats.emit(self.backlog_games)
+            self.backlog_games = []
+        if self.session_id is None:
+            return
+
+        self.new_game.emit(self.game_mode)
+        self.round_update.emit(self.round_number)
+        players = list(self.players.values())
+        if players:
+            self.player_update.emit(players, self.round_number)
+            self.player_info_update.emit(self.states)
+            self.health_update.emit(sorted(players, key=lambda player: int(player.place)))
+        #  each player's last seen board, from the brawls they were last seen in
+        brawls = {}
+        for board, round_number in self.boards.values():
+            brawls[id(board)] = (board, round_number)
+        for board, round_number in brawls.values():
+            self.comp_update.emit(board, round_number)
+        if self.cards:
+            self.update_card.emit(list(self.cards.values()))
+        if self.hero_choices:
+            self.hero_discover.emit(self.hero_choices)
+        if self.game_over:
+            self.end_combat.emit(True)
 
 
 class SBBTracker(QMainWindow):
@@ -298,6 +397,7 @@ class SBBTracker(QMainWindow):
         self.shop_display = ShopDisplay()
         if settings.get(settings.show_id_window):
             self.shop_display.show()
+        tracer.enabled = settings.get(settings.trace_log_parser)
 
         self.overlay = OverlayWindow(self)
         self.streamer_overlay = StreamerOverlayWindow(self)
@@ -333,6 +433,10 @@ class SBBTracker(QMainWindow):
         self.stats_graph = StatsGraph(self.player_stats)
         self.hero_selection = HeroSelection(self)
         self.around_the_world = AroundTheWorld(self, self.player_stats)
+        self.record_watcher = RecordWatcher(self.player_stats, self)
+        self.record_watcher.imported.connect(self.match_history.update_history_table)
+        self.record_watcher.imported.connect(self.match_history.update_stats_table)
+        self.record_watcher.set_enabled(settings.get(settings.auto_import_records))
 
         main_tabs = QTabWidget()
         main_tabs.addTab(comps_widget, tr("Board Comps"))
@@ -404,16 +508,17 @@ class SBBTracker(QMainWindow):
         self.github_updates = updater.UpdateCheckThread()
         self.github_updates.github_update.connect(self.handle_update)
 
-        self.log_updates = LogThread()
+        self.log_updates = LogThread(ShopDisplay.events)
         self.log_updates.comp_update.connect(self.update_comp)
-        self.log_updates.player_update.connect(self.update_player)
+        self.log_updates.player_update.connect(self.update_players)
         self.log_updates.round_update.connect(self.update_round_num)
         self.log_updates.stats_update.connect(self.update_stats)
+        self.log_updates.backlog_stats.connect(self.update_backlog_stats)
         self.log_updates.player_info_update.connect(self.live_graphs.update_graph)
         self.log_updates.new_game.connect(self.new_game)
         self.log_updates.health_update.connect(self.update_health)
         self.log_updates.end_combat.connect(self.end_combat)
-        self.log_updates.update_card.connect(self.shop_display.update_card)
+        self.log_updates.update_card.connect(self.shop_display.update_cards)
         self.log_updates.hero_discover.connect(self.update_hero_discover)
 
         self.board_queue = Queue()
@@ -484,6 +589,11 @@ class SBBTracker(QMainWindow):
         self.overlay.update_round(round_number)
         self.overlay.hide_hero_rates()
 
+    def update_players(self, players, round_number):
+        for player in players:
+            self.update_player(player, round_number)
+        self.update()
+
     def update_player(self, player, round_number):
         if player.current_player:
             self.current_player = player
@@ -498,7 +608,6 @@ class SBBTracker(QMainWindow):
         comp.player = player
         comp.current_round = round_number
         self.overlay.update_player(index, player.health, f"{player.level}.{player.experience}", round_number, player.place)
-        self.update()
 
     def update_comp(self, state, round_number):
         for player_id in state:
@@ -507,11 +616,7 @@ class SBBTracker(QMainWindow):
             comp = self.get_comp(index)
 
             player = comp.player
-            board_player = None
-            for char in board:
-                if char.zone == "Hero":
-                    board_player = char
-                    break
+            board_player = board.hero
             if player and board_player:
                 board_player.level = player.level
             elif board_player:
@@ -535,33 +640,61 @@ class SBBTracker(QMainWindow):
                                       settings.get(settings.number_threads, 3), round_number))
 
     def update_stats(self, starting_hero: str, player, session_id: str, match_data):
-        if settings.get(settings.upload_data) and self.matchmaking_mode == "Normal" and session_id not in self.player_stats.df['SessionId'].values:
+        match = self.record_match(starting_hero, player, session_id, match_data, self.matchmaking_mode,
+                                  self.sim_results)
+        if match:
+            self.save_matches([(match, match_data)])
+
+    def update_backlog_stats(self, games):
+        """ Record the games that finished in the backlog of the log, saving them all at once """
+        matches = []
+        for starting_hero, player, session_id, match_data, matchmaking_mode in games:
+            match = self.record_match(starting_hero, player, session_id, match_data, matchmaking_mode)
+            if match:
+                matches.append((match, match_data))
+        self.save_matches(matches)
+
+    def record_match(self, starting_hero: str, player, session_id: str, match_data, matchmaking_mode, sim_results=None):
+        """
+        Upload the match if it's one to upload, and return the match to add to the stats, or None if it isn't one to
+        save
+        """
+        if settings.get(settings.upload_data) and matchmaking_mode == "Normal" and session_id not in self.player_stats.df['SessionId'].values:
             # upload only matchmade games
-            for round_num in self.sim_results:
+            for round_num in sim_results or {}:
                 index = round_num - 1
                 if "combat-info" in match_data and index < len(match_data["combat-info"]):
-                    match_data["combat-info"][index]["sim-results"] = self.sim_results[round_num]
+                    match_data["combat-info"][index]["sim-results"] = sim_results[round_num]
             upload_data(match_data)
         track99 = settings.get(settings.track_sbb99);
         if settings.get(settings.save_stats, True) and (
-                not settings.get(settings.matchmaking_only) or self.matchmaking_mode == "Normal" or (self.matchmaking_mode == "SBB99" and track99)):
+                not settings.get(settings.matchmaking_only) or matchmaking_mode == "Normal" or (matchmaking_mode == "SBB99" and track99)):
             place = player.place if int(player.health) <= 0 else "1"
-            self.player_stats.update_stats(starting_hero, asset_utils.get_card_name(player.heroid),
-                                           place, player.mmr, session_id)
+            return starting_hero, asset_utils.get_card_name(player.heroid), place, player.mmr, session_id, None
+        return None
+
+    def save_matches(self, matches):
+        """ Add the (match, match data) pairs to the stats in one go, then update the tables once """
+        if not matches:
+            return
+        self.player_stats.add_matches([match for match, _ in matches])
+        for match, match_data in matches:
             if match_data:
-                self.player_stats.save_match_info(match_data, session_id)
-            self.match_history.update_history_table()
-            self.match_history.update_stats_table()
-            self.around_the_world.update_tables()
-            if settings.get(settings.streamable_score_list):
-                self.streamable_scores.add_score(place)
+                self.player_stats.save_match_info(match_data, match[4])
+        self.match_history.update_history_table()
+        self.match_history.update_stats_table()
+        self.around_the_world.update_tables()
+        if settings.get(settings.streamable_score_list):
+            for match, _ in matches:
+                self.streamable_scores.add_score(match[2])
 
-    def update_health(self, player):
-        index = self.get_player_index(player.playerid)
-        new_place = int(player.place)
+    def update_health(self, players):
         places = self.overlay.places
-        places.remove(index)
-        places.insert(new_place - 1, index)
+        for player in players:
+            index = self.get_player_index(player.playerid)
+            new_place = int(player.place)
+            places.remove(index)
+            places.insert(new_place - 1, index)
 
     def end_simulation(self, win, tie, loss, win_dmg, loss_dmg, round_num):
         self.sim_results[round_num] = {"win-percent": win, "tie-percent": tie, "loss-percent": loss, "win-dmg": win_dmg, "loss-dmg": loss_dmg}
@@ -1030,20 +1163,17 @@ class HeroSelection(QWidget):
 
     def update_heroes(self, hero_ids, player_stats: stats.PlayerStats, overlay):
         hero_names = []
+        winners, yet_to_win = player_stats.around_the_world_lookup()
         for i in range(0, 4):
             hero_id = hero_ids[i]
             hero_name = asset_utils.get_card_name(hero_id)
             hero_names.append(hero_name)
             placement, matches, histogram = player_stats.get_stats_for_hero(*get_date_range(settings.get(settings.filter_)), hero_name)
             win_status = None
-            win_list, to_win_list = player_stats.generate_around_the_world_stats()
-            for record in win_list:
-                if record[0] == hero_name:
-                    win_status = f"{record[2]} wins"
-            if win_status == None:
-                for record in to_win_list:
-                    if record[0] == hero_name:
-                        win_status = f"{record[1]} attempts"
+            if hero_name in winners:
+                win_status = f"{winners[hero_name][2]} wins"
+            elif hero_name in yet_to_win:
+                win_status = f"{yet_to_win[hero_name][1]} attempts"
 
             self.heroes[i].update_hero(placement, matches, histogram, hero_id, win_status)
             overlay.update_hero_rates(i, placement, matches, win_status)
@@ -2,7 +2,7 @@ import re
 from datetime import date
 
 import PySide6
-from PySide6.QtCore import QThread, Signal
+from PySide6.QtCore import QFileSystemWatcher, QObject, QThread, QTimer, Signal
 from PySide6.QtGui import QIcon, QIntValidator, Qt
 from PySide6.QtWidgets import QCheckBox, QComboBox, QFormLayout, QFrame, QHBoxLayout, QLabel, QLineEdit, QMainWindow, \
     QMessageBox, QProgressDialog, QPushButton, QScrollArea, \
@@ -11,8 +11,9 @@ from PySide6.QtWidgets import QCheckBox, QComboBox, QFormLayout, QFrame, QHBoxLa
     QVBoxLayout, \
     QWidget
 
-from sbbtracker import graphs, languages, settings, stats, version
+from sbbtracker import graphs, languages, paths, settings, stats, version
 from sbbtracker.languages import tr
+from sbbtracker.parsers.tracing import tracer
 from sbbtracker.utils import asset_utils
 from sbbtracker.windows.constants import primary_color
 
@@ -20,12 +21,77 @@ from sbbtracker.windows.constants import primary_color
 class ImportThread(QThread):
     update_progress = Signal(int, int)
 
-    def __init__(self, player_stats: stats.PlayerStats):
+    def __init__(self, player_stats: stats.PlayerStats, settle_time=0, reimport=False):
         super(ImportThread, self).__init__()
         self.player_stats = player_stats
+        self.settle_time = settle_time
+        self.reimport = reimport
+        self.added = 0
+        self.cancelled = False
 
     def run(self):
-        self.player_stats.import_matches(self.update_progress.emit)
+        self.added = self.player_stats.import_matches(self.report_progress, settle_time=self.settle_time,
+                                                      reimport=self.reimport)
+
+    def report_progress(self, num, totalsize):
+        self.update_progress.emit(num, totalsize)
+        return self.cancelled
+
+    def cancel(self):
+        """ Stop the import once the files being extracted are done, keeping the matches extracted so far """
+        self.cancelled = True
+
+
+class RecordWatcher(QObject):
+    """
+    Watches the Storybook Brawl folder and imports the record files that show up, a little while after they do. The
+    file of a match that's still being played is left until the game has stopped writing to it for SETTLE_TIME.
+    """
+    imported = Signal()
+    #  milliseconds from a change to the folder to the import
+    IMPORT_DELAY = 10000
+    #  seconds, longer than the game goes without writing to the record file during a match
+    SETTLE_TIME = 60
+
+    def __init__(self, player_stats: stats.PlayerStats, parent=None):
+        super().__init__(parent)
+        self.player_stats = player_stats
+        self.import_thread = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_import)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.import_records)
+
+    def set_enabled(self, enabled):
+        directories = self.watcher.directories()
+        if enabled and not directories and paths.sbb_root.exists():
+            self.watcher.addPath(str(paths.sbb_root))
+            #  pick up anything written while we weren't watching
+            self.schedule_import()
+        elif not enabled and directories:
+            self.watcher.removePaths(directories)
+            self.timer.stop()
+
+    def schedule_import(self, *args):
+        #  not restarted on every change, the game keeps writing to the folder during a match
+        if not self.timer.isActive():
+            self.timer.start(self.IMPORT_DELAY)
+
+    def import_records(self):
+        if self.import_thread is not None and self.import_thread.isRunning():
+            self.schedule_import()
+            return
+        self.import_thread = ImportThread(self.player_stats, self.SETTLE_TIME)
+        self.import_thread.finished.connect(self.import_finished)
+        self.import_thread.start()
+
+    def import_finished(self):
+        if self.import_thread.added:
+            self.imported.emit()
+        if self.watcher.directories() and stats.unsettled_record_files(self.SETTLE_TIME):
+            #  come back for the file the game was still writing, there may be no more changes to wake us
+            self.timer.start(self.SETTLE_TIME * 1000)
 
 
 class NoScrollSlider(QSlider):
@@ -203,12 +269,14 @@ and Lunco
         reimport_button.clicked.connect(self.import_stats)
 
         enable_upload = SettingsCheckbox(settings.upload_data)
+        auto_import = SettingsCheckbox(settings.auto_import_records)
 
         data_layout.addRow(self.last_backed_up, backup_button)
         data_layout.addWidget(export_button)
         data_layout.addWidget(delete_button)
         data_layout.addWidget(QLabel(tr("Reimporting is temporarily disabled")))
         data_layout.addWidget(reimport_button)
+        data_layout.addRow(tr("Import new record files automatically"), auto_import)
         data_layout.addRow(tr("Upload matches to sbbtracker.com"), enable_upload)
         data_layout.addWidget(QLabel(tr("Match uploads include your steam name, sbb id, board comps, placement, and change in mmr.")))
 
@@ -297,6 +365,10 @@ and Lunco
         enable_export_comp_checkbox = SettingsCheckbox(settings.export_comp_button)
         show_id_mode = SettingsCheckbox(settings.show_ids)
         show_id_window = SettingsCheckbox(settings.show_id_window)
+        trace_log_parser = SettingsCheckbox(settings.trace_log_parser)
+        track_from_records = SettingsCheckbox(settings.track_from_records)
+        parser_timings = QPushButton(tr("Show"))
+        parser_timings.clicked.connect(self.show_parser_timings)
         atw_strict_mode = SettingsCheckbox(settings.atw_strict_mode)
 
         atw_start_date = QPushButton("Reset")
@@ -307,6 +379,9 @@ and Lunco
         advanced_layout.addRow(tr("Enable export last comp button"), enable_export_comp_checkbox)
         advanced_layout.addRow(tr("Hide art and show template ids"), show_id_mode)
         advanced_layout.addRow(tr("Enable ID window"), show_id_window)
+        advanced_layout.addRow(tr("Time the log parser"), trace_log_parser)
+        advanced_layout.addRow(tr("Log parser timings"), parser_timings)
+        advanced_layout.addRow(tr("Track games from record files (restart to take effect)"), track_from_records)
         advanced_layout.addRow(tr("All Hero Challenge No Dream Mode"), atw_strict_mode)
         advanced_layout.addRow(tr("Reset All Hero Challenge"), atw_start_date)
 
@@ -379,6 +454,8 @@ and Lunco
         self.hide()
 
         self.main_window.shop_display.show() if settings.get(settings.show_id_window) else self.main_window.shop_display.hide()
+        tracer.enabled = settings.get(settings.trace_log_parser)
+        self.main_window.record_watcher.set_enabled(settings.get(settings.auto_import_records))
         self.main_window.overlay.update_comp_scaling()
         self.main_window.streamer_overlay.update_comp_scaling()
         self.main_window.overlay.set_transparency()
@@ -400,6 +477,11 @@ and Lunco
         self.main_window.overlay.adv_simulation_stats.setVisible(settings.get(settings.enable_adv_sim_stats))
         self.main_window.export_comp_action.setVisible(settings.get(settings.export_comp_button))
 
+    def show_parser_timings(self):
+        timings_file = paths.sbbtracker_folder.joinpath("parser_timings.json")
+        tracer.dump(timings_file)
+        QMessageBox.information(self, tr("Log parser timings"), f"{tracer.summary()}\n\n{timings_file}")
+
     def import_stats(self):
         message = tr("""
 Would you like to import your old games? This is done by 
@@ -421,21 +503,24 @@ The importer may take a long time to complete. Please be patient.
 """)
         reply = QMessageBox.question(self, tr("Reimport Stats?"), message)
         if reply == QMessageBox.Yes:
-            self.import_thread = ImportThread(self.main_window.player_stats)
+            self.import_thread = ImportThread(self.main_window.player_stats, reimport=True)
             self.progress = QProgressDialog(tr("Import progress"), tr("Cancel"), 0, 100, self)
             self.progress.setWindowTitle(tr("Importer"))
             self.import_thread.update_progress.connect(self.handle_import_progress)
+            self.import_thread.finished.connect(self.main_window.match_history.update_history_table)
+            self.import_thread.finished.connect(self.main_window.match_history.update_stats_table)
             self.import_thread.start()
-            self.progress.canceled.connect(self.import_thread.terminate)
+            self.progress.canceled.connect(self.import_thread.cancel)
             self.progress.show()
-            self.main_window.match_history.update_history_table()
 
     def backup(self):
         stats.backup_stats(force=True)
         self.last_backed_up.setText(tr("Last backup date") + f": {stats.most_recent_backup_date()}")
 
     def handle_import_progress(self, num, totalsize):
-        import_percent = num * 100 / totalsize
+        if self.progress.wasCanceled():
+            return
+        import_percent = num * 100 / totalsize if totalsize else 100
         self.progress.setValue(import_percent)
         if num == totalsize:
             self.progress.close()
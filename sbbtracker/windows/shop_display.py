@@ -1,7 +1,11 @@
 from PySide6.QtWidgets import QLabel, QMainWindow, QVBoxLayout, QWidget
 
+from sbbtracker.parsers import log_parser
+
 
 class ShopDisplay(QMainWindow):
+    events = {log_parser.EVENT_UPDATECARD}
+
     def __init__(self):
         super().__init__()
         main_widget = QWidget()
@@ -17,6 +21,10 @@ class ShopDisplay(QMainWindow):
             template_id = state.content_id
             self.labels[int(slot)].setText(str(template_id))
 
+    def update_cards(self, states):
+        for state in states:
+            self.update_card(state)
+
     def clear(self):
         for ind, label in enumerate(self.labels):
             label.setText(f"Slot {ind}")
\ No newline at end of file
@@ -0,0 +1,359 @@
+"""
+Throughput benchmark for the Player.log tokenizer.
+
+Runs the current log_parser.process_line against the previous readuntil based
+implementation and Action conversion (kept below for reference) on either a real
+Player.log or a synthetic one, checks that both produce the same fields and reports
+events per second.
+
+Usage: python scripts/benchmark_log_parser.py [--log Player.log] [--lines 200000] [--repeat 3]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sbbtracker.parsers import log_parser  # noqa: E402
+
+
+#  The pre-tokenizer implementation
+
+def readuntil(string, substr, clean=True):
+    """Find substr, chop off all before and including, and return everything afterwards"""
+    find = string.find(substr)
+    if find == -1:
+        return string, ''
+
+    cut = find + len(substr)
+    car, cdr = string[:cut], string[cut:]
+    if clean:
+        car = car[:-1 * len(substr)]
+    return car, cdr
+
+
+def get_shortname(string):
+    shortname = string[:10]
+    currentplayer = string[10:13] == '<U>'
+    cdr = string[13:]
+    return shortname, currentplayer, cdr
+
+
+def process_fullname(string):
+    displayname = ''
+    _line = string[3:]
+    annoyingstr = '\'=='
+    while True:
+        _displayname, _line = readuntil(_line, annoyingstr)
+        displayname += _displayname
+        linefind = _line.find(annoyingstr)
+        if annoyingstr in _line and linefind < _line.find('Health:') and linefind < _line.find(
+                'Gold:') and linefind < _line.find('NextLevelXP'):
+            displayname += annoyingstr
+        else:
+            glg_id, _line = readuntil(_line, ' ')
+            break
+    return displayname, glg_id, _line
+
+
+def legacy_process_line(line):
+    dt = {}
+
+    event, _line = readuntil(line, ' ')
+    event = event.strip('[]')
+    dt['event'] = event
+    if event == log_parser.EVENT_CONNINFO:
+        line_data = line.split(' ')
+        session_id = line_data[1].split(':')[1]
+        build_id = line_data[2].split(':')[1]
+        return {**dt, **{'build_id': build_id, 'session_id': session_id}}
+    elif event in [log_parser.EVENT_ADDPLAYER, log_parser.EVENT_ENTERRESULTSPHASE]:
+        playerid, current_player, _line = get_shortname(_line)
+        displayname, glg_id, _line = process_fullname(_line)
+        heroid = None
+        mmr = None
+        while True:
+            data, _line = readuntil(_line, ' ')
+            if not data:
+                break
+            if heroid is None and '<' in data and '>' in data:
+                heroid = data.split('<')[0]
+            if not ':' in data:
+                continue
+
+            k, v = data.split(':')
+            v = v.strip()
+            if k == 'Health':
+                health = v
+            elif k == 'XP':
+                experience = v
+            elif k == 'Place':
+                place = v
+            elif k == 'Level':
+                level = v
+            elif k == 'Rank':
+                mmr = v
+
+        dt = {**dt,
+              **{'displayname': displayname, 'playerid': playerid, 'experience': experience, 'health': health,
+                 'place': place, 'level': level, 'heroid': heroid, 'current_player': current_player,
+                 'glg_id': glg_id}}
+        if event == log_parser.EVENT_ENTERRESULTSPHASE:
+            dt = {**dt, **{'mmr': mmr}}
+
+        return dt
+    elif event == log_parser.EVENT_ENTERBRAWLPHASE:
+        player1id, _, _line = get_shortname(_line)
+        _, _, _line = process_fullname(_line)
+        junk, _line = readuntil(_line, '--> ')
+        player2id, _, _line = get_shortname(_line)
+        return {**dt, **{'player1id': player1id, 'player2id': player2id}}
+    elif event == log_parser.EVENT_ENTERSHOPPHASE:
+        _, _, _line = get_shortname(_line)
+        _, _, _line = process_fullname(_line)
+        _, _line = readuntil(_line, '--> ')
+        _, _, _line = get_shortname(_line)
+        while True:
+            _line = _line.lstrip(' ')
+            data, _line = readuntil(_line, ' ')
+            if not data:
+                break
+            if not ':' in data:
+                continue
+
+            k, v = data.split(':')
+            v = v.strip()
+            if k == 'Round':
+                r = v
+                break
+
+        return {**dt, 'round': r}
+
+    elif event in [log_parser.EVENT_CREATECARD, log_parser.EVENT_UPDATECARD]:
+        is_golden = False
+        counter = -1
+        cardattack = None
+        cardhealth = None
+        subtypes = None
+
+        content_data, _line = readuntil(_line, ' ')
+        content_id = content_data.split('<')[0]
+
+        playerid, currentplayer, _line = get_shortname(_line)
+
+        _line = _line[1:]
+        zoneinfo, _line = readuntil(_line, ' ', clean=False)
+        zone, slotinfo = zoneinfo.split('[')
+        slot = slotinfo[:-2]
+
+        while True:
+            _line = _line.lstrip(' ')
+            data, _line = readuntil(_line, ' ')
+            if not data:
+                break
+            if '/' in data and not ':' in data:
+                try:
+                    _cardattack, _cardhealth = map(str.strip, data.split('/'))
+                    _cardattack = int(_cardattack)
+                    _cardhealth = int(_cardhealth)
+                    cardattack = _cardattack
+                    cardhealth = _cardhealth
+                except ValueError:
+                    pass
+            if not ':' in data:
+                continue
+
+            k, v = data.split(':')
+            v = v.strip()
+            if k == 'Subtypes':
+                subtypes = list(map(str.lower, v.split(',')))
+            elif k == 'Cost':
+                cost = v
+            elif k == 'Flags':
+                is_golden = 'G' in v
+            elif k == 'Counter':
+                counter = v
+
+        return {**dt, **{'is_golden': is_golden, 'counter': counter, 'content_id': content_id, 'playerid': playerid,
+                         'zone': zone, 'slot': slot, 'cardattack': cardattack, 'cardhealth': cardhealth,
+                         'subtypes': subtypes, 'cost': cost}}
+
+    elif event == log_parser.EVENT_PRESENTHERODISCOVER:
+        line_data = line.replace(', ', '  ').split(' ')
+        choices = []
+        for datum in line_data:
+            if log_parser.hero_choice_regex.match(datum):
+                choices.append(datum.split('<')[0])
+
+        dt = {**dt, **{'choices': choices}}
+
+    return dt
+
+
+def legacy_action_fields(dt):
+    """ The attributes the old Action class set from a tokenized line """
+    event = dt['event']
+    if event in [log_parser.EVENT_ADDPLAYER, log_parser.EVENT_ENTERRESULTSPHASE]:
+        fields = {'displayname': dt['displayname'].strip(), 'heroid': dt['heroid'], 'health': int(dt['health']),
+                  'playerid': dt['playerid'], 'place': dt['place'], 'experience': dt['experience'],
+                  'level': dt['level'], 'current_player': dt['current_player']}
+        if event == log_parser.EVENT_ENTERRESULTSPHASE:
+            fields['mmr'] = dt['mmr']
+    elif event == log_parser.EVENT_PRESENTHERODISCOVER:
+        fields = {'choices': dt['choices']}
+    elif event == log_parser.EVENT_ENTERBRAWLPHASE:
+        fields = {'player1': dt['player1id'], 'player2': dt['player2id']}
+    elif event in [log_parser.EVENT_CREATECARD, log_parser.EVENT_UPDATECARD]:
+        fields = {k: dt[k] for k in ['playerid', 'cardattack', 'cardhealth', 'is_golden', 'slot', 'zone', 'cost',
+                                     'subtypes', 'counter', 'content_id']}
+    elif event == log_parser.EVENT_ENTERSHOPPHASE:
+        fields = {'round_num': int(dt['round'])}
+    elif event == log_parser.EVENT_CONNINFO:
+        fields = {'session_id': dt['session_id'], 'build_id': dt['build_id']}
+    else:
+        fields = {}
+    fields['action_type'] = event
+    return fields
+
+
+def matches(record, fields):
+    return all(getattr(record, k, None) == v for k, v in fields.items())
+
+
+def legacy_event_lines(lines):
+    for line in lines:
+        if line.startswith('[RECV]'):
+            _, line = readuntil(line, ' ')
+            _, line = readuntil(line, ' ')
+            yield line
+
+
+def current_event_lines(lines):
+    for line in lines:
+        if line.startswith('[RECV]'):
+            pos = line.find(' ')
+            pos = line.find(' ', pos + 1) if pos != -1 else -1
+            yield line, len(line) if pos == -1 else pos + 1
+
+
+#  Synthetic log generation
+
+heroes = ['Gwen', 'PeterPants', 'SadDracula', 'TheFates', 'Apocalypse', 'FallenAngel', 'Geppetto', 'HoardDragon']
+cards = ['BabyRoot', 'GreedyGoblin', 'LordyLocks', 'Wombats', 'Medusa', 'Echowood', 'FallenAngel', 'Cupid']
+subtypes = ['Good', 'Evil', 'Dwarf', 'Animal,Treant', 'Monster,Dragon', 'Fairy']
+
+
+def shortname(player):
+    return f'Player{player:04d}'
+
+
+def player_line(event, player, current, extra=''):
+    marker = '<U>' if current else '   '
+    return (f"[RECV] 12:00:00 [{event}] {shortname(player)}{marker}=='Some O'Player {player}'==0123456789{player:06d} "
+            f"{heroes[player % len(heroes)]}<SBB_HERO_{player}> Health:{40 - player} Gold:3 XP:{player % 3} "
+            f"NextLevelXP:3 Level:{2 + player % 4} Place:{player + 1}{extra}\n")
+
+
+def card_line(event, player, slot, zone='Char'):
+    card = cards[(player + slot) % len(cards)]
+    flags = ' Flags:G' if slot % 3 == 0 else ''
+    return (f"[RECV] 12:00:01 [{event}] {card}<SBB_CHARACTER_{slot}> {shortname(player)}   :{zone}[{slot}] "
+            f"{slot + 1}/{slot + 2}  Cost:{slot % 6} Subtypes:{subtypes[slot % len(subtypes)]}{flags} Counter:-1\n")
+
+
+def synthetic_match(game):
+    lines = [f"[RECV] 12:00:00 [ActionConnectionInfo] SessionId:session-{game} BuildId:build-74 Server:127.0.0.1\n",
+             "[RECV] 12:00:00 [ActionPresentHeroDiscover] Choose: Gwen<SBB_HERO_GWEN>, PeterPants<SBB_HERO_PAN>, "
+             "SadDracula<SBB_HERO_DRACULA>, TheFates<SBB_HERO_FATES>\n"]
+    for round_num in range(1, 16):
+        lines += [player_line(log_parser.EVENT_ADDPLAYER, player, player == 0) for player in range(8)]
+        lines.append("[RECV] 12:00:00 [ActionModifyGold] Player0000 Gold:3\n")
+        lines.append(f"[RECV] 12:00:00 [ActionEnterShopPhase] {shortname(0)}<U>=='Some Player'==0123 Health:40 "
+                     f"Gold:3 NextLevelXP:3 --> {shortname(1)}   =='Other'==4567  Round:{round_num} Gold:3\n")
+        lines += [card_line(log_parser.EVENT_UPDATECARD, 0, slot, 'Shop') for slot in range(5)]
+        lines += ["[RECV] 12:00:02 [ActionRoll]\n", "[RECV] 12:00:02 [ActionPlayFX] SomeFX\n"] * 10
+        lines.append(f"[RECV] 12:00:03 [ActionEnterBrawlPhase] {shortname(0)}<U>=='Some Player'==0123 Health:40 "
+                     f"Gold:3 NextLevelXP:3 --> {shortname(1)}   =='Other'==4567 Health:30\n")
+        for player in (0, 1):
+            lines += [card_line(log_parser.EVENT_CREATECARD, player, slot) for slot in range(7)]
+            lines += [card_line(log_parser.EVENT_CREATECARD, player, slot, 'Treasure') for slot in range(3)]
+        lines += ["[RECV] 12:00:04 [ActionAttack] a b\n", "[RECV] 12:00:04 [ActionDealDamage] a b 3\n"] * 20
+        lines.append("[RECV] 12:00:05 [ActionUpdateTurnTimer] 30\n")
+        lines += ["Some unity noise that is not an event\n"] * 5
+    lines += [player_line(log_parser.EVENT_ENTERRESULTSPHASE, player, player == 0, ' Rank:+25')
+              for player in range(8)]
+    return lines
+
+
+def synthetic_log(num_lines):
+    lines = []
+    game = 0
+    while len(lines) < num_lines:
+        lines += synthetic_match(game)
+        game += 1
+    return lines[:num_lines]
+
+
+def time_it(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark the Player.log tokenizer')
+    ap.add_argument('--log', type=str, help='A Player.log to benchmark against (defaults to a synthetic log)')
+    ap.add_argument('--lines', type=int, default=200000, help='Number of synthetic lines to generate')
+    ap.add_argument('--repeat', type=int, default=3, help='Number of timing runs, the best is reported')
+    args = ap.parse_args()
+
+    if args.log:
+        with open(args.log, 'r', encoding='utf-8', errors='replace') as ifs:
+            lines = ifs.readlines()
+    else:
+        random.seed(0)
+        lines = synthetic_log(args.lines)
+
+    legacy_lines = list(legacy_event_lines(lines))
+    current_lines = list(current_event_lines(lines))
+    mismatches = 0
+    for legacy_line, (line, pos) in zip(legacy_lines, current_lines):
+        try:
+            expected = legacy_action_fields(legacy_process_line(legacy_line))
+        except Exception:
+            continue  # the legacy tokenizer could not handle this line either
+        actual = log_parser.process_line(line, pos)
+        if not matches(actual, expected):
+            mismatches += 1
+            if mismatches <= 5:
+                sys.stderr.write(f'Mismatch on {line!r}\n  legacy:  {expected}\n  current: {actual}\n')
+
+    def run_legacy():
+        for legacy_line in legacy_lines:
+            try:
+                legacy_action_fields(legacy_process_line(legacy_line))
+            except Exception:
+                pass
+
+    def run_current():
+        for line, pos in current_lines:
+            try:
+                log_parser.process_line(line, pos)
+            except Exception:
+                pass
+
+    legacy_time = time_it(run_legacy, args.repeat)
+    current_time = time_it(run_current, args.repeat)
+    print(f'{len(lines)} lines, {len(current_lines)} events, {mismatches} mismatches')
+    print(f'legacy:  {len(current_lines) / legacy_time:12,.0f} events/s')
+    print(f'current: {len(current_lines) / current_time:12,.0f} events/s ({legacy_time / current_time:.2f}x)')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Throughput benchmark and cross-check for the record file decoders.
+
+Decodes a corpus of record files (real ones from --dir, otherwise synthetic ones from record_corpus.py) with the
+previous decoder, a construct Select that tries every action struct in turn, and with the current one, checks that
+both give the same actions and reports actions per second.
+
+Usage: python scripts/benchmark_record_parser.py [--dir RECORD_DIR] [--matches 20] [--repeat 3]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from construct import GreedyRange, Select
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from record_corpus import synthetic_match  # noqa: E402
+from sbbtracker.parsers import record_parser  # noqa: E402
+
+#  The action structs in the order the old Select tried them
+LEGACY_ORDER = [
+    "ATTACK", "ADD_PLAYER", "BRAWL_COMPLETE", "CAST_SPELL", "CONNECTION_INFO", "CREATE_CARD", "DEAL_DAMAGE", "DEATH",
+    "EMOTE", "ENTER_BRAWL_PHASE", "ENTER_INTRO_PHASE", "ENTER_RESULTS_PHASE", "ENTER_SHOP_PHASE", "MODIFY_GOLD",
+    "MODIFY_LEVEL", "MODIFY_NEXT_LEVEL_XP", "MODIFY_XP", "MOVE_CARD", "PLAY_FX", "PRESENT_DISCOVER",
+    "PRESENT_HERO_DISCOVER", "REMOVE_CARD", "ROLL", "UPDATE_CARD", "UPDATE_EMOTES", "UPDATE_TURN_TIMER",
+]
+LEGACY_STRUCT_ACTION = Select(*[getattr(record_parser, f"STRUCT_ACTION_{name}") for name in LEGACY_ORDER])
+
+
+def legacy_decode(data):
+    return GreedyRange(LEGACY_STRUCT_ACTION).parse(data)
+
+
+def current_decode(data):
+    return GreedyRange(record_parser.STRUCT_ACTION).parse(data)
+
+
+def load_corpus(args):
+    if args.dir:
+        return [path.read_bytes() for path in sorted(Path(args.dir).glob("record_*.txt"))]
+    random.seed(args.seed)
+    return [synthetic_match(args.rounds) for _ in range(args.matches)]
+
+
+def time_it(func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in corpus:
+            func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the record file decoders")
+    ap.add_argument("--dir", type=str, help="A folder of record_*.txt files (defaults to a synthetic corpus)")
+    ap.add_argument("--matches", type=int, default=20, help="Number of synthetic matches")
+    ap.add_argument("--rounds", type=int, default=12, help="Rounds per synthetic match")
+    ap.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic corpus")
+    ap.add_argument("--repeat", type=int, default=3, help="Number of timing runs, the best is reported")
+    args = ap.parse_args()
+
+    corpus = load_corpus(args)
+    mismatches = 0
+    num_actions = 0
+    for index, data in enumerate(corpus):
+        expected = legacy_decode(data)
+        actual = current_decode(data)
+        num_actions += len(actual)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                sys.stderr.write(f"Mismatch in file {index}: {len(expected)} legacy actions, {len(actual)} current\n")
+
+    legacy_time = time_it(legacy_decode, corpus, args.repeat)
+    current_time = time_it(current_decode, corpus, args.repeat)
+    print(f"{len(corpus)} files, {num_actions} actions, {mismatches} mismatched files")
+    print(f"legacy:  {num_actions / legacy_time:12,.0f} actions/s")
+    print(f"current: {num_actions / current_time:12,.0f} actions/s ({legacy_time / current_time:.2f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
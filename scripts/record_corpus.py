@@ -0,0 +1,235 @@
+"""
+Generates synthetic record_*.txt contents for benchmarking and cross-checking the record decoders.
+
+Each match is a connection info, eight players, a number of rounds of shop and brawl actions and the end of game
+results, with every action type in record_parser appearing along the way.
+
+Usage: python scripts/record_corpus.py OUTPUT_DIR [--matches 20] [--rounds 12]
+"""
+import argparse
+import random
+import struct
+import sys
+from pathlib import Path
+
+
+def u8(value):
+    return struct.pack("<B", value)
+
+
+def u16(value):
+    return struct.pack("<H", value)
+
+
+def u32(value):
+    return struct.pack("<I", value)
+
+
+def i32(value):
+    return struct.pack("<i", value)
+
+
+def u64(value):
+    return struct.pack("<Q", value)
+
+
+def string(value):
+    encoded = value.encode("utf_16_le")
+    return u32(len(encoded) // 2) + encoded
+
+
+def guid():
+    return bytes(random.getrandbits(8) for _ in range(16))
+
+
+def header(action_id, timestamp):
+    return u16(action_id) + u64(timestamp)
+
+
+SUBTYPES = [0, 1, 2, 4, 6, 7, 8, 9, 0xA, 0xB, 0xF, 0x10, 0x11, 0x12, 0x13]
+KEYWORDS = [3, 5, 6, 7, 9]
+
+
+def unit(player_id, zone=None, slot=None, card_id=None):
+    card_id = card_id or guid()
+    zone = random.randint(0, 6) if zone is None else zone
+    valid_targets = b"\x01" if random.random() < 0.7 else \
+        b"\x00" + u32(2) + guid() + guid()
+    subtypes = random.sample(SUBTYPES, random.randint(0, 3))
+    keywords = random.sample(KEYWORDS, random.randint(0, 2))
+    return (card_id + u32(random.randint(1, 900)) + b"\x00" +
+            bytes(random.randint(0, 1) for _ in range(6)) + u8(zone) +
+            i32(random.randint(-1, 6) if slot is None else slot) + u32(random.randint(0, 7)) +
+            u32(random.randint(0, 60)) + u32(random.randint(0, 60)) + i32(random.randint(-1, 5)) +
+            i32(random.randint(0, 10)) + b"\x00" +
+            u32(len(subtypes)) + b"".join(u16(s) for s in subtypes) + b"\x00" +
+            u32(len(keywords)) + b"".join(u16(k) for k in keywords) + valid_targets + card_id +
+            string(f"SBB_CHARACTER_{random.randint(1, 400)}") + string(player_id) +
+            string("" if random.random() < 0.8 else "Golden"))
+
+
+def list_unit(player_id, zone, slot):
+    return b"\x01" if random.random() < 0.3 else b"\x00" + unit(player_id, zone, slot)
+
+
+def player_block(player_id, name, health, place):
+    return (u32(health) + u32(random.randint(0, 20)) + u32(random.randint(0, 2)) + u32(3) +
+            u32(random.randint(2, 6)) + u32(place) + string(player_id) + string(name) + b"\x00" + guid() +
+            u32(random.randint(1, 80)))
+
+
+def add_player(ts, player_id, name, health, place):
+    return header(0x02, ts) + player_block(player_id, name, health, place)
+
+
+def connection_info(ts, session_id):
+    return header(0x01, ts) + string(session_id) + string(f"build-{random.randint(1, 999)}") + \
+        string("10.0.0.1:7777")
+
+
+def present_hero_discover(ts, player_id):
+    heroes = b""
+    for _ in range(4):
+        heroes += u8(0) + unit(player_id, 4, 0) + b"\x00" + u32(1) + b"\x00" + string("Gems") + u32(3)
+    return header(0x04, ts) + string("Choose a hero") + u32(4) + heroes
+
+
+def present_discover(ts, player_id):
+    treasures = b"".join(list_unit(player_id, 3, slot) for slot in range(3))
+    return header(0x03, ts) + string("Choose a treasure") + u32(random.randint(2, 6)) + u32(3) + treasures
+
+
+def modify(ts, action_id, player_id):
+    return header(action_id, ts) + string(player_id) + i32(random.randint(-3, 10))
+
+
+def update_emotes(ts, player_id):
+    emotes = ["Hello", "Thanks", "Oops"]
+    return header(0x09, ts) + string(player_id) + u32(len(emotes)) + b"".join(string(e) for e in emotes)
+
+
+def enter_shop_phase(ts, player_id, name, opponent_id, round_num):
+    return (header(0x12, ts) + u32(random.randint(1, 40)) + bytes(20) + string(player_id) + string(name) + b"\x00" +
+            guid() + u32(random.randint(1, 80)) + string(opponent_id) + u32(round_num) + u32(random.randint(3, 12)))
+
+
+def enter_brawl_phase(ts, player_1, name_1, player_2, name_2):
+    def side(player_id, name):
+        return b"\x00" + u32(random.randint(1, 40)) + bytes(20) + string(player_id) + string(name)
+    return (header(0x1A, ts) + side(player_1, name_1) + b"\x00" + guid() + u32(random.randint(1, 80)) +
+            side(player_2, name_2) + b"\x00" + guid() + u32(random.randint(1, 80)) +
+            string(player_1) + string(player_2))
+
+
+def enter_results_phase(ts, player_id, name, place):
+    characters = b"".join(list_unit(player_id, 1, slot) for slot in range(7))
+    treasures = b"".join(list_unit(player_id, 3, slot) for slot in range(3))
+    return (header(0x13, ts) + player_block(player_id, name, 0 if place > 1 else 12, place) + u32(place) +
+            u32(random.randint(0, 50)) + i32(random.randint(-150, 150)) + u32(random.randint(0, 5)) + u32(0) + u32(0) +
+            u32(7) + characters + u32(3) + treasures)
+
+
+def turn_timer(ts):
+    return header(0x18, ts) + u32(random.randint(0, 90)) + u8(random.randint(0, 1)) + struct.pack("<f", 42.5)
+
+
+def play_fx(ts, targets):
+    return header(0x17, ts) + guid() + string("FX_Hit") + b"\x00" + u32(len(targets)) + b"".join(targets)
+
+
+def synthetic_match(rounds=12, seed=None):
+    """ The contents of one record file """
+    if seed is not None:
+        random.seed(seed)
+    ts = 637800000000000000 + random.randint(0, 10 ** 12)
+
+    def tick():
+        nonlocal ts
+        ts += random.randint(10 ** 4, 10 ** 6)
+        return ts
+
+    players = [f"{random.randint(10 ** 7, 10 ** 8 - 1):x}" for _ in range(8)]
+    names = [f"Player {i}" for i in range(8)]
+    me = players[0]
+    out = [connection_info(tick(), f"session-{random.getrandbits(64):016x}")]
+    out.append(present_hero_discover(tick(), me))
+    out.append(header(0x11, tick()))
+    for place, (player_id, name) in enumerate(zip(players, names), 1):
+        out.append(add_player(tick(), player_id, name, 40, place))
+    for round_num in range(1, rounds + 1):
+        out.append(enter_shop_phase(tick(), me, names[0], players[round_num % 7 + 1], round_num))
+        out.append(turn_timer(tick()))
+        out.append(update_emotes(tick(), me))
+        for _ in range(random.randint(2, 5)):
+            out.append(header(0x0A, tick()))
+            for slot in range(5):
+                out.append(header(0x0B, tick()) + unit(me, 6, slot))
+            card_id = guid()
+            out.append(header(0x0D, tick()) + card_id + u8(1) + u32(random.randint(0, 6)))
+            out.append(header(0x15, tick()) + unit(me, 1, random.randint(0, 6), card_id))
+            out.append(header(0x0C, tick()) + guid())
+            out.append(modify(tick(), 0x05, me))
+        out.append(modify(tick(), 0x06, me))
+        out.append(modify(tick(), 0x07, me))
+        out.append(modify(tick(), 0x08, me))
+        if round_num % 3 == 0:
+            out.append(present_discover(tick(), me))
+        out.append(header(0x0E, tick()) + guid() + guid())
+        for first in range(0, 8, 2):
+            out.append(enter_brawl_phase(tick(), players[first], names[first], players[first + 1], names[first + 1]))
+            ids = []
+            for player_id in (players[first], players[first + 1]):
+                for slot in range(7):
+                    card_id = guid()
+                    ids.append(card_id)
+                    out.append(header(0x0B, tick()) + unit(player_id, 1, slot, card_id))
+                for slot in range(3):
+                    out.append(header(0x0B, tick()) + unit(player_id, 3, slot))
+                out.append(header(0x0B, tick()) + unit(player_id, 4, 0))
+            for _ in range(random.randint(5, 15)):
+                attacker, defender = random.sample(ids, 2)
+                out.append(header(0x1C, tick()) + attacker + defender + b"\x00")
+                out.append(header(0x1D, tick()) + defender + attacker + u32(random.randint(1, 30)))
+                out.append(play_fx(tick(), random.sample(ids, random.randint(0, 3))))
+                if random.random() < 0.4:
+                    out.append(header(0x1B, tick()) + defender)
+            out.append(header(0x21, tick()) + b"\x00" + u32(round_num) + string(players[first]) +
+                       string(players[first + 1]))
+        if random.random() < 0.2:
+            out.append(header(0x19, tick()) + string(random.choice(players)) + string("Hello"))
+        for place, (player_id, name) in enumerate(zip(players, names), 1):
+            out.append(add_player(tick(), player_id, name, max(40 - round_num * 3 - place, 0), place))
+    place = random.randint(1, 8)
+    out.append(enter_results_phase(tick(), me, names[0], place))
+    for other_place, (player_id, name) in enumerate(zip(players, names), 1):
+        out.append(add_player(tick(), player_id, name, 0 if other_place > 1 else 10,
+                              place if player_id == me else other_place))
+    return b"".join(out)
+
+
+def write_corpus(directory, matches=20, rounds=12, seed=0):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    random.seed(seed)
+    filenames = []
+    for index in range(matches):
+        filename = directory.joinpath(f"record_{index:04d}.txt")
+        filename.write_bytes(synthetic_match(rounds))
+        filenames.append(filename)
+    return filenames
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic record files")
+    ap.add_argument("output", help="Directory to write the record files to")
+    ap.add_argument("--matches", type=int, default=20, help="Number of record files")
+    ap.add_argument("--rounds", type=int, default=12, help="Rounds per match")
+    ap.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = ap.parse_args()
+    filenames = write_corpus(args.output, args.matches, args.rounds, args.seed)
+    print(f"wrote {len(filenames)} record files to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
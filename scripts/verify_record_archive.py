@@ -0,0 +1,93 @@
+"""
+Round trips a corpus of record files through record_archive and checks every table comes back as it was written.
+
+Exports the corpus (real record files from --dir, otherwise synthetic ones from record_corpus.py) to an .npz archive
+and, when pyarrow is installed, to a Parquet one, loads each back with load_archive, and checks the columns against the
+ArchiveBuilder's: numbers exactly, strings as categoricals on the archive's whole string table. The two archives must
+load to the same DataFrames, dtypes and categories included.
+
+Usage: python scripts/verify_record_archive.py [--dir RECORD_DIR] [--matches 5]
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from record_corpus import synthetic_match  # noqa: E402
+from sbbtracker.parsers import record_archive  # noqa: E402
+
+
+def check(tables, files, builder, label):
+    """ The loaded tables hold what the builder wrote, returns the number of failures """
+    failures = 0
+    if files != builder.files:
+        sys.stderr.write(f"{label}: the file list differs\n")
+        failures += 1
+    if set(tables) != set(builder.tables):
+        sys.stderr.write(f"{label}: tables {sorted(set(tables) ^ set(builder.tables))} differ\n")
+        return failures + 1
+    strings = builder.string_table()
+    for name, table in builder.tables.items():
+        loaded = tables[name]
+        for column, expected in table.arrays().items():
+            actual = loaded[column]
+            if table.kinds[column] is str:
+                ok = isinstance(actual.dtype, pd.CategoricalDtype) and \
+                    list(actual.cat.categories) == list(strings) and np.array_equal(actual.cat.codes, expected)
+            else:
+                ok = actual.dtype == expected.dtype and np.array_equal(actual.values, expected, equal_nan=True)
+            if not ok:
+                sys.stderr.write(f"{label}: {name}/{column} differs\n")
+                failures += 1
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check record archives load back as they were written")
+    ap.add_argument("--dir", type=str, help="A folder of record_*.txt files (defaults to a synthetic corpus)")
+    ap.add_argument("--matches", type=int, default=5, help="Number of synthetic matches")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        if args.dir:
+            filenames = sorted(Path(args.dir).glob("record_*.txt"))
+        else:
+            filenames = []
+            for index in range(args.matches):
+                filenames.append(directory.joinpath(f"record_{index:04d}.txt"))
+                filenames[-1].write_bytes(synthetic_match(seed=index))
+
+        failures = 0
+        npz = directory.joinpath("archive.npz")
+        builder = record_archive.export_archive(filenames, npz, "npz")
+        npz_tables, files = record_archive.load_archive(npz)
+        failures += check(npz_tables, files, builder, "npz")
+        print(f"npz: {len(builder.tables)} tables, {sum(t.rows for t in builder.tables.values())} rows")
+
+        if record_archive.have_pyarrow():
+            parquet = directory.joinpath("archive")
+            record_archive.export_archive(filenames, parquet, "parquet")
+            parquet_tables, files = record_archive.load_archive(parquet)
+            failures += check(parquet_tables, files, builder, "parquet")
+            for name, table in npz_tables.items():
+                try:
+                    pd.testing.assert_frame_equal(table, parquet_tables[name][table.columns])
+                except AssertionError as e:
+                    sys.stderr.write(f"{name}: the npz and parquet archives differ\n{e}\n")
+                    failures += 1
+            print(f"parquet: {len(parquet_tables)} tables")
+        else:
+            print("pyarrow isn't installed, skipped the Parquet archive")
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
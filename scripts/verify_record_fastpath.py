@@ -0,0 +1,164 @@
+"""
+Checks the hand written record decoders in record_parser against the construct structs they stand in for.
+
+Decodes a corpus of record files (real ones from --dir, otherwise synthetic ones from record_corpus.py) with
+STRUCT_ACTION, which uses the fast decoders, with STRUCT_ACTION_REFERENCE, which only uses the structs, and with
+RecordReader, which decodes from a memory map with lazy strings, and checks every action comes out the same. With
+--fuzz, truncated and corrupted copies of the files are checked as well, which must stop decoding at the same place.
+Skipping every action of the (uncorrupted) files must end in the same place too.
+
+Usage: python scripts/verify_record_fastpath.py [--dir RECORD_DIR] [--matches 10] [--fuzz 200]
+"""
+import argparse
+import io
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from construct import GreedyRange
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from record_corpus import synthetic_match  # noqa: E402
+from sbbtracker.parsers import record_parser  # noqa: E402
+
+
+def decode(struct_action, data):
+    stream = io.BytesIO(data)
+    actions = GreedyRange(struct_action).parse_stream(stream)
+    return actions, len(stream.read())
+
+
+def read(data):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = Path(directory).joinpath("record_0000.txt")
+        filename.write_bytes(data)
+        reader = record_parser.RecordReader(filename)
+        actions = list(reader)
+        remaining = reader.remaining
+        #  read every field so the strings are decoded, and drop the map before the file is removed
+        actions = [resolve(action) for action in actions]
+        del reader
+    return actions, remaining
+
+
+def check_skip(data, label):
+    """ Skipping every action steps over the same bytes as decoding them with the structs """
+    expected, expected_remaining = decode(record_parser.STRUCT_ACTION_REFERENCE, data)
+    buffer = memoryview(data)
+    offset = 0
+    for index in range(len(expected)):
+        offset = record_parser.skip_action(buffer, offset)
+    if len(data) - offset != expected_remaining:
+        sys.stderr.write(f"{label}: skipping left {len(data) - offset} bytes, decoding left {expected_remaining}\n")
+        return False
+    return True
+
+
+def resolve(obj):
+    if isinstance(obj, record_parser.LazyContainer):
+        return record_parser.Container((key, resolve(value)) for key, value in obj.items())
+    if isinstance(obj, dict):
+        return type(obj)((key, resolve(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return type(obj)(resolve(item) for item in obj)
+    return obj
+
+
+def same(expected, actual):
+    """ Equal, with the same field order and the same types (enum strings, list containers...) all the way down """
+    if type(expected) is not type(actual):
+        return False
+    if isinstance(expected, dict):
+        keys = [key for key in expected if not key.startswith("_")]
+        return keys == [key for key in actual if not key.startswith("_")] and \
+            all(same(expected[key], actual[key]) for key in keys)
+    if isinstance(expected, list):
+        return len(expected) == len(actual) and all(same(e, a) for e, a in zip(expected, actual))
+    return expected == actual
+
+
+def check(data, label):
+    expected, expected_remaining = decode(record_parser.STRUCT_ACTION_REFERENCE, data)
+    decoded = [("fast", decode(record_parser.STRUCT_ACTION, data))]
+    try:
+        decoded.append(("reader", read(data)))
+    except UnicodeDecodeError:
+        #  the reader decodes strings when they're read, so a corrupted one raises then instead of ending the file
+        pass
+    for name, (actual, actual_remaining) in decoded:
+        if expected_remaining != actual_remaining or len(expected) != len(actual):
+            sys.stderr.write(f"{label}: reference decoded {len(expected)} actions leaving {expected_remaining} bytes, "
+                             f"{name} decoded {len(actual)} leaving {actual_remaining}\n")
+            return False
+        for index, (e, a) in enumerate(zip(expected, actual)):
+            if not same(e, a):
+                sys.stderr.write(f"{label}: action {index} differs\n  reference: {e}\n  {name}: {a}\n")
+                return False
+    return True
+
+
+def mutations(data, count):
+    for _ in range(count):
+        mutated = bytearray(data)
+        if random.random() < 0.5:
+            del mutated[random.randrange(len(mutated)):]
+        else:
+            for _ in range(random.randint(1, 4)):
+                mutated[random.randrange(len(mutated))] = random.getrandbits(8)
+        yield bytes(mutated)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check the fast record decoders against the construct structs")
+    ap.add_argument("--dir", type=str, help="A folder of record_*.txt files (defaults to a synthetic corpus)")
+    ap.add_argument("--matches", type=int, default=10, help="Number of synthetic matches")
+    ap.add_argument("--rounds", type=int, default=12, help="Rounds per synthetic match")
+    ap.add_argument("--fuzz", type=int, default=0, help="Number of truncated or corrupted files to check")
+    ap.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = ap.parse_args()
+
+    random.seed(args.seed)
+    if args.dir:
+        corpus = [path.read_bytes() for path in sorted(Path(args.dir).glob("record_*.txt"))]
+    else:
+        corpus = [synthetic_match(args.rounds) for _ in range(args.matches)]
+
+    failures = 0
+    counts = Counter()
+    for index, data in enumerate(corpus):
+        failures += not check(data, f"file {index}")
+        failures += not check_skip(data, f"file {index}")
+        actions, _ = decode(record_parser.STRUCT_ACTION, data)
+        counts.update(action.action_id for action in actions)
+    fuzzed = 0
+    for index, data in enumerate(mutations(b"".join(corpus[:3]), args.fuzz)):
+        failures += not check(data, f"fuzzed file {index}")
+        fuzzed += 1
+
+    fast = sum(count for action_id, count in counts.items() if action_id in record_parser.fast_decoders)
+    print(f"{len(corpus)} files, {sum(counts.values())} actions ({fast} with a fast decoder), {fuzzed} fuzzed files")
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = []
+        for index, data in enumerate(corpus):
+            filenames.append(Path(directory).joinpath(f"record_{index:04d}.txt"))
+            filenames[-1].write_bytes(data)
+        for name, func in [("reference", lambda f: decode(record_parser.STRUCT_ACTION_REFERENCE, f.read_bytes())),
+                           ("fast", lambda f: decode(record_parser.STRUCT_ACTION, f.read_bytes())),
+                           ("reader", lambda f: list(record_parser.RecordReader(f)))]:
+            start = time.perf_counter()
+            for filename in filenames:
+                func(filename)
+            elapsed = time.perf_counter() - start
+            print(f"{name:10} {sum(counts.values()) / elapsed:12,.0f} actions/s")
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""
+Point the SBBTracker folders at a scratch home before sbbtracker.paths is imported, so the tests never touch the real
+stats, and make the scripts importable for their helpers.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_home = Path(tempfile.mkdtemp(prefix="sbbtracker-tests-"))
+_home.joinpath("Documents").mkdir()
+_home.joinpath("AppData", "Roaming").mkdir(parents=True)
+_home.joinpath("AppData", "Local").mkdir(parents=True)
+os.environ["HOME"] = str(_home)
+os.environ["USERPROFILE"] = str(_home)
+os.environ["APPDATA"] = str(_home.joinpath("AppData", "Roaming"))
+os.environ["LOCALAPPDATA"] = str(_home.joinpath("AppData", "Local"))
+
+sys.path.insert(0, str(Path(__file__).parents[1].joinpath("scripts")))
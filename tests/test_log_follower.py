@@ -0,0 +1,67 @@
+from sbbtracker.parsers import log_follower
+from sbbtracker.parsers.log_follower import LogFollower, StatWatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_stat_watcher_backs_off_while_idle(tmp_path, monkeypatch):
+    log = tmp_path.joinpath("Player.log")
+    log.write_text("")
+    clock = FakeClock()
+    monkeypatch.setattr(log_follower.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(log_follower.time, "sleep", clock.sleep)
+
+    watcher = StatWatcher(log, poll_interval=0.125, max_poll_interval=0.5)
+    assert not watcher.wait(2)
+    assert clock.sleeps == [0.125, 0.25, 0.5, 0.5, 0.5, 0.125]
+    assert watcher.interval == 0.5
+
+    log.write_text("[RECV] line\n")
+    assert watcher.wait(2)
+    assert watcher.interval == 0.125
+
+
+def test_deleting_the_offset_file_rereads_the_log(tmp_path):
+    log = tmp_path.joinpath("Player.log")
+    log.write_text("one\ntwo\n")
+    offset_file = tmp_path.joinpath("logfile.offset")
+    offset_file.touch()
+
+    follower = LogFollower(log, offset_file)
+    #  nothing was checkpointed, so there is no saved offset to go by
+    assert list(follower.lines()) == ["one\n", "two\n"]
+    assert list(follower.lines()) == []
+
+    offset_file.unlink()
+    assert list(follower.lines()) == ["one\n", "two\n"]
+    assert follower.start == 0
+    follower.close()
+
+
+def test_checkpoint_is_picked_up_after_a_restart(tmp_path):
+    log = tmp_path.joinpath("Player.log")
+    log.write_text("one\ntwo\n")
+    offset_file = tmp_path.joinpath("logfile.offset")
+
+    follower = LogFollower(log, offset_file)
+    lines = follower.lines()
+    assert next(lines) == "one\n"
+    follower.checkpoint({"round": 1})
+    assert list(lines) == ["two\n"]
+    follower.close()
+
+    follower = LogFollower(log, offset_file)
+    assert follower.resume() == {"round": 1}
+    assert list(follower.lines()) == ["two\n"]
+    follower.close()
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+from sbbtracker.parsers import log_parser
+from sbbtracker.parsers.log_follower import LogFollower
+from sbbtracker.parsers.replay import compare, dump_updates, read_lines, replay
+
+DATA = Path(__file__).parent.joinpath("data")
+
+
+def fixture_lines():
+    return read_lines(DATA.joinpath("Player.log"))
+
+
+def test_replay_matches_the_golden_updates():
+    #  after a deliberate change to the updates, regenerate the golden file with
+    #  python -m sbbtracker.parsers.replay tests/data/Player.log -o tests/data/Player.updates.jsonl
+    assert compare(dump_updates(replay(fixture_lines())), DATA.joinpath("Player.updates.jsonl")) == 0
+
+
+def boards(updates):
+    return [line for line, update in zip(dump_updates(updates), updates) if update.job == log_parser.JOB_BOARDINFO]
+
+
+def test_boards_do_not_depend_on_the_subscription():
+    lines = fixture_lines()
+    unsubscribed = boards(replay(lines))
+    subscribed = boards(replay(lines, [log_parser.EVENT_UPDATECARD]))
+    assert len(unsubscribed) == 2
+    assert unsubscribed == subscribed
+
+
+def test_brawl_boards_take_in_brawl_card_updates():
+    updates = replay(fixture_lines())
+    last = [update for update in updates if update.job == log_parser.JOB_BOARDINFO][-1]
+    cupid, = last.state["Player0000"]
+    assert (cupid.content_id, cupid.cardattack, cupid.cardhealth) == ("Cupid", 9, 10)
+    assert [card.content_id for card in last.state["Player0001"]] == ["LordyLocks"]
+
+
+def test_coalesce_keeps_card_updates_for_each_player():
+    updates = [update for update in replay(fixture_lines(), [log_parser.EVENT_UPDATECARD])
+               if update.job == log_parser.JOB_CARDUPDATE]
+    shop = log_parser.coalesce(updates[:5])
+    assert len(shop) == 1
+    cards = [(card.playerid, card.slot, card.content_id) for card in shop[0].state]
+    assert cards == [("Player0000", "1", "GreedyGoblin"), ("Player0000", "2", "LordyLocks"),
+                     ("Player0000", "0", "Wombats"), ("Player0001", "0", "Wombats")]
+
+
+def test_restart_mid_game_reads_the_game_from_its_start(tmp_path):
+    game = fixture_lines()
+    next_game = [line.replace("session-fixture", "session-next") for line in game[:12]]
+    log = tmp_path.joinpath("Player.log")
+    log.write_text("".join(game + next_game), encoding="utf-8")
+    offset_file = tmp_path.joinpath("logfile.offset")
+    subscription = log_parser.registry.subscribe(log_parser.STATE_MACHINE_EVENTS, boundaries=True)
+
+    follower = LogFollower(log, offset_file)
+    log_parser.LogStateMachine().feed(log_parser.parse(follower.lines(), subscription), follower.checkpoint)
+    follower.close()
+
+    follower = LogFollower(log, offset_file)
+    machine = log_parser.LogStateMachine()
+    machine.load_state(follower.resume())
+    updates = machine.feed(log_parser.parse(follower.lines(), subscription), follower.checkpoint)
+    follower.close()
+    new_games = [update.state.session_id for update in updates if update.job == log_parser.JOB_NEWGAME]
+    assert new_games == ["session-next"]
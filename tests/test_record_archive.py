@@ -0,0 +1,49 @@
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import verify_record_archive as verify
+import verify_record_fastpath
+from record_corpus import synthetic_match
+from sbbtracker.parsers import record_archive, record_parser
+
+
+@pytest.fixture(scope="module")
+def record_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("records")
+    filenames = []
+    for index in range(3):
+        filenames.append(directory.joinpath(f"record_{index:04d}.txt"))
+        filenames[-1].write_bytes(synthetic_match(rounds=2, seed=index))
+    return filenames
+
+
+def test_archive_has_a_row_for_every_action(record_files, tmp_path):
+    builder = record_archive.export_archive(record_files, tmp_path.joinpath("archive.npz"), "npz")
+    expected = Counter()
+    for filename in record_files:
+        actions, remaining = verify_record_fastpath.decode(record_parser.STRUCT_ACTION_REFERENCE,
+                                                           filename.read_bytes())
+        assert remaining == 0
+        expected.update(record_parser.id_to_action_name[action.action_id] for action in actions)
+    assert {name: table.rows for name, table in builder.tables.items()} == dict(expected)
+
+
+def test_npz_archive_round_trips(record_files, tmp_path):
+    archive = tmp_path.joinpath("archive.npz")
+    builder = record_archive.export_archive(record_files, archive, "npz")
+    tables, files = record_archive.load_archive(archive)
+    assert verify.check(tables, files, builder, "npz") == 0
+    assert files == [str(filename) for filename in record_files]
+
+
+def test_parquet_archive_loads_like_the_npz_one(record_files, tmp_path):
+    pytest.importorskip("pyarrow")
+    builder = record_archive.export_archive(record_files, tmp_path.joinpath("archive"), "parquet")
+    parquet_tables, files = record_archive.load_archive(tmp_path.joinpath("archive"))
+    assert verify.check(parquet_tables, files, builder, "parquet") == 0
+    record_archive.export_archive(record_files, tmp_path.joinpath("archive.npz"), "npz")
+    npz_tables, _ = record_archive.load_archive(tmp_path.joinpath("archive.npz"))
+    for name, table in npz_tables.items():
+        pd.testing.assert_frame_equal(table, parquet_tables[name][table.columns])
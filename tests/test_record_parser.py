@@ -0,0 +1,91 @@
+import logging
+import random
+
+import pytest
+
+import verify_record_fastpath as verify
+from record_corpus import synthetic_match
+from sbbtracker.parsers import record_parser
+
+
+def preamble(transport_version):
+    return f"ClientVersion:[1.0]|TransportVersion:[{transport_version}]|CardDatabaseVersion:[1]\n".encode()
+
+
+@pytest.fixture
+def formats(monkeypatch):
+    monkeypatch.setattr(record_parser, "record_formats", {})
+    monkeypatch.setattr(record_parser, "unregistered_versions", set())
+
+
+def test_registered_format_is_selected(formats, tmp_path):
+    dummy = record_parser.register_format(["dummy-1", "dummy-2"], record_parser.action_structs)
+    assert record_parser.get_format("dummy-2") is dummy
+
+    filename = tmp_path.joinpath("record_0000.txt")
+    filename.write_bytes(preamble("dummy-1") + synthetic_match(rounds=1, seed=1))
+    reader = record_parser.RecordReader(filename)
+    assert reader.transport_version == "dummy-1"
+    assert reader.record_format is dummy
+    assert len(list(reader)) > 0
+    assert reader.remaining == 0
+
+
+def test_unregistered_format_warns_once(formats, caplog):
+    with caplog.at_level(logging.WARNING, logger=record_parser.__name__):
+        assert record_parser.get_format("unknown-1") is record_parser.CURRENT_FORMAT
+        assert record_parser.get_format("unknown-1") is record_parser.CURRENT_FORMAT
+        assert record_parser.get_format(None) is record_parser.CURRENT_FORMAT
+    assert [record.getMessage().count("unknown-1") for record in caplog.records] == [1]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    random.seed(0)
+    return [synthetic_match(rounds=3) for _ in range(3)]
+
+
+def assert_same_actions(expected, actual):
+    (expected_actions, expected_remaining), (actual_actions, actual_remaining) = expected, actual
+    assert actual_remaining == expected_remaining
+    assert len(actual_actions) == len(expected_actions)
+    for index, (e, a) in enumerate(zip(expected_actions, actual_actions)):
+        assert verify.same(e, a), f"action {index} differs\n  expected: {e}\n  actual: {a}"
+
+
+def test_fast_decoders_match_the_structs(corpus):
+    for data in corpus:
+        expected = verify.decode(record_parser.STRUCT_ACTION_REFERENCE, data)
+        assert expected[1] == 0
+        assert_same_actions(expected, verify.decode(record_parser.STRUCT_ACTION, data))
+
+
+def test_fast_decoders_stop_where_the_structs_do_on_corrupted_files():
+    #  seeding the match seeds the mutations that follow it too
+    match = synthetic_match(rounds=1, seed=12)
+    for data in verify.mutations(match, 50):
+        expected = verify.decode(record_parser.STRUCT_ACTION_REFERENCE, data)
+        assert_same_actions(expected, verify.decode(record_parser.STRUCT_ACTION, data))
+
+
+def test_reader_matches_the_structs(corpus):
+    for data in corpus:
+        expected = verify.decode(record_parser.STRUCT_ACTION_REFERENCE, data)
+        assert_same_actions(expected, verify.read(data))
+
+
+def test_skipping_steps_over_the_same_bytes(corpus):
+    for data in corpus:
+        assert verify.check_skip(data, "synthetic match")
+
+
+def test_reader_stops_where_the_structs_do_on_corrupted_files():
+    match = synthetic_match(rounds=1, seed=13)
+    for data in verify.mutations(match, 50):
+        expected = verify.decode(record_parser.STRUCT_ACTION_REFERENCE, data)
+        try:
+            actual = verify.read(data)
+        except UnicodeDecodeError:
+            #  a corrupted string raises when the reader decodes it, rather than ending the file
+            continue
+        assert_same_actions(expected, actual)
@@ -0,0 +1,126 @@
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from sbbtracker import stats
+from sbbtracker.utils import asset_utils
+
+
+def fake_extract(filename):
+    """ The record files of these tests just hold the session id of their match """
+    session_id = filename.read_text()
+    return "Gwen", "Gwen", 1, 25, session_id, datetime(2022, 1, 2)
+
+
+@pytest.fixture
+def player_stats(tmp_path, monkeypatch):
+    sbb_root = tmp_path.joinpath("Storybook Brawl")
+    sbb_root.mkdir()
+    monkeypatch.setattr(stats.paths, "sbb_root", sbb_root)
+    monkeypatch.setattr(stats.MatchStore.__init__, "__defaults__", (tmp_path.joinpath("stats.db"),))
+    monkeypatch.setattr(stats.ImportManifest.__init__, "__defaults__", (tmp_path.joinpath("import_manifest.json"),))
+    #  threads rather than processes, so the extraction can be faked
+    monkeypatch.setattr(stats, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(stats, "extract_endgame_stats_from_record_file", fake_extract)
+    player_stats = stats.PlayerStats()
+    yield player_stats
+    player_stats.store.close()
+
+
+def write_records(count):
+    for index in range(count):
+        stats.paths.sbb_root.joinpath(f"record_{index:04d}.txt").write_text(f"session-{index}")
+
+
+def session_ids(player_stats):
+    return sorted(player_stats.df["SessionId"])
+
+
+def test_cancelled_import_keeps_the_matches_extracted_so_far(player_stats):
+    write_records(4)
+    progress = []
+
+    def cancel(num, totalsize):
+        progress.append(num)
+        return True
+
+    assert player_stats.import_matches(cancel, max_workers=1) == 1
+    assert progress == [0]
+    #  the files that were never extracted are picked up by the next import
+    assert player_stats.import_matches(max_workers=1) == 3
+    assert session_ids(player_stats) == [f"session-{index}" for index in range(4)]
+
+
+def test_deleted_matches_are_only_brought_back_by_a_reimport(player_stats):
+    write_records(3)
+    assert player_stats.import_matches(max_workers=1) == 3
+    player_stats.delete_entry(list(player_stats.df["SessionId"]).index("session-1"))
+    assert player_stats.import_matches(max_workers=1) == 0
+
+    #  even once the file has changed and is read again
+    stats.paths.sbb_root.joinpath("record_0001.txt").write_text("session-1")
+    os.utime(stats.paths.sbb_root.joinpath("record_0001.txt"), ns=(0, 0))
+    assert player_stats.import_matches(max_workers=1) == 0
+    assert session_ids(player_stats) == ["session-0", "session-2"]
+
+    assert player_stats.import_matches(max_workers=1, reimport=True) == 1
+    assert session_ids(player_stats) == ["session-0", "session-1", "session-2"]
+    assert stats.ImportManifest().deleted == set()
+
+
+def test_manifest_without_deletions_still_loads(tmp_path):
+    filename = tmp_path.joinpath("import_manifest.json")
+    entry = {"size": 10, "mtime": 20, "result": "session-0"}
+    filename.write_text(json.dumps({"/records/record_0000.txt": entry}))
+    manifest = stats.ImportManifest(filename)
+    assert manifest.entries == {"/records/record_0000.txt": entry}
+    assert manifest.deleted == set()
+
+    manifest.deleted.add("session-0")
+    manifest.save()
+    manifest = stats.ImportManifest(filename)
+    assert manifest.entries == {"/records/record_0000.txt": entry}
+    assert manifest.deleted == {"session-0"}
+
+
+def matches_frame(rows):
+    return pd.DataFrame(rows, columns=stats.stats_columns)
+
+
+def random_match(index):
+    heroes = [hero["Name"] for hero in asset_utils.hero_list[:12]] + ["Not A Hero"]
+    day = f"2022-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}"
+    return [random.choice(heroes), random.choice(heroes), random.randint(1, 8), day, random.choice([-30, 12, 7]),
+            f"session-{index}"]
+
+
+def test_aggregates_match_the_stats_of_the_matches_in_range():
+    random.seed(25)
+    rows = [random_match(index) for index in range(300)]
+    aggregates = stats.HeroAggregates(matches_frame(rows[:200]))
+    #  new days and heroes as well as ones already seen
+    for row in rows[200:]:
+        aggregates.add(*row[:5])
+    for row in rows[150:180]:
+        aggregates.remove(*row[:5])
+    kept = matches_frame(rows[:150] + rows[180:])
+    for start, end in [(None, None), ("2022-03-01", "2022-06-15"), ("2022-06-15", "2022-06-15"),
+                       ("2023-01-01", "2023-02-01")]:
+        in_range = kept if start is None else kept[(kept["Timestamp"] >= start) & (kept["Timestamp"] <= end)]
+        for hero_type in stats.hero_columns:
+            assert aggregates.hero_stats(hero_type, start, end) == stats.hero_stats(in_range, hero_type)
+
+
+def test_adding_a_match_only_changes_its_day():
+    aggregates = stats.HeroAggregates(matches_frame([["Gwen", "Gwen", 1, "2022-01-02", 25, "session-0"]]))
+    aggregates.add("Gwen", "Gwen", 2, "2022-01-03", 10)
+    counts = aggregates.index[1]
+    aggregates.add("Gwen", "Gwen", 3, "2022-01-02", -5)
+    assert aggregates.index[1] is counts
+    assert aggregates.totals("StartingHero")["Gwen"].matches == 3
+    assert aggregates.totals("StartingHero", "2022-01-02", "2022-01-02")["Gwen"].mmr == 20